@@ -1,6 +1,9 @@
+# Imported first, so that boot timings start before Flask and the services are loaded
+from app.services import startup
 from flask import Flask, jsonify
 from flask_cors import CORS
 import os
+import threading
 from dotenv import load_dotenv
 import logging
 
@@ -18,6 +21,10 @@ def create_app(test_config=None):
     # Create and configure the app
     app = Flask(__name__, instance_relative_config=True)
     
+    # Time spent serializing JSON responses is reported in the metrics
+    from app.services.metrics import TimedJSONProvider
+    app.json = TimedJSONProvider(app)
+    
     # Enable CORS for all routes
     CORS(app)
     
@@ -43,10 +50,26 @@ def create_app(test_config=None):
     from app.routes.youtube_routes import youtube_bp
     app.register_blueprint(youtube_bp)
 
+    # Command line tools
+    from app.cli import mappings_cli
+    app.cli.add_command(mappings_cli)
+
+    # Import yt-dlp, build pooled instances and warm connections and caches without delaying startup
+    if os.environ.get('YTUNE_WARM_UP', '1') == '1' and test_config is None:
+        from app.services.youtube_service import YouTubeService
+        startup.expect('warm_up')
+        threading.Thread(target=YouTubeService.warm_up, name='ydl-warm-up', daemon=True).start()
+
     # Health check endpoint
     @app.route('/ping')
     def ping():
         return jsonify({'status': 'ok'})
+
+    # Readiness endpoint; 503 until the local part of the warm-up has finished
+    @app.route('/ready')
+    def ready():
+        status = startup.status()
+        return jsonify(status), 200 if status['ready'] else 503
         
     # Error handlers
     @app.errorhandler(404)
@@ -58,4 +81,5 @@ def create_app(test_config=None):
         logger.error(f"Server error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+    startup.mark('app')
     return app
\ No newline at end of file
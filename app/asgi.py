@@ -0,0 +1,298 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from app import create_app
+from app.routes.youtube_routes import check_video_ref, error_status, parse_format_hints, parse_song_info_fields
+from app.services import deadline, metrics, startup
+from app.services.cache import CACHE_BACKEND
+from app.services.youtube_service import YouTubeService
+
+logger = logging.getLogger(__name__)
+
+# Threads running blocking yt-dlp and search calls for the async handlers
+ASGI_EXECUTOR_WORKERS = int(os.environ.get('YTUNE_ASGI_EXECUTOR_WORKERS', 16))
+# Threads running requests passed through to the Flask application
+ASGI_WSGI_THREADS = int(os.environ.get('YTUNE_ASGI_WSGI_THREADS', 32))
+# Largest accepted JSON request body, in bytes
+MAX_BODY_SIZE = 64 * 1024
+
+_SONG_INFO_RE = re.compile(r'^/api/song-info/([^/]+)$')
+
+
+class YTuneASGI:
+    """
+    ASGI application serving the YouTube endpoints asynchronously.
+
+    Search, resolve, stream URL and song info requests are handled as coroutines: the
+    blocking service calls run on a bounded thread pool, so a waiting request
+    costs a coroutine rather than a server thread. All other requests are
+    passed to the Flask application.
+    """
+
+    def __init__(self, flask_app, max_workers=ASGI_EXECUTOR_WORKERS):
+        """
+        Args:
+            flask_app (flask.Flask): Application handling all other routes
+            max_workers (int): Threads available for blocking service calls
+        """
+        self.flask_app = flask_app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='asgi-blocking')
+        self.wsgi_executor = ThreadPoolExecutor(max_workers=ASGI_WSGI_THREADS, thread_name_prefix='asgi-wsgi')
+        self.wsgi = _ThreadPoolWsgiToAsgi(flask_app, self.wsgi_executor)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        if scope['type'] == 'http':
+            handler = self._route(scope['method'], scope['path'])
+            if handler:
+                budget = deadline.parse_budget(_header(scope, deadline.DEADLINE_HEADER))
+                token = deadline.start(budget)
+                started = time.perf_counter()
+                metrics.request_started()
+                try:
+                    await handler(scope, receive, send)
+                except RequestTooLarge:
+                    await _send_json(send, {"error": f"Request body exceeds {MAX_BODY_SIZE} bytes"}, 413)
+                finally:
+                    metrics.request_finished()
+                    startup.record_request(time.perf_counter() - started)
+                    deadline.reset(token)
+                return
+
+        await self.wsgi(scope, receive, send)
+
+    def _route(self, method, path):
+        if method == 'POST' and path == '/api/search-song':
+            return self.search_song
+        if method == 'POST' and path == '/api/resolve-song':
+            return self.resolve_song
+        if method == 'POST' and path == '/api/get-stream-url':
+            return self.get_stream_url
+        if method == 'GET' and _SONG_INFO_RE.match(path):
+            return self.song_info
+        return None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.wsgi_executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _run_blocking(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        # Run in a copy of our context so the request deadline reaches the service
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(self.executor, functools.partial(context.run, fn, *args))
+        try:
+            return await asyncio.wait_for(future, timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            # The thread finishes on its own (and fills the caches); the client is answered now
+            return {"error": deadline.DEADLINE_ERROR}
+
+    async def search_song(self, scope, receive, send):
+        data = await _read_json(receive)
+        title = data.get('title')
+        artist = data.get('artist')
+
+        if not title or not artist:
+            await _send_json(send, {"error": "Both title and artist are required"}, 400)
+            return
+
+        result = await self._run_blocking(YouTubeService.search_song, title, artist, data.get('duration'))
+        await _send_result(send, result)
+
+    async def resolve_song(self, scope, receive, send):
+        data = await _read_json(receive)
+        title = data.get('title')
+        artist = data.get('artist')
+
+        if not title or not artist:
+            await _send_json(send, {"error": "Both title and artist are required"}, 400)
+            return
+
+        fields, unknown = parse_song_info_fields(data.get('fields'))
+        if unknown:
+            await _send_json(send, {"error": f"Unknown fields: {', '.join(unknown)}"}, 400)
+            return
+
+        hints, error = parse_format_hints(data, _header(scope, 'save-data'))
+        if error:
+            await _send_json(send, {"error": error}, 400)
+            return
+
+        result = await self._run_blocking(YouTubeService.resolve_song, title, artist, data.get('duration'),
+                                          fields, hints)
+        await _send_result(send, result)
+
+    async def get_stream_url(self, scope, receive, send):
+        data = await _read_json(receive)
+        video_id = data.get('video_id')
+        youtube_url = data.get('youtube_url')
+        song_name = data.get('song_name')
+
+        error = check_video_ref(data)
+        if error:
+            await _send_json(send, {"error": error}, 400)
+            return
+
+        hints, error = parse_format_hints(data, _header(scope, 'save-data'))
+        if error:
+            await _send_json(send, {"error": error}, 400)
+            return
+
+        if video_id or youtube_url:
+            result = None
+            if CACHE_BACKEND == 'memory':
+                # In-memory cache hits are answered without a thread hop; SQLite lookups can block on the
+                # database lock, so with that backend the whole lookup runs on the executor
+                result = YouTubeService.get_cached_stream_url(video_id=video_id, youtube_url=youtube_url,
+                                                              hints=hints)
+            if result is None:
+                result = await self._run_blocking(YouTubeService.get_stream_url, video_id, youtube_url, hints)
+        elif song_name:
+            # Free-text lookup kept for older clients
+            result = await self._run_blocking(YouTubeService.search_stream_url, song_name)
+        else:
+            await _send_json(send, {"error": "Either video_id or youtube_url must be provided"}, 400)
+            return
+
+        await _send_result(send, result)
+
+    async def song_info(self, scope, receive, send):
+        video_id = _SONG_INFO_RE.match(scope['path']).group(1)
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        fields, unknown = parse_song_info_fields(query.get('fields', [''])[0])
+        if unknown:
+            await _send_json(send, {"error": f"Unknown fields: {', '.join(unknown)}"}, 400)
+            return
+
+        result = await self._run_blocking(YouTubeService.get_song_info, video_id, fields)
+        await _send_result(send, result)
+
+
+class _ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    """
+    WsgiToAsgi running each request on a thread pool.
+
+    asgiref runs WSGI applications thread-sensitively, on a single thread shared
+    by all requests, so one slow Flask request (a batch lookup, a proxied audio
+    stream) would hold up every other route behind it.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        """
+        Args:
+            wsgi_application (callable): The WSGI application
+            executor (concurrent.futures.Executor): Threads running the requests
+        """
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        await _ThreadPoolWsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+
+class _ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+    """A WsgiToAsgiInstance whose run_wsgi_app runs on the given executor."""
+
+    # The plain function behind asgiref's thread-sensitive sync_to_async wrapper
+    _run_wsgi_app = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        run = sync_to_async(self._run_wsgi_app, thread_sensitive=False, executor=self.executor)
+        await run(body)
+
+
+class RequestTooLarge(Exception):
+    """Raised when a request body exceeds MAX_BODY_SIZE."""
+
+
+def _header(scope, name):
+    """Return the value of a request header, or None."""
+    key = name.lower().encode('latin-1')
+    for header, value in scope.get('headers') or []:
+        if header == key:
+            return value.decode('latin-1')
+    return None
+
+
+async def _read_json(receive):
+    """
+    Read the request body and decode it as a JSON object; invalid bodies yield {}.
+
+    Raises:
+        RequestTooLarge: If the body exceeds MAX_BODY_SIZE
+    """
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if len(body) > MAX_BODY_SIZE:
+            raise RequestTooLarge()
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def _send_result(send, result):
+    """Send a service result, mapping error payloads to status codes like the Flask routes."""
+    status = error_status(result["error"]) if "error" in result else 200
+    await _send_json(send, result, status)
+
+
+async def _send_json(send, payload, status=200):
+    with metrics.timed('json_serialization'):
+        body = (json.dumps(payload, sort_keys=True) + '\n').encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            # Same policy as Flask-CORS's default for the Flask routes
+            (b'access-control-allow-origin', b'*'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def create_asgi_app(test_config=None):
+    """
+    Create the ASGI application.
+
+    Args:
+        test_config (dict, optional): Passed to create_app
+
+    Returns:
+        YTuneASGI: The ASGI application
+    """
+    return YTuneASGI(create_app(test_config))
@@ -0,0 +1,39 @@
+import os
+
+import click
+from flask.cli import AppGroup
+
+from app.services.mapping_store import MappingStore, MAPPING_STORE_PATH
+
+mappings_cli = AppGroup('mappings', help='Import and export song-to-video mappings.')
+
+
+def _format_for(path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if os.path.splitext(path)[1].lower() == '.csv' else 'jsonl'
+
+
+@mappings_cli.command('export')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']), help='Defaults to the file extension.')
+@click.option('--db', default=MAPPING_STORE_PATH, show_default=True, help='Mapping store database.')
+def export_mappings(path, fmt, db):
+    """Export all mappings to PATH."""
+    store = MappingStore(db)
+    with open(path, 'w', encoding='utf-8', newline='') as fp:
+        count = store.export_mappings(fp, _format_for(path, fmt))
+    click.echo(f"Exported {count} mappings to {path}")
+
+
+@mappings_cli.command('import')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']), help='Defaults to the file extension.')
+@click.option('--db', default=MAPPING_STORE_PATH, show_default=True, help='Mapping store database.')
+@click.option('--score', default=100.0, show_default=True, help='Score for records without one.')
+def import_mappings(path, fmt, db, score):
+    """Import mappings from PATH (records need title, artist and video_id)."""
+    store = MappingStore(db)
+    with open(path, encoding='utf-8', newline='') as fp:
+        imported, skipped = store.import_mappings(fp, _format_for(path, fmt), default_score=score)
+    click.echo(f"Imported {imported} mappings from {path} ({skipped} skipped)")
@@ -1,35 +1,337 @@
-from flask import Flask, request, jsonify
-from yt_dlp import YoutubeDL
-import traceback
+from flask import Blueprint, Response, g, request, jsonify, stream_with_context
+import json
+import logging
+import time
 
-app = Flask(__name__)
+from app.services import audio_proxy, deadline, metrics, prefetch, startup
+from app.services.cache import CACHE_BACKEND
+from app.services.youtube_service import YouTubeService, BATCH_MAX_ITEMS, SONG_INFO_FIELDS
 
-@app.route('/api/get-stream-url', methods=['POST'])
+logger = logging.getLogger(__name__)
+
+youtube_bp = Blueprint('youtube', __name__)
+
+# Service errors that mean the requested resource does not exist
+NOT_FOUND_ERRORS = (
+    "No videos found for the given song",
+    "No suitable match found",
+    "No audio format found",
+    "No stream URL found",
+    "No audio format matches the accepted codecs",
+)
+
+
+def error_status(error):
+    """Map a service error message to an HTTP status code."""
+    if error in NOT_FOUND_ERRORS:
+        return 404
+    if error == deadline.DEADLINE_ERROR:
+        return 504
+    return 500
+
+
+def _error_response(result):
+    """Turn a service error payload into a JSON response with a matching status code."""
+    return jsonify(result), error_status(result["error"])
+
+
+@youtube_bp.before_request
+def start_deadline():
+    # Everything the request does upstream has to fit in this budget
+    g.deadline_token = deadline.start(deadline.parse_budget(request.headers.get(deadline.DEADLINE_HEADER)))
+    # Scrapes are left out so that they do not show up in the in-flight gauge they report
+    g.counted_in_flight = request.endpoint != 'youtube.prometheus_metrics'
+    if g.counted_in_flight:
+        g.request_started = time.perf_counter()
+        metrics.request_started()
+
+
+@youtube_bp.teardown_request
+def end_deadline(error=None):
+    token = g.pop('deadline_token', None)
+    if token is not None:
+        deadline.reset(token)
+    if g.pop('counted_in_flight', False):
+        metrics.request_finished()
+        elapsed = time.perf_counter() - g.pop('request_started')
+        if request.endpoint != 'youtube.stats':
+            startup.record_request(elapsed)
+
+
+def parse_song_info_fields(raw):
+    """Parse a song info field selection (comma-separated string or list); returns (fields, unknown)."""
+    if isinstance(raw, list):
+        raw = ','.join(str(field) for field in raw)
+    fields = [field.strip() for field in (raw or '').split(',') if field.strip()]
+    unknown = [field for field in fields if field not in SONG_INFO_FIELDS]
+    return fields or None, unknown
+
+
+def parse_format_hints(data, save_data=None):
+    """Parse format selection hints from a request body and its Save-Data header; returns (hints, error)."""
+    codecs = data.get('codecs')
+    if isinstance(codecs, str):
+        codecs = [codec.strip() for codec in codecs.split(',') if codec.strip()]
+    if codecs is not None and (not isinstance(codecs, list) or not all(isinstance(codec, str) for codec in codecs)):
+        return None, "codecs must be a list of codec names"
+
+    max_bitrate = data.get('max_bitrate')
+    if max_bitrate is not None and (isinstance(max_bitrate, bool) or not isinstance(max_bitrate, (int, float))
+                                    or max_bitrate <= 0):
+        return None, "max_bitrate must be a positive number"
+
+    return {
+        "codecs": [codec.lower() for codec in codecs] if codecs else None,
+        "max_bitrate": max_bitrate,
+        "data_saver": bool(data.get('data_saver')) or (save_data or '').strip().lower() == 'on',
+    }, None
+
+
+def check_video_ref(data):
+    """Check that video_id and youtube_url in a request body are strings when given; returns an error or None."""
+    for field in ('video_id', 'youtube_url'):
+        if data.get(field) is not None and not isinstance(data[field], str):
+            return f"{field} must be a string"
+    return None
+
+
+@youtube_bp.route('/api/search-song', methods=['POST'])
+def search_song():
+    data = request.get_json(silent=True) or {}
+    title = data.get('title')
+    artist = data.get('artist')
+
+    if not title or not artist:
+        return jsonify({"error": "Both title and artist are required"}), 400
+
+    result = YouTubeService.search_song(title, artist, data.get('duration'))
+    if "error" in result:
+        return _error_response(result)
+    return jsonify(result)
+
+
+@youtube_bp.route('/api/resolve-song', methods=['POST'])
+def resolve_song():
+    data = request.get_json(silent=True) or {}
+    title = data.get('title')
+    artist = data.get('artist')
+
+    if not title or not artist:
+        return jsonify({"error": "Both title and artist are required"}), 400
+
+    fields, unknown = parse_song_info_fields(data.get('fields'))
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    hints, error = parse_format_hints(data, request.headers.get('Save-Data'))
+    if error:
+        return jsonify({"error": error}), 400
+
+    result = YouTubeService.resolve_song(title, artist, data.get('duration'), fields, hints)
+    if "error" in result:
+        return _error_response(result)
+    return jsonify(result)
+
+
+@youtube_bp.route('/api/get-stream-url', methods=['POST'])
 def get_stream_url():
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
+    video_id = data.get('video_id')
+    youtube_url = data.get('youtube_url')
     song_name = data.get('song_name')
 
-    ydl_opts = {
-        'quiet': True,
-        'format': 'bestaudio[ext=m4a]/bestaudio/best',
-        'default_search': 'ytsearch1',
-        'noplaylist': True,
-        'skip_download': True,
-    }
+    error = check_video_ref(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    hints, error = parse_format_hints(data, request.headers.get('Save-Data'))
+    if error:
+        return jsonify({"error": error}), 400
+
+    if video_id or youtube_url:
+        result = YouTubeService.get_stream_url(video_id=video_id, youtube_url=youtube_url, hints=hints)
+    elif song_name:
+        # Free-text lookup kept for older clients
+        result = YouTubeService.search_stream_url(song_name)
+    else:
+        return jsonify({"error": "Either video_id or youtube_url must be provided"}), 400
+
+    if "error" in result:
+        return _error_response(result)
+    return jsonify(result)
+
+
+@youtube_bp.route('/api/get-stream-urls', methods=['POST'])
+def get_stream_urls():
+    data = request.get_json(silent=True) or {}
+    raw_items = data.get('items') or data.get('video_ids')
+
+    if not isinstance(raw_items, list) or not raw_items:
+        return jsonify({"error": "items must be a non-empty list of video IDs or URLs"}), 400
+    if len(raw_items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {BATCH_MAX_ITEMS} items can be resolved per request"}), 400
+
+    # Items may be plain video IDs/URLs or objects with video_id/youtube_url
+    items = []
+    for index, raw in enumerate(raw_items):
+        if isinstance(raw, dict):
+            error = check_video_ref(raw)
+            if error:
+                return jsonify({"error": f"items[{index}]: {error}"}), 400
+            items.append({"video_id": raw.get('video_id'), "youtube_url": raw.get('youtube_url')})
+        elif isinstance(raw, str) and YouTubeService.extract_video_id(raw) == raw:
+            items.append({"video_id": raw})
+        else:
+            items.append({"youtube_url": raw if isinstance(raw, str) else None})
+
+    timeout = data.get('timeout')
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+        timeout = None
+
+    hints, error = parse_format_hints(data, request.headers.get('Save-Data'))
+    if error:
+        return jsonify({"error": error}), 400
+
+    results = YouTubeService.get_stream_urls(items, timeout, hints)
+
+    def tagged(index, result):
+        return {"index": index, "item": raw_items[index], **result}
+
+    wants_stream = data.get('stream') or 'application/x-ndjson' in request.headers.get('Accept', '')
+    if wants_stream:
+        # One JSON object per line, written as soon as each item is resolved; the request context, and
+        # with it the request deadline and in-flight accounting, lasts until the last line is written
+        lines = (json.dumps(tagged(index, result)) + '\n' for index, result in results)
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+    ordered = [None] * len(items)
+    for index, result in results:
+        ordered[index] = tagged(index, result)
+    failed = sum(1 for result in ordered if "error" in result)
+    return jsonify({"results": ordered, "succeeded": len(ordered) - failed, "failed": failed})
+
+
+@youtube_bp.route('/api/prefetch', methods=['POST'])
+def prefetch_tracks():
+    data = request.get_json(silent=True) or {}
+    raw_items = data.get('items') or data.get('video_ids')
+
+    if not isinstance(raw_items, list) or not raw_items:
+        return jsonify({"error": "items must be a non-empty list of video IDs or songs"}), 400
+    if len(raw_items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {BATCH_MAX_ITEMS} items can be prefetched per request"}), 400
+
+    items = [raw if isinstance(raw, dict) else {"video_id": raw} for raw in raw_items
+             if isinstance(raw, str) or isinstance(raw, dict) and check_video_ref(raw) is None]
+    client_id = request.headers.get('X-Client-Id') or request.remote_addr or 'anonymous'
+    result = prefetch.prefetch(client_id, items, audio=bool(data.get('audio')))
+    result["invalid"] += len(raw_items) - len(items)
+    # Work continues in the background; the response only reports what was queued
+    return jsonify(result), 202
+
+
+@youtube_bp.route('/api/song-info/<video_id>', methods=['GET'])
+def song_info(video_id):
+    fields, unknown = parse_song_info_fields(request.args.get('fields'))
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    result = YouTubeService.get_song_info(video_id, fields)
+    if "error" in result:
+        return _error_response(result)
+    return jsonify(result)
+
+
+@youtube_bp.route('/api/stream/<video_id>', methods=['GET', 'HEAD'])
+def stream_audio(video_id):
+    if YouTubeService.extract_video_id(video_id) != video_id:
+        return jsonify({"error": "Invalid video ID"}), 400
 
     try:
-        with YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(song_name, download=False)
+        stream = audio_proxy.open_stream(video_id, request.headers.get('Range'))
+    except audio_proxy.ProxyError as e:
+        response = jsonify({"error": str(e)})
+        response.headers.update(e.headers)
+        return response, e.status
+
+    if request.method == 'HEAD':
+        stream.close()
+        return Response(status=stream.status, headers=stream.headers)
+
+    # Chunks are passed through as they arrive; nothing is buffered
+    return Response(iter(stream), status=stream.status, headers=stream.headers, direct_passthrough=True)
+
+
+@youtube_bp.route('/api/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        "caches": YouTubeService.cache_stats(),
+        "mappings": YouTubeService.mapping_stats(),
+        "coalescing": YouTubeService.coalescing_stats(),
+        "refresh_ahead": YouTubeService.refresh_stats(),
+        "scheduler": YouTubeService.scheduler_stats(),
+        "hedging": YouTubeService.hedging_stats(),
+        "ydl_pool": YouTubeService.pool_stats(),
+        "player_cache": YouTubeService.player_cache_stats(),
+        "audio_cache": audio_proxy.cache_stats(),
+        "prefetch": prefetch.prefetch_stats(),
+        "startup": startup.status(),
+    })
+
+
+@youtube_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def collect_metrics():
+    """Turn the service statistics of this process into metric samples."""
+    samples = []
+    caches = YouTubeService.cache_stats()
+    audio = audio_proxy.cache_stats()
+    if audio["enabled"]:
+        caches["audio"] = audio
+    for name, stats in caches.items():
+        labels = {"cache": name}
+        samples += [
+            ("ytune_cache_lookups_total", {**labels, "result": "hit"}, stats["hits"]),
+            ("ytune_cache_lookups_total", {**labels, "result": "miss"}, stats["misses"]),
+            ("ytune_cache_evictions_total", labels, stats["evictions"]),
+        ]
+        if "expirations" in stats:
+            samples.append(("ytune_cache_expirations_total", labels, stats["expirations"]))
+        # The SQLite and audio caches are shared by all workers
+        shared = name == "audio" or CACHE_BACKEND == 'sqlite'
+        samples.append(("ytune_cache_entries", labels, stats.get("size", stats.get("chunks")), shared))
+
+    for priority, stats in YouTubeService.scheduler_stats()["classes"].items():
+        samples.append(("ytune_extractions_running", {"priority": priority}, stats["running"]))
+        samples.append(("ytune_extractions_queued", {"priority": priority}, stats["waiting"]))
+
+    for lookup, stats in YouTubeService.coalescing_stats().items():
+        samples.append(("ytune_lookups_in_flight", {"lookup": lookup}, stats["in_flight"]))
+        samples.append(("ytune_lookups_coalesced_total", {"lookup": lookup}, stats["coalesced"]))
+
+    hedging = YouTubeService.hedging_stats()
+    for outcome in ("hedge_won", "primary_won", "both_failed", "denied"):
+        samples.append(("ytune_extractions_hedged_total", {"outcome": outcome}, hedging[outcome]))
+    samples.append(("ytune_extraction_hedge_delay_seconds", {}, hedging["delay"], True))
+
+    mappings = YouTubeService.mapping_stats()
+    if mappings["enabled"]:
+        for result in ("exact", "fuzzy"):
+            samples.append(("ytune_mapping_lookups_total", {"result": result}, mappings[f"{result}_hits"]))
+        samples.append(("ytune_mapping_lookups_total", {"result": "miss"}, mappings["misses"]))
 
-            # if it's a search result list
-            if 'entries' in info:
-                info = info['entries'][0]  # grab first result
+    samples.append(("ytune_prefetch_pending", {}, prefetch.prefetch_stats()["pending"]))
 
-            stream_url = info.get('url')
-            if not stream_url:
-                raise Exception("No stream URL found.")
+    # Boot timings are reported for the slowest worker
+    boot = startup.status()
+    for phase, info in boot["phases"].items():
+        samples.append(("ytune_startup_phase_seconds", {"phase": phase}, info["finished_at"], True))
+    if boot["first_request"]:
+        samples.append(("ytune_first_request_seconds", {}, boot["first_request"]["seconds"], True))
+    return samples
 
-            return jsonify({ "stream_url": stream_url })
 
-    except Exception as e:
-        return jsonify({ "error": f"Error getting stream URL: {str(e)}" }), 500
+metrics.register_collector(collect_metrics)
@@ -0,0 +1,370 @@
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# On-disk cache of proxied audio, shared by all workers on a host
+AUDIO_CACHE_ENABLED = os.environ.get('YTUNE_AUDIO_CACHE', '1') == '1'
+AUDIO_CACHE_DIR = os.environ.get('YTUNE_AUDIO_CACHE_DIR', os.path.join('instance', 'audio-cache'))
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get('YTUNE_AUDIO_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+AUDIO_CHUNK_SIZE = int(os.environ.get('YTUNE_AUDIO_CHUNK_SIZE', 1024 * 1024))
+# "lru" evicts the least recently read chunks, "lfu" the least often read ones
+AUDIO_CACHE_EVICTION = os.environ.get('YTUNE_AUDIO_CACHE_EVICTION', 'lru').lower()
+
+# Bytes returned per read from a cached chunk
+READ_SIZE = 64 * 1024
+
+
+class AudioChunkCache:
+    """
+    Disk cache of audio files, stored as fixed-size chunks.
+
+    Each (video_id, format_id) is split into chunks of chunk_size bytes that
+    are cached independently, so a seek only downloads the chunks it is
+    missing. Chunk files live under a directory derived from a hash of the
+    video and format; an SQLite index next to them records sizes and access
+    statistics and is shared by all workers, which keeps the byte budget
+    global. Cached chunks are read through mmap.
+    """
+
+    # Minimum seconds between access-time updates for a single chunk
+    TOUCH_INTERVAL = 30
+
+    def __init__(self, directory, max_bytes, chunk_size=AUDIO_CHUNK_SIZE, eviction='lru'):
+        """
+        Args:
+            directory (str): Directory holding the chunk files and index
+            max_bytes (int): Total size of cached chunks to stay below
+            chunk_size (int): Bytes per chunk
+            eviction (str): "lru" or "lfu"
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.eviction = eviction if eviction in ('lru', 'lfu') else 'lru'
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._touched = {}
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.directory, 'index.sqlite3'), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "video_id TEXT PRIMARY KEY, "
+                "format_id TEXT NOT NULL, "
+                "total INTEGER NOT NULL, "
+                "content_type TEXT NOT NULL, "
+                "chunk_size INTEGER NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "video_id TEXT NOT NULL, "
+                "format_id TEXT NOT NULL, "
+                "chunk_index INTEGER NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "hits INTEGER NOT NULL DEFAULT 0, "
+                "accessed_at REAL NOT NULL, "
+                "PRIMARY KEY (video_id, format_id, chunk_index))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_lru ON chunks (accessed_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_lfu ON chunks (hits, accessed_at)")
+
+    def _chunk_dir(self, video_id, format_id):
+        digest = hashlib.sha1(f"{video_id}:{format_id}".encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _chunk_path(self, video_id, format_id, index):
+        return os.path.join(self._chunk_dir(video_id, format_id), f"{index}.chunk")
+
+    def lookup(self, video_id):
+        """
+        Get what is known about the cached audio of a video.
+
+        Args:
+            video_id (str): YouTube video ID
+
+        Returns:
+            dict: format_id, total size and content_type, or None if the video is not cached
+        """
+        row = self._connect().execute(
+            "SELECT format_id, total, content_type, chunk_size FROM files WHERE video_id = ?", (video_id,)
+        ).fetchone()
+        if row is None or row[3] != self.chunk_size:
+            return None
+        return {"format_id": row[0], "total": row[1], "content_type": row[2]}
+
+    def register(self, video_id, format_id, total, content_type):
+        """
+        Record the format and size of a video's audio.
+
+        Chunks cached for a different format or size of the video are dropped.
+
+        Args:
+            video_id (str): YouTube video ID
+            format_id (str): yt-dlp format ID of the audio
+            total (int): Size of the audio file in bytes
+            content_type (str): MIME type of the audio
+        """
+        if self.lookup(video_id) == {"format_id": format_id, "total": total, "content_type": content_type}:
+            return
+        self.forget(video_id)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO files (video_id, format_id, total, content_type, chunk_size, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, format_id, total, content_type, self.chunk_size, time.time()),
+            )
+
+    def forget(self, video_id):
+        """
+        Drop the cached audio of a video.
+
+        Args:
+            video_id (str): YouTube video ID
+        """
+        conn = self._connect()
+        with conn:
+            stale = conn.execute(
+                "SELECT format_id, chunk_index FROM chunks WHERE video_id = ?", (video_id,)
+            ).fetchall()
+            conn.execute("DELETE FROM chunks WHERE video_id = ?", (video_id,))
+            conn.execute("DELETE FROM files WHERE video_id = ?", (video_id,))
+        for format_id, index in stale:
+            self._unlink(self._chunk_path(video_id, format_id, index))
+
+    def cached_chunks(self, video_id, format_id):
+        """
+        Get the indexes of the chunks of a file that are on disk.
+
+        Args:
+            video_id (str): YouTube video ID
+            format_id (str): yt-dlp format ID of the audio
+
+        Returns:
+            set: Cached chunk indexes
+        """
+        rows = self._connect().execute(
+            "SELECT chunk_index FROM chunks WHERE video_id = ? AND format_id = ?", (video_id, format_id)
+        ).fetchall()
+        return {index for (index,) in rows}
+
+    def read(self, video_id, format_id, index, start=0, end=None):
+        """
+        Read part of a cached chunk.
+
+        Args:
+            video_id (str): YouTube video ID
+            format_id (str): yt-dlp format ID of the audio
+            index (int): Chunk index
+            start (int): First byte within the chunk
+            end (int, optional): Last byte within the chunk, inclusive
+
+        Returns:
+            generator: Byte strings of the requested range, or None if the chunk is not on disk
+        """
+        try:
+            fp = open(self._chunk_path(video_id, format_id, index), 'rb')
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        self._count('hits')
+        self._touch(video_id, format_id, index)
+        return self._read_mapped(fp, start, end)
+
+    def _read_mapped(self, fp, start, end):
+        # Mapping the file lets the kernel page cache serve popular chunks without extra copies
+        try:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                stop = len(mapped) if end is None else min(end + 1, len(mapped))
+                for offset in range(start, stop, READ_SIZE):
+                    yield mapped[offset:min(offset + READ_SIZE, stop)]
+        finally:
+            fp.close()
+
+    def writer(self, video_id, format_id, index):
+        """
+        Start writing a chunk.
+
+        Args:
+            video_id (str): YouTube video ID
+            format_id (str): yt-dlp format ID of the audio
+            index (int): Chunk index
+
+        Returns:
+            ChunkWriter: Writer to feed the chunk's bytes to and then commit or abort
+        """
+        return ChunkWriter(self, video_id, format_id, index)
+
+    def _store(self, video_id, format_id, index, size):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            # Writing counts as the first use; with no hits, LFU would evict the chunks of a track still playing first
+            conn.execute(
+                "INSERT OR REPLACE INTO chunks (video_id, format_id, chunk_index, size, hits, accessed_at) "
+                "VALUES (?, ?, ?, ?, 1, ?)",
+                (video_id, format_id, index, size, now),
+            )
+        self._count('stores')
+        self._evict(keep=(video_id, format_id, index))
+
+    def _touch(self, video_id, format_id, index):
+        now = time.time()
+        key = (video_id, format_id, index)
+        with self._lock:
+            if now - self._touched.get(key, 0) < self.TOUCH_INTERVAL:
+                return
+            if len(self._touched) > 10000:
+                self._touched.clear()
+            self._touched[key] = now
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "UPDATE chunks SET hits = hits + 1, accessed_at = ? "
+                    "WHERE video_id = ? AND format_id = ? AND chunk_index = ?",
+                    (now, video_id, format_id, index),
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Error updating audio cache access time: {str(e)}")
+
+    def _evict(self, keep=None):
+        """Delete chunks until the cache fits in its byte budget, sparing the chunk keep."""
+        order = "hits, accessed_at" if self.eviction == 'lfu' else "accessed_at"
+        conn = self._connect()
+        with conn:
+            (used,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM chunks").fetchone()
+            if used <= self.max_bytes:
+                return
+            victims = []
+            for video_id, format_id, index, size in conn.execute(
+                f"SELECT video_id, format_id, chunk_index, size FROM chunks ORDER BY {order}"
+            ):
+                if used <= self.max_bytes:
+                    break
+                if (video_id, format_id, index) == keep:
+                    continue
+                victims.append((video_id, format_id, index))
+                used -= size
+            conn.executemany(
+                "DELETE FROM chunks WHERE video_id = ? AND format_id = ? AND chunk_index = ?", victims
+            )
+        for video_id, format_id, index in victims:
+            self._unlink(self._chunk_path(video_id, format_id, index))
+        self._count('evictions', len(victims))
+
+    def _unlink(self, path):
+        # Readers that already opened the file keep reading it after the unlink
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error removing cached audio chunk {path}: {str(e)}")
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Hit/miss counters are per process; sizes are shared by all processes.
+
+        Returns:
+            dict: Size, budget and hit/miss/store/eviction counters
+        """
+        conn = self._connect()
+        (files,) = conn.execute("SELECT COUNT(*) FROM files").fetchone()
+        chunks, used = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM chunks").fetchone()
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "files": files,
+                "chunks": chunks,
+                "bytes": used,
+                "max_bytes": self.max_bytes,
+                "chunk_size": self.chunk_size,
+                "eviction": self.eviction,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+
+class ChunkWriter:
+    """Collects one chunk in a temporary file and publishes it atomically."""
+
+    def __init__(self, cache, video_id, format_id, index):
+        self.cache = cache
+        self.video_id = video_id
+        self.format_id = format_id
+        self.index = index
+        self.size = 0
+        self.path = cache._chunk_path(video_id, format_id, index)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._fp = open(self._tmp_path, 'wb')
+
+    def write(self, data):
+        self._fp.write(data)
+        self.size += len(data)
+
+    def commit(self):
+        """Make the chunk visible to readers and account for it in the byte budget."""
+        self._fp.close()
+        try:
+            os.replace(self._tmp_path, self.path)
+            self.cache._store(self.video_id, self.format_id, self.index, self.size)
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"Error storing audio chunk {self.path}: {str(e)}")
+            self.cache._unlink(self._tmp_path)
+
+    def abort(self):
+        """Discard an incomplete chunk."""
+        self._fp.close()
+        self.cache._unlink(self._tmp_path)
+
+
+def create_audio_cache():
+    """
+    Open the audio cache configured by YTUNE_AUDIO_CACHE_DIR.
+
+    Returns:
+        AudioChunkCache: The cache, or None if it is disabled or cannot be opened
+    """
+    if not AUDIO_CACHE_ENABLED or AUDIO_CACHE_MAX_BYTES <= 0:
+        return None
+    try:
+        return AudioChunkCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES,
+                               chunk_size=AUDIO_CHUNK_SIZE, eviction=AUDIO_CACHE_EVICTION)
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Could not open audio cache {AUDIO_CACHE_DIR}: {str(e)}")
+        return None
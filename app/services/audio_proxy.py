@@ -0,0 +1,427 @@
+import logging
+import os
+import re
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.services import deadline
+from app.services.audio_cache import create_audio_cache
+from app.services.youtube_service import YouTubeService
+
+logger = logging.getLogger(__name__)
+
+# Audio proxy settings
+PROXY_CHUNK_SIZE = int(os.environ.get('YTUNE_PROXY_CHUNK_SIZE', 64 * 1024))
+PROXY_POOL_SIZE = int(os.environ.get('YTUNE_PROXY_POOL_SIZE', 32))
+PROXY_CONNECT_TIMEOUT = float(os.environ.get('YTUNE_PROXY_CONNECT_TIMEOUT', 5))
+PROXY_READ_TIMEOUT = float(os.environ.get('YTUNE_PROXY_READ_TIMEOUT', 20))
+# How often a single response may re-resolve and resume after the upstream failed
+PROXY_MAX_RESUMES = int(os.environ.get('YTUNE_PROXY_MAX_RESUMES', 3))
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_CONTENT_RANGE_RE = re.compile(r'bytes (?:\d+-\d+|\*)/(\d+|\*)')
+
+# googlevideo answers expired or IP-mismatched URLs with these statuses
+_EXPIRED_STATUSES = (403, 410)
+
+
+class ProxyError(Exception):
+    """Raised when audio cannot be proxied; carries the HTTP status to return."""
+
+    def __init__(self, message, status=502, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class FormatGone(ProxyError):
+    """Raised when the format a stream is served in is no longer offered for the video."""
+
+
+def _create_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=PROXY_POOL_SIZE, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+# Shared so upstream keep-alive connections are reused across requests
+_session = _create_session()
+_audio_cache = create_audio_cache()
+
+
+def parse_range(range_header):
+    """
+    Parse a single-range HTTP Range header.
+
+    Args:
+        range_header (str): Header value, e.g. "bytes=100-" or "bytes=-500"
+
+    Returns:
+        tuple: (start, end, suffix_length) with None for absent parts, or None
+        if the header is missing or not a single byte range
+    """
+    match = _RANGE_RE.match((range_header or '').strip())
+    if not match or match.group(0) == 'bytes=-':
+        return None
+    start, end = match.group(1), match.group(2)
+    if not start:
+        return None, None, int(end)
+    if end and int(end) < int(start):
+        return None
+    return int(start), int(end) if end else None, None
+
+
+def _satisfy_range(requested, total):
+    """Turn a parsed Range header into inclusive (start, end) offsets within a file of total bytes."""
+    if requested is None:
+        return 0, total - 1
+    start, end, suffix = requested
+    if suffix is not None:
+        return max(total - suffix, 0), total - 1
+    if start >= total:
+        raise ProxyError("Requested range not satisfiable", 416, {'Content-Range': f"bytes */{total}"})
+    return start, total - 1 if end is None else min(end, total - 1)
+
+
+class AudioStream:
+    """
+    An audio response being served from the chunk cache or proxied from googlevideo.
+
+    Iterating over the stream yields the body in chunks. Byte ranges that are
+    cached on disk are read locally; missing ones are downloaded, passed
+    through and stored as whole chunks. The stream URL is only resolved once
+    a missing range has to be downloaded. If the upstream connection breaks
+    or the URL expires mid-stream, the URL is re-resolved and the download
+    resumes at the current byte offset.
+    """
+
+    def __init__(self, video_id, format_id, start, end, total, content_type, partial,
+                 payload=None, upstream=None, upstream_offset=None):
+        self.video_id = video_id
+        self.format_id = format_id
+        self.start = start
+        self.end = end
+        self.total = total
+        self.content_type = content_type
+        self.partial = partial
+        self.payload = payload
+        self.upstream = upstream
+        self.upstream_offset = upstream_offset
+        # Set once the format is no longer offered, so resuming cannot succeed
+        self.format_gone = False
+
+    @property
+    def status(self):
+        return 206 if self.partial else 200
+
+    @property
+    def headers(self):
+        headers = {
+            'Content-Type': self.content_type,
+            'Content-Length': str(self.end - self.start + 1),
+            'Accept-Ranges': 'bytes',
+            'Cache-Control': 'no-store',
+        }
+        if self.partial:
+            headers['Content-Range'] = f"bytes {self.start}-{self.end}/{self.total}"
+        return headers
+
+    def close(self):
+        if self.upstream is not None:
+            self.upstream.close()
+            self.upstream = None
+
+    def __iter__(self):
+        cache = _audio_cache if self.format_id is not None else None
+        cached = cache.cached_chunks(self.video_id, self.format_id) if cache is not None else set()
+        offset = self.start
+        resumes = 0
+        try:
+            while offset <= self.end:
+                if cache is not None and offset // cache.chunk_size in cached:
+                    index = offset // cache.chunk_size
+                    base = index * cache.chunk_size
+                    reader = cache.read(self.video_id, self.format_id, index, offset - base,
+                                        min(self.end, base + cache.chunk_size - 1) - base)
+                    before = offset
+                    for data in reader or ():
+                        offset += len(data)
+                        yield data
+                    if offset > before:
+                        continue
+                    # Evicted or truncated since the chunk list was read
+                    cached.discard(index)
+
+                offset, failed = yield from self._fetch(offset, cache, cached)
+                if failed:
+                    if self.format_gone or resumes >= PROXY_MAX_RESUMES:
+                        logger.error(f"Giving up streaming {self.video_id} at byte {offset}")
+                        return
+                    resumes += 1
+        finally:
+            self.close()
+
+    def _fetch(self, offset, cache, cached):
+        """
+        Download from offset up to the next cached chunk, passing the client's bytes through.
+
+        With a cache, downloads start at a chunk boundary so that every
+        completed chunk can be stored.
+
+        Returns:
+            tuple: (offset, failed) with the client offset reached and whether the download broke off
+        """
+        if cache is not None:
+            size = cache.chunk_size
+            position = offset - offset % size
+            last = self.end // size
+            stop = next((index for index in range(offset // size + 1, last + 1) if index in cached), last + 1)
+            fetch_end = min(stop * size, self.total) - 1
+        else:
+            size = None
+            position = offset
+            fetch_end = self.end
+
+        upstream = self._upstream_at(position, fetch_end)
+        if upstream is None:
+            return offset, True
+
+        writer = None
+        try:
+            for data in upstream.iter_content(PROXY_CHUNK_SIZE):
+                while data:
+                    if cache is not None:
+                        index, within = divmod(position, size)
+                        if within == 0:
+                            if position > fetch_end:
+                                return offset, False
+                            writer = cache.writer(self.video_id, self.format_id, index)
+                        piece, data = data[:size - within], data[size - within:]
+                    else:
+                        piece, data = data, b''
+
+                    # Forward the part of the piece the client asked for
+                    lower, upper = offset - position, self.end + 1 - position
+                    if lower < len(piece) and upper > lower:
+                        sent = piece[lower:upper]
+                        offset += len(sent)
+                        yield sent
+
+                    position += len(piece)
+                    if writer is not None:
+                        writer.write(piece)
+                        if position % size == 0 or position >= self.total:
+                            writer.commit()
+                            cached.add(index)
+                            writer = None
+                    if position > fetch_end:
+                        return offset, False
+            logger.warning(f"Upstream stream for {self.video_id} ended early at byte {position}")
+            return offset, True
+        except (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            logger.warning(f"Upstream stream for {self.video_id} broke at byte {position}: {str(e)}")
+            return offset, True
+        finally:
+            if writer is not None:
+                writer.abort()
+            self.close()
+
+    def _upstream_at(self, position, end):
+        """Return an upstream response starting at position, or None if none can be opened."""
+        if self.upstream is not None and self.upstream_offset == position:
+            return self.upstream
+        self.close()
+        try:
+            if self.payload is None:
+                self.payload = _resolve(self.video_id, self.format_id)
+            response = _open_upstream(self.video_id, self.payload, position, end)
+        except FormatGone as e:
+            self.format_gone = True
+            logger.error(f"Could not open upstream for {self.video_id} at byte {position}: {str(e)}")
+            return None
+        except (requests.RequestException, ProxyError) as e:
+            logger.error(f"Could not open upstream for {self.video_id} at byte {position}: {str(e)}")
+            return None
+        if response.status_code != 206:
+            response.close()
+            logger.error(f"Could not open upstream for {self.video_id} at byte {position}: "
+                         f"upstream status {response.status_code}")
+            return None
+        self.upstream = response
+        return response
+
+
+def _resolve(video_id, format_id=None):
+    """Resolve the stream URL of a video, checking it still points at the cached format."""
+    payload = YouTubeService.get_stream_url(video_id)
+    if "error" in payload:
+        status = {"No audio format found": 404, deadline.DEADLINE_ERROR: 504}.get(payload["error"], 502)
+        raise ProxyError(payload["error"], status)
+    if format_id is None or payload.get('format_id') == format_id:
+        return payload
+    # Another format is selected now; keep serving the one the stream started with if it is still listed
+    pinned = _with_format(payload, format_id)
+    if pinned is None:
+        # The cached chunks belong to a format that is no longer available
+        if _audio_cache is not None:
+            _audio_cache.forget(video_id)
+        raise FormatGone("Audio format changed since it was cached", 502)
+    return pinned
+
+
+def _with_format(payload, format_id):
+    """Return a copy of a stream payload pointing at another of its formats, or None if it is not listed."""
+    for candidate in payload.get('formats') or ():
+        if candidate.get('format_id') == format_id and candidate.get('url'):
+            return {
+                **payload,
+                "stream_url": candidate['url'],
+                "format": candidate.get('format'),
+                "bitrate": candidate.get('abr') or 0,
+                "format_id": format_id,
+            }
+    return None
+
+
+def _request(url, start, end):
+    byte_range = f"bytes={start}-{end if end is not None else ''}"
+    # Opening the stream counts against the request deadline; reading the body does not
+    return _session.get(url, headers={'Range': byte_range}, stream=True,
+                        timeout=(deadline.timeout(PROXY_CONNECT_TIMEOUT), PROXY_READ_TIMEOUT))
+
+
+def _open_upstream(video_id, payload, start, end):
+    """Request a byte range, re-resolving the stream URL once if it has expired."""
+    response = _request(payload['stream_url'], start, end)
+    if response.status_code in _EXPIRED_STATUSES:
+        response.close()
+        refreshed = YouTubeService.refresh_stream_url(video_id)
+        if "error" in refreshed:
+            raise ProxyError(refreshed["error"], 502)
+        if refreshed.get('format_id') != payload.get('format_id'):
+            refreshed = _with_format(refreshed, payload.get('format_id'))
+            if refreshed is None:
+                raise FormatGone("Audio format changed while re-resolving the stream", 502)
+        payload.update(refreshed)
+        response = _request(payload['stream_url'], start, end)
+    return response
+
+
+def open_stream(video_id, range_header=None):
+    """
+    Start serving the audio of a video.
+
+    Audio whose requested range starts in a cached chunk is served without
+    resolving the stream URL.
+
+    Args:
+        video_id (str): YouTube video ID
+        range_header (str, optional): The client's Range header
+
+    Returns:
+        AudioStream: Stream with status, headers and an iterable body
+
+    Raises:
+        ProxyError: If the audio cannot be served
+    """
+    requested = parse_range(range_header)
+    partial = requested is not None
+
+    known = _audio_cache.lookup(video_id) if _audio_cache is not None else None
+    if known is not None:
+        start, end = _satisfy_range(requested, known['total'])
+        if start // _audio_cache.chunk_size in _audio_cache.cached_chunks(video_id, known['format_id']):
+            return AudioStream(video_id, known['format_id'], start, end, known['total'],
+                               known['content_type'], partial)
+
+    payload = _resolve(video_id)
+    if known is not None and known['format_id'] != payload.get('format_id'):
+        # Range requests continue a file the client already has part of; stay on its format
+        payload = _with_format(payload, known['format_id']) or payload
+    format_id = payload.get('format_id')
+    if known is not None and known['format_id'] == format_id:
+        return AudioStream(video_id, format_id, start, end, known['total'], known['content_type'],
+                           partial, payload=payload)
+
+    if requested and requested[2] is not None:
+        # Suffix ranges need the total size first; fetch it with a one-byte probe and serve the tail as an
+        # absolute range, so that it is read from and stored in the chunk cache like any other range
+        probe = _open_checked(video_id, payload, 0, 0)
+        probe.close()
+        total = _total_size(probe)
+        content_type = probe.headers.get('Content-Type', 'application/octet-stream')
+        if _audio_cache is not None and format_id is not None:
+            _audio_cache.register(video_id, format_id, total, content_type)
+        start, end = _satisfy_range(requested, total)
+        return AudioStream(video_id, format_id, start, end, total, content_type, partial, payload=payload)
+
+    if requested:
+        fetch_start, fetch_end = requested[0], requested[1]
+    else:
+        fetch_start, fetch_end = 0, None
+    if _audio_cache is not None and format_id is not None:
+        # Download whole chunks so that they can be cached
+        size = _audio_cache.chunk_size
+        fetch_start -= fetch_start % size
+        if fetch_end is not None:
+            fetch_end += size - 1 - fetch_end % size
+    upstream = _open_checked(video_id, payload, fetch_start, fetch_end)
+
+    total = _total_size(upstream)
+    content_type = upstream.headers.get('Content-Type', 'application/octet-stream')
+    if _audio_cache is not None and format_id is not None:
+        _audio_cache.register(video_id, format_id, total, content_type)
+
+    try:
+        start, end = _satisfy_range(requested, total)
+    except ProxyError:
+        upstream.close()
+        raise
+    return AudioStream(video_id, format_id, start, end, total, content_type, partial,
+                       payload=payload, upstream=upstream, upstream_offset=fetch_start)
+
+
+def _open_checked(video_id, payload, start, end):
+    """Open an upstream byte range, raising ProxyError unless it starts at start and reports the total size."""
+    try:
+        upstream = _open_upstream(video_id, payload, start, end)
+    except requests.RequestException as e:
+        raise ProxyError(f"Error contacting upstream: {str(e)}", 502)
+
+    total = _total_size(upstream)
+    if upstream.status_code == 416:
+        upstream.close()
+        raise ProxyError("Requested range not satisfiable", 416,
+                         {'Content-Range': f"bytes */{total if total is not None else '*'}"})
+    if upstream.status_code not in (200, 206) or (upstream.status_code == 200 and start):
+        upstream.close()
+        raise ProxyError(f"Upstream returned status {upstream.status_code}", 502)
+    if total is None:
+        upstream.close()
+        raise ProxyError("Upstream did not report the audio size", 502)
+    return upstream
+
+
+def _total_size(response):
+    match = _CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+    if match and match.group(1) != '*':
+        return int(match.group(1))
+    if response.status_code == 200 and response.headers.get('Content-Length'):
+        return int(response.headers['Content-Length'])
+    return None
+
+
+def cache_stats():
+    """
+    Get audio chunk cache statistics.
+
+    Returns:
+        dict: Cache counters, or {"enabled": False} if the cache is off
+    """
+    if _audio_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **_audio_cache.stats()}
@@ -0,0 +1,396 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Cache backend selection: "memory" (per process) or "sqlite" (shared by all workers on a host)
+CACHE_BACKEND = os.environ.get('YTUNE_CACHE_BACKEND', 'memory').lower()
+CACHE_PATH = os.environ.get('YTUNE_CACHE_PATH', os.path.join('instance', 'ytune-cache.sqlite3'))
+CACHE_VACUUM_INTERVAL = int(os.environ.get('YTUNE_CACHE_VACUUM_INTERVAL', 300))
+
+
+class MemoryCache:
+    """Thread-safe, size-bounded LRU cache with a per-entry time-to-live."""
+
+    def __init__(self, max_entries=512):
+        """
+        Args:
+            max_entries (int): Maximum number of live entries kept in memory
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None if missing or expired.
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            object: The cached value or None
+        """
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def get_entry(self, key):
+        """
+        Return the cached value for key together with its lifetime.
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            tuple: (value, created_at, expires_at) as UNIX timestamps, or None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry[2] <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            # Mark as most recently used
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, value, ttl):
+        """
+        Store a value for ttl seconds, evicting the least recently used
+        entries if the cache is full.
+
+        Args:
+            key (str): Cache key
+            value (object): Value to store
+            ttl (float): Lifetime in seconds; non-positive values are ignored
+        """
+        if ttl <= 0:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (value, now, now + ttl)
+            self._entries.move_to_end(key)
+
+            if len(self._entries) > self.max_entries:
+                self._purge_expired(now)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Remove key from the cache if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Returns:
+            dict: Size, capacity and hit/miss/eviction counters
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _purge_expired(self, now):
+        # Drop expired entries before falling back to LRU eviction
+        expired = [key for key, (_, _, expires_at) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+            self.expirations += 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCache:
+    """
+    Cache stored in a SQLite database in WAL mode.
+
+    All gunicorn workers on a host share the same database file, so an entry
+    resolved by one worker is visible to the others and survives restarts.
+    Several caches can live in one file, separated by namespace.
+    """
+
+    # Minimum seconds between access-time updates for a single entry
+    TOUCH_INTERVAL = 30
+
+    _vacuum_threads = {}
+    _vacuum_lock = threading.Lock()
+
+    def __init__(self, path, namespace, max_entries=512, vacuum_interval=300):
+        """
+        Args:
+            path (str): Path to the SQLite database file
+            namespace (str): Namespace separating this cache from others in the file
+            max_entries (int): Maximum number of entries kept for this namespace
+            vacuum_interval (int): Seconds between background cleanup runs
+        """
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+        self._start_vacuum(path, vacuum_interval)
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = _open_sqlite(self.path)
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT NOT NULL, "
+                "key TEXT NOT NULL, "
+                "value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "expires_at REAL NOT NULL, "
+                "accessed_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (namespace, accessed_at)")
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None if missing or expired.
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            object: The cached value or None
+        """
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def get_entry(self, key):
+        """
+        Return the cached value for key together with its lifetime.
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            tuple: (value, created_at, expires_at) as UNIX timestamps, or None
+        """
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, created_at, expires_at, accessed_at FROM cache WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+
+        if row is None:
+            self._count('misses')
+            return None
+
+        value, created_at, expires_at, accessed_at = row
+        if expires_at <= now:
+            with conn:
+                conn.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND key = ? AND expires_at <= ?",
+                    (self.namespace, key, now),
+                )
+            self._count('expirations')
+            self._count('misses')
+            return None
+
+        # Avoid a write on every hit; LRU order only needs coarse access times
+        if now - accessed_at > self.TOUCH_INTERVAL:
+            with conn:
+                conn.execute(
+                    "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (now, self.namespace, key),
+                )
+
+        self._count('hits')
+        return json.loads(value), created_at, expires_at
+
+    def set(self, key, value, ttl):
+        """
+        Store a JSON-serializable value for ttl seconds, evicting the least
+        recently used entries of this namespace if it is full.
+
+        Args:
+            key (str): Cache key
+            value (object): JSON-serializable value to store
+            ttl (float): Lifetime in seconds; non-positive values are ignored
+        """
+        if ttl <= 0:
+            return
+
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, created_at, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), now, now + ttl, now),
+            )
+            (size,) = conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+
+            if size > self.max_entries:
+                expired = conn.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND expires_at <= ?",
+                    (self.namespace, now),
+                ).rowcount
+                self._count('expirations', expired)
+                overflow = size - expired - self.max_entries
+                if overflow > 0:
+                    conn.execute(
+                        "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                        "SELECT key FROM cache WHERE namespace = ? ORDER BY accessed_at LIMIT ?)",
+                        (self.namespace, self.namespace, overflow),
+                    )
+                    self._count('evictions', overflow)
+
+    def delete(self, key):
+        """Remove key from the cache if present."""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def clear(self):
+        """Remove all entries of this namespace."""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Hit/miss counters are per process; the size is shared by all processes.
+
+        Returns:
+            dict: Size, capacity and hit/miss/eviction counters
+        """
+        (size,) = self._connect().execute(
+            "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        with self._lock:
+            return {
+                "size": size,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def __len__(self):
+        return self.stats()["size"]
+
+    @classmethod
+    def _start_vacuum(cls, path, interval):
+        # One cleanup thread per database file, regardless of namespaces
+        key = os.path.abspath(path)
+        with cls._vacuum_lock:
+            if key in cls._vacuum_threads or interval <= 0:
+                return
+            thread = threading.Thread(
+                target=_vacuum_loop, args=(path, interval), name='cache-vacuum', daemon=True
+            )
+            cls._vacuum_threads[key] = thread
+            thread.start()
+
+
+def _open_sqlite(path):
+    conn = sqlite3.connect(path, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    return conn
+
+
+def _vacuum_loop(path, interval):
+    """Periodically drop expired rows and return freed pages to the filesystem."""
+    conn = None
+    while True:
+        time.sleep(interval)
+        try:
+            if conn is None:
+                conn = _open_sqlite(path)
+            with conn:
+                removed = conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),)).rowcount
+            conn.execute("PRAGMA incremental_vacuum")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if removed:
+                logger.info(f"Cache vacuum removed {removed} expired entries from {path}")
+        except sqlite3.Error as e:
+            logger.error(f"Error vacuuming cache database {path}: {str(e)}")
+
+
+def create_cache(namespace, max_entries=512):
+    """
+    Create a cache using the backend selected by YTUNE_CACHE_BACKEND.
+
+    Args:
+        namespace (str): Name of the cache, e.g. "stream" or "search"
+        max_entries (int): Maximum number of entries
+
+    Returns:
+        MemoryCache or SQLiteCache: The configured cache
+    """
+    if CACHE_BACKEND == 'sqlite':
+        try:
+            return SQLiteCache(CACHE_PATH, namespace, max_entries=max_entries,
+                               vacuum_interval=CACHE_VACUUM_INTERVAL)
+        except sqlite3.Error as e:
+            logger.error(f"Could not open cache database {CACHE_PATH}, using memory cache: {str(e)}")
+    elif CACHE_BACKEND != 'memory':
+        logger.warning(f"Unknown cache backend '{CACHE_BACKEND}', using memory cache")
+    return MemoryCache(max_entries=max_entries)
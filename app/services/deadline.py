@@ -0,0 +1,233 @@
+import contextvars
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Per-request time budgets; kept below gunicorn's --timeout so requests fail cleanly before the worker is killed
+REQUEST_DEADLINE = float(os.environ.get('YTUNE_REQUEST_DEADLINE', 25))
+MAX_REQUEST_DEADLINE = float(os.environ.get('YTUNE_MAX_REQUEST_DEADLINE', 55))
+# Header in which clients may send their own budget, in seconds
+DEADLINE_HEADER = 'X-Request-Timeout'
+# Upstream calls are not started with less time than this left
+MIN_CALL_BUDGET = float(os.environ.get('YTUNE_MIN_CALL_BUDGET', 0.5))
+# Socket timeout for yt-dlp requests when the budget allows more
+SOCKET_TIMEOUT = float(os.environ.get('YTUNE_SOCKET_TIMEOUT', 10))
+# Time one extractor attempt is assumed to take when deciding how many retries fit
+EXTRACTOR_ATTEMPT_SECONDS = float(os.environ.get('YTUNE_EXTRACTOR_ATTEMPT_SECONDS', 5))
+
+DEADLINE_ERROR = "Request deadline exceeded"
+
+# Monotonic time by which the current request must be answered; None means no deadline
+_deadline = contextvars.ContextVar('request_deadline', default=None)
+# Event set once the result of the current work is no longer needed
+_cancel = contextvars.ContextVar('request_cancel', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when work is abandoned because the request deadline cannot be met."""
+
+
+class Cancelled(DeadlineExceeded):
+    """Raised when work is abandoned because its result is no longer needed."""
+
+
+def is_deadline_error(error):
+    """
+    Return whether an exception, or one it wraps, means work was abandoned for lack of time or cancelled.
+
+    yt-dlp wraps errors raised during its requests in ExtractorError and
+    DownloadError, so their causes are checked too.
+
+    Args:
+        error (BaseException): The exception raised
+    """
+    for _ in range(4):
+        if isinstance(error, DeadlineExceeded):
+            return True
+        cause = getattr(error, 'cause', None)
+        if not isinstance(cause, BaseException):
+            exc_info = getattr(error, 'exc_info', None)
+            cause = exc_info[1] if isinstance(exc_info, tuple) else None
+        if cause is None or cause is error:
+            return False
+        error = cause
+    return False
+
+
+def parse_budget(value):
+    """
+    Turn a client-supplied budget into seconds.
+
+    Args:
+        value (str): Header value in seconds, or None
+
+    Returns:
+        float: The budget, capped at MAX_REQUEST_DEADLINE; REQUEST_DEADLINE if missing or invalid
+    """
+    try:
+        budget = float(value)
+    except (TypeError, ValueError):
+        return REQUEST_DEADLINE
+    if budget <= 0:
+        return REQUEST_DEADLINE
+    return min(budget, MAX_REQUEST_DEADLINE)
+
+
+def start(budget):
+    """
+    Set the deadline of the current context, keeping an earlier one if set.
+
+    Args:
+        budget (float): Seconds from now
+
+    Returns:
+        contextvars.Token: Token to pass to reset
+    """
+    at = time.monotonic() + budget
+    current = _deadline.get()
+    return _deadline.set(at if current is None else min(at, current))
+
+
+def reset(token):
+    """Restore the deadline that was in effect before start."""
+    _deadline.reset(token)
+
+
+@contextmanager
+def deadline(budget):
+    """
+    Run the block with a deadline budget seconds from now.
+
+    Args:
+        budget (float): Seconds from now
+    """
+    token = start(budget)
+    try:
+        yield
+    finally:
+        reset(token)
+
+
+def call_before(at, fn, *args, **kwargs):
+    """Call fn with the deadline set to the monotonic time at; convenient for executor.submit."""
+    token = start(at - time.monotonic()) if at is not None else None
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        if token is not None:
+            reset(token)
+
+
+def cancellable(event, fn, *args, **kwargs):
+    """
+    Call fn so that it is abandoned at its next upstream call once event is set.
+
+    Args:
+        event (threading.Event): Set to cancel the work
+        fn (callable): Function to run
+    """
+    token = _cancel.set(event)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _cancel.reset(token)
+
+
+def _check_cancelled(stage):
+    event = _cancel.get()
+    if event is not None and event.is_set():
+        raise Cancelled(f"Cancelled before {stage}")
+
+
+def current():
+    """Return the monotonic deadline of the current context, or None."""
+    return _deadline.get()
+
+
+def remaining():
+    """Return the seconds left until the deadline, or None if there is none."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def check(stage, minimum=MIN_CALL_BUDGET):
+    """
+    Abandon work that can no longer finish in time.
+
+    Args:
+        stage (str): What is about to start, for the error message
+        minimum (float): Seconds the stage needs at least
+
+    Raises:
+        DeadlineExceeded: If less than minimum seconds are left
+        Cancelled: If the work was cancelled
+    """
+    _check_cancelled(stage)
+    left = remaining()
+    if left is not None and left < minimum:
+        raise DeadlineExceeded(f"{DEADLINE_ERROR} before {stage}")
+
+
+def timeout(default):
+    """
+    Get the timeout for an upstream call.
+
+    Args:
+        default (float): Timeout to use when the budget allows it
+
+    Returns:
+        float: default, or the time left if that is shorter
+    """
+    left = remaining()
+    if left is None:
+        return default
+    return max(min(default, left), 0.0)
+
+
+def retries(default):
+    """
+    Get how many times a failed extractor request may be retried in the time left.
+
+    Args:
+        default (int): Retries to use when the budget allows it
+
+    Returns:
+        int: Number of retries
+    """
+    left = remaining()
+    if left is None:
+        return default
+    return max(0, min(default, int(left // EXTRACTOR_ATTEMPT_SECONDS) - 1))
+
+
+def instrument(ydl):
+    """
+    Bound every HTTP request of a YoutubeDL instance by the current deadline.
+
+    Each request gets the smaller of SOCKET_TIMEOUT and the time left as
+    its timeout, and requests are not started once the deadline has passed
+    or the work was cancelled.
+
+    Args:
+        ydl (yt_dlp.YoutubeDL): Instance to instrument
+    """
+    from yt_dlp.networking import Request
+
+    urlopen = ydl.urlopen
+
+    def deadline_urlopen(req):
+        _check_cancelled("an extractor request")
+        left = remaining()
+        if left is not None:
+            if left < MIN_CALL_BUDGET:
+                raise DeadlineExceeded(f"{DEADLINE_ERROR} before an extractor request")
+            if isinstance(req, str):
+                req = Request(req)
+            if isinstance(req, Request):
+                req.extensions['timeout'] = min(req.extensions.get('timeout') or SOCKET_TIMEOUT, left)
+        return urlopen(req)
+
+    ydl.urlopen = deadline_urlopen
@@ -0,0 +1,135 @@
+import math
+import threading
+from collections import Counter
+from itertools import chain
+
+
+def trigrams(text):
+    """
+    Split normalized text into character trigrams.
+
+    Each word is padded with two spaces in front and one behind, so word
+    starts weigh more than word ends and short words still yield trigrams.
+
+    Args:
+        text (str): Normalized text
+
+    Returns:
+        frozenset: The trigrams
+    """
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+def similarity(a, b):
+    """
+    Get the Dice coefficient of two trigram sets.
+
+    Args:
+        a (frozenset): Trigrams
+        b (frozenset): Trigrams
+
+    Returns:
+        float: 1.0 for identical sets, 0.0 for sets without a common trigram
+    """
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class TrigramIndex:
+    """
+    In-memory inverted index from character trigrams to texts.
+
+    Searches only count the rarest trigrams of the query, of which a match
+    must share some to reach the threshold, then verify those candidates,
+    so common trigrams such as word starts do not make lookups scan the
+    whole index.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._postings = {}
+
+    def add(self, key, text, value):
+        """
+        Index a text, replacing the entry stored under the same key.
+
+        Args:
+            key (hashable): Entry key
+            text (str): Normalized text to match queries against
+            value (object): Returned with the entry by search
+        """
+        grams = trigrams(text)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (grams, value)
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(key)
+
+    def discard(self, key):
+        """Remove the entry stored under key, if any."""
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for gram in entry[0]:
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def search(self, text, threshold, limit=5):
+        """
+        Find the entries most similar to a text.
+
+        Args:
+            text (str): Normalized query text
+            threshold (float): Minimum Dice coefficient of an entry, between 0 and 1
+            limit (int): Maximum number of entries returned
+
+        Returns:
+            list: (similarity, key, value) tuples, most similar first
+        """
+        query = trigrams(text)
+        if not query:
+            return []
+        size = len(query)
+        # An entry with a Dice coefficient of at least threshold shares at least `required`
+        # trigrams, so it contains one of the size - required + 1 rarest trigrams of the query
+        required = max(1, math.ceil(threshold * size / (2 - threshold)))
+        prefix = size - required + 1
+        empty = ()
+        with self._lock:
+            postings = sorted((self._postings.get(gram, empty) for gram in query), key=len)
+            # Counting a few more short posting lists is cheaper than verifying every entry found
+            # in the prefix: an entry must appear in `extra` + 1 of the prefix + `extra` rarest
+            budget = 2 * sum(len(keys) for keys in postings[:prefix])
+            counted, extra = budget // 2, 0
+            for keys in postings[prefix:]:
+                if counted + len(keys) > budget:
+                    break
+                counted += len(keys)
+                extra += 1
+            counts = Counter(chain.from_iterable(postings[:prefix + extra]))
+            matches = []
+            for key, shared in counts.items():
+                if shared <= extra:
+                    continue
+                grams, value = self._entries[key]
+                score = 2 * len(query & grams) / (size + len(grams))
+                if score >= threshold:
+                    matches.append((score, key, value))
+        matches.sort(key=lambda match: match[0], reverse=True)
+        return matches[:limit]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,176 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from app.services import deadline
+
+logger = logging.getLogger(__name__)
+
+
+class Hedger:
+    """
+    Race a slow call against a second, differently configured call.
+
+    The primary call is started at once. If it has not returned a usable
+    result after the hedge delay, the hedge call is started too; the first
+    usable result wins and the other call is cancelled at its next upstream
+    request. The delay is fixed, or the given percentile of recent primary
+    call durations. Hedges are paid for from a budget that grows by
+    `budget` for every primary call, so they add at most that share of
+    extra upstream calls, plus a burst of `burst`.
+    """
+
+    def __init__(self, workers, delay=0, percentile=0.9, default_delay=4.0, budget=0.1, burst=10,
+                 window=200, min_samples=20):
+        """
+        Args:
+            workers (int): Threads running primary and hedge calls
+            delay (float): Seconds before the hedge is started; 0 to use the percentile
+            percentile (float): Percentile of recent primary durations used as the delay
+            default_delay (float): Delay used until min_samples durations were recorded
+            budget (float): Hedges allowed per primary call
+            burst (int): Hedges that can be made at once from saved-up budget
+            window (int): Number of recent primary durations kept
+            min_samples (int): Durations needed before the percentile is used
+        """
+        self.workers = workers
+        self.fixed_delay = delay
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.budget = budget
+        self.burst = burst
+        self.min_samples = min_samples
+
+        self._lock = threading.Lock()
+        self._durations = deque(maxlen=window)
+        self._tokens = float(burst)
+        self._executor = None
+
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_won = 0
+        self.primary_won = 0
+        self.both_failed = 0
+        self.denied = 0
+
+    def delay(self):
+        """Return the seconds a primary call may take before it is hedged."""
+        if self.fixed_delay > 0:
+            return self.fixed_delay
+        with self._lock:
+            if len(self._durations) < self.min_samples:
+                return self.default_delay
+            durations = sorted(self._durations)
+        return durations[min(int(len(durations) * self.percentile), len(durations) - 1)]
+
+    def run(self, primary, hedge, usable=None):
+        """
+        Call primary, hedging it with hedge if it is slow.
+
+        Both callables run in a copy of the caller's context, so they see its
+        request deadline.
+
+        Args:
+            primary (callable): Preferred call
+            hedge (callable): Alternative call started if primary is slow
+            usable (callable, optional): Returns whether a result can be used; all results by default
+
+        Returns:
+            object: The first usable result, or the primary result if neither is usable
+
+        Raises:
+            Exception: What the primary call raised, if neither call succeeded
+        """
+        usable = usable or (lambda result: True)
+        with self._lock:
+            self.calls += 1
+            self._tokens = min(self._tokens + self.budget, float(self.burst))
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hedge')
+
+        cancels = {}
+        started = time.monotonic()
+        sampled = [False]
+        primary_future = self._submit(primary, cancels)
+
+        def record_success(future):
+            if future.exception() is None:
+                self._record(sampled, time.monotonic() - started)
+
+        primary_future.add_done_callback(record_success)
+
+        done, _ = wait([primary_future], timeout=deadline.timeout(self.delay()))
+        if done or not self._take_token():
+            return primary_future.result()
+
+        hedge_future = self._submit(hedge, cancels)
+        pending = {primary_future, hedge_future}
+        while pending:
+            done, pending = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                for event in cancels.values():
+                    event.set()
+                self._record(sampled, time.monotonic() - started)
+                raise deadline.DeadlineExceeded(f"{deadline.DEADLINE_ERROR} during hedged call")
+            for future in done:
+                if future.exception() is None and usable(future.result()):
+                    for other in pending:
+                        cancels[other].set()
+                    if primary_future in pending:
+                        # The primary would have taken at least this long; leaving it out would bias the delay low
+                        self._record(sampled, time.monotonic() - started)
+                    self._count('hedge_won' if future is hedge_future else 'primary_won')
+                    return future.result()
+
+        self._count('both_failed')
+        return primary_future.result()
+
+    def _submit(self, fn, cancels):
+        event = threading.Event()
+        # Each call needs its own context copy; one context cannot be entered by two threads
+        future = self._executor.submit(contextvars.copy_context().run, deadline.cancellable, event, fn)
+        cancels[future] = event
+        return future
+
+    def _record(self, sampled, seconds):
+        # Each primary call is sampled once: when it succeeds, or when it is abandoned as a lower bound
+        with self._lock:
+            if not sampled[0]:
+                sampled[0] = True
+                self._durations.append(seconds)
+
+    def _take_token(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.hedged += 1
+                return True
+            self.denied += 1
+            return False
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        """
+        Get hedging counters.
+
+        Returns:
+            dict: Calls, hedges by outcome, budget denials and the current delay
+        """
+        delay = self.delay()
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "hedge_won": self.hedge_won,
+                "primary_won": self.primary_won,
+                "both_failed": self.both_failed,
+                "denied": self.denied,
+                "budget_available": round(self._tokens, 2),
+                "delay": round(delay, 4),
+            }
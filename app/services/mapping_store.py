@@ -0,0 +1,385 @@
+import csv
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from app.services import normalize
+from app.services.fuzzy_index import TrigramIndex, similarity, trigrams
+
+logger = logging.getLogger(__name__)
+
+# Durable song-to-video mapping store
+MAPPING_STORE_ENABLED = os.environ.get('YTUNE_MAPPING_STORE', '1') == '1'
+MAPPING_STORE_PATH = os.environ.get('YTUNE_MAPPING_STORE_PATH', os.path.join('instance', 'ytune-mappings.sqlite3'))
+# Maximum difference in seconds between the requested and stored duration for a mapping to apply
+MAPPING_DURATION_TOLERANCE = 30
+# Songs without an exact mapping reuse the most similar mapped song, e.g. "tum hi ho arijit singh" for
+# "Tum Hi Ho - Arijit", when their title and title plus artist trigrams are at least this similar
+MAPPING_FUZZY_ENABLED = os.environ.get('YTUNE_MAPPING_FUZZY', '1') == '1'
+MAPPING_FUZZY_THRESHOLD = float(os.environ.get('YTUNE_MAPPING_FUZZY_THRESHOLD', 0.8))
+# Seconds between picking up mappings recorded by other workers into this process's fuzzy index
+MAPPING_FUZZY_REFRESH = float(os.environ.get('YTUNE_MAPPING_FUZZY_REFRESH', 30))
+
+# Columns written by export and accepted by import
+EXPORT_FIELDS = ('title', 'artist', 'duration', 'video_id', 'video_title',
+                 'thumbnail', 'video_duration', 'score', 'updated_at')
+_REQUIRED_FIELDS = ('title', 'artist', 'video_id')
+
+
+class MappingStore:
+    """
+    SQLite store of confident (title, artist) -> YouTube video matches.
+
+    Mappings are looked up by normalized title and artist, so casing,
+    accent and "feat." variations of a song share one entry. Songs without
+    an exact entry fall back to an in-memory trigram index of all mappings,
+    which catches misspellings and partial artist names.
+    """
+
+    def __init__(self, path, fuzzy=MAPPING_FUZZY_ENABLED, fuzzy_threshold=MAPPING_FUZZY_THRESHOLD):
+        """
+        Args:
+            path (str): Path to the SQLite database file
+            fuzzy (bool): Whether to fall back to the most similar mapping
+            fuzzy_threshold (float): Minimum trigram similarity of a fuzzy match, between 0 and 1
+        """
+        self.path = path
+        self.fuzzy = fuzzy
+        self.fuzzy_threshold = fuzzy_threshold
+        self._local = threading.local()
+        # Built from the database on the first fuzzy lookup, then kept up to date
+        self._index = None
+        self._index_lock = threading.Lock()
+        self._indexed_until = 0.0
+        self._synced_at = 0.0
+        self._stats_lock = threading.Lock()
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._init_schema()
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS mappings ("
+                "title_key TEXT NOT NULL, "
+                "artist_key TEXT NOT NULL, "
+                "duration_bucket TEXT NOT NULL, "
+                "title TEXT NOT NULL, "
+                "artist TEXT NOT NULL, "
+                "duration INTEGER, "
+                "video_id TEXT NOT NULL, "
+                "video_title TEXT, "
+                "thumbnail TEXT, "
+                "video_duration TEXT, "
+                "score REAL NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "updated_at REAL NOT NULL, "
+                "PRIMARY KEY (title_key, artist_key, duration_bucket))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS mappings_artist ON mappings (artist_key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS mappings_video ON mappings (video_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS mappings_updated ON mappings (updated_at)")
+
+    def lookup(self, title, artist, duration=None):
+        """
+        Find the stored match for a song, or for the most similar mapped song.
+
+        Args:
+            title (str): The song title
+            artist (str): The artist name
+            duration (int or str, optional): The expected duration
+
+        Returns:
+            dict: Search result payload as returned by search_song, or None
+        """
+        seconds = normalize.parse_duration(duration)
+        title_key, artist_key = normalize.normalize_title(title), normalize.normalize_artist(artist)
+        rows = self._connect().execute(
+            "SELECT video_id, video_title, thumbnail, video_duration, duration, duration_bucket "
+            "FROM mappings WHERE title_key = ? AND artist_key = ? ORDER BY score DESC, updated_at DESC",
+            (title_key, artist_key),
+        ).fetchall()
+
+        bucket = normalize.duration_bucket(duration)
+        candidates = [row for row in rows if row[5] == bucket] + [row for row in rows if row[5] != bucket]
+        for video_id, video_title, thumbnail, video_duration, stored_seconds, _ in candidates:
+            if not _duration_matches(seconds, stored_seconds):
+                continue
+            self._count('exact_hits')
+            return _payload(video_id, video_title, thumbnail, video_duration)
+
+        match = self._fuzzy_lookup(title_key, artist_key, seconds) if self.fuzzy else None
+        self._count('fuzzy_hits' if match is not None else 'misses')
+        return match
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def warm(self):
+        """Build the fuzzy index ahead of the first lookup that needs it."""
+        if self.fuzzy:
+            self._fuzzy_index()
+
+    def _fuzzy_lookup(self, title_key, artist_key, seconds):
+        index = self._fuzzy_index()
+        title_grams = trigrams(title_key)
+        numbers = _numbers(title_key)
+        for _, _, (stored_title, stored_seconds, payload) in index.search(
+                f"{title_key} {artist_key}", self.fuzzy_threshold):
+            # The title alone must be similar too, so one artist's songs do not stand in for each other,
+            # and numbers must match exactly, so "Symphony No. 5" does not stand in for "Symphony No. 9"
+            if similarity(title_grams, trigrams(stored_title)) < self.fuzzy_threshold \
+                    or _numbers(stored_title) != numbers or not _duration_matches(seconds, stored_seconds):
+                continue
+            return dict(payload)
+        return None
+
+    def _fuzzy_index(self):
+        with self._index_lock:
+            if self._index is None:
+                self._index = TrigramIndex()
+                self._sync()
+                logger.info(f"Indexed {len(self._index)} song mappings for fuzzy lookups")
+            elif time.monotonic() - self._synced_at >= MAPPING_FUZZY_REFRESH:
+                self._sync()
+            return self._index
+
+    def _sync(self):
+        # Other workers record mappings in the same database; pick up what changed since the last sync,
+        # with some overlap for rows committed after a later one
+        rows = self._connect().execute(
+            "SELECT title_key, artist_key, duration_bucket, duration, video_id, video_title, thumbnail, "
+            "video_duration, updated_at FROM mappings WHERE updated_at >= ?",
+            (self._indexed_until - 5,),
+        )
+        for title_key, artist_key, bucket, seconds, video_id, video_title, thumbnail, video_duration, \
+                updated_at in rows:
+            self._index_mapping(title_key, artist_key, bucket, seconds,
+                                _payload(video_id, video_title, thumbnail, video_duration))
+            self._indexed_until = max(self._indexed_until, updated_at)
+        self._synced_at = time.monotonic()
+
+    def _index_mapping(self, title_key, artist_key, bucket, seconds, payload):
+        self._index.add((title_key, artist_key, bucket), f"{title_key} {artist_key}", (title_key, seconds, payload))
+
+    def record(self, title, artist, duration, match, score):
+        """
+        Store or update the match for a song.
+
+        Args:
+            title (str): The song title as requested
+            artist (str): The artist name as requested
+            duration (int or str, optional): The requested duration
+            match (dict): Search result payload with video_id, title, thumbnail and duration
+            score (float): Match score
+        """
+        conn = self._connect()
+        with conn:
+            entry = self._upsert(conn, title, artist, duration, match, score, time.time())
+        self._index_entries([entry])
+
+    def _upsert(self, conn, title, artist, duration, match, score, now):
+        """Write a mapping within the caller's transaction and return its fuzzy index entry."""
+        # Compare later requests against the matched video's own length when known
+        seconds = normalize.parse_duration(match.get("duration") or None)
+        if seconds is None:
+            seconds = normalize.parse_duration(duration)
+        title_key, artist_key = normalize.normalize_title(title), normalize.normalize_artist(artist)
+        bucket = normalize.duration_bucket(duration)
+        conn.execute(
+            "INSERT INTO mappings (title_key, artist_key, duration_bucket, title, artist, duration, "
+            "video_id, video_title, thumbnail, video_duration, score, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (title_key, artist_key, duration_bucket) DO UPDATE SET "
+            "title = excluded.title, artist = excluded.artist, duration = excluded.duration, "
+            "video_id = excluded.video_id, video_title = excluded.video_title, "
+            "thumbnail = excluded.thumbnail, video_duration = excluded.video_duration, "
+            "score = excluded.score, updated_at = excluded.updated_at",
+            (
+                title_key, artist_key, bucket, title, artist, seconds,
+                match["video_id"], match.get("title"), match.get("thumbnail"),
+                _text(match.get("duration")), score, now, now,
+            ),
+        )
+        return title_key, artist_key, bucket, seconds, _payload(
+            match["video_id"], match.get("title"), match.get("thumbnail"), _text(match.get("duration")))
+
+    def _index_entries(self, entries):
+        # Only once the mappings are committed, so the index never holds rolled back ones
+        with self._index_lock:
+            if self._index is not None:
+                for entry in entries:
+                    self._index_mapping(*entry)
+
+    def stats(self):
+        """
+        Get lookup counters of this process.
+
+        Returns:
+            dict: Exact and fuzzy hits, misses and the number of indexed mappings
+        """
+        index = self._index
+        return {
+            "exact_hits": self.exact_hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+            "fuzzy_indexed": len(index) if index is not None else 0,
+        }
+
+    def __len__(self):
+        (count,) = self._connect().execute("SELECT COUNT(*) FROM mappings").fetchone()
+        return count
+
+    def iter_mappings(self):
+        """
+        Iterate over all stored mappings.
+
+        Yields:
+            dict: Mapping with the fields listed in EXPORT_FIELDS
+        """
+        cursor = self._connect().execute(
+            "SELECT title, artist, duration, video_id, video_title, thumbnail, video_duration, score, updated_at "
+            "FROM mappings ORDER BY artist_key, title_key"
+        )
+        for row in cursor:
+            yield dict(zip(EXPORT_FIELDS, row))
+
+    def export_mappings(self, fp, fmt='jsonl'):
+        """
+        Write all mappings to a file object.
+
+        Args:
+            fp (file): Text file open for writing
+            fmt (str): "jsonl" or "csv"
+
+        Returns:
+            int: Number of mappings written
+        """
+        count = 0
+        if fmt == 'csv':
+            writer = csv.DictWriter(fp, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            for mapping in self.iter_mappings():
+                writer.writerow(mapping)
+                count += 1
+        elif fmt == 'jsonl':
+            for mapping in self.iter_mappings():
+                fp.write(json.dumps(mapping, ensure_ascii=False) + '\n')
+                count += 1
+        else:
+            raise ValueError(f"Unsupported mapping format: {fmt}")
+        return count
+
+    def import_mappings(self, fp, fmt='jsonl', default_score=100):
+        """
+        Load mappings from a file object, replacing existing ones for the same song.
+
+        Each record needs title, artist and video_id; the other fields of
+        EXPORT_FIELDS are optional. Records that are not objects, lack a
+        required field or have a non-numeric score are skipped. All records
+        are written in a single transaction.
+
+        Args:
+            fp (file): Text file open for reading
+            fmt (str): "jsonl" or "csv"
+            default_score (float): Score for records without one
+
+        Returns:
+            tuple: (imported, skipped) record counts
+        """
+        if fmt == 'csv':
+            records = csv.DictReader(fp)
+        elif fmt == 'jsonl':
+            records = (_json_record(line) for line in fp if line.strip())
+        else:
+            raise ValueError(f"Unsupported mapping format: {fmt}")
+
+        skipped, entries = 0, []
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            for record in records:
+                if not isinstance(record, dict) or not all(
+                        record.get(field) and isinstance(record[field], str) for field in _REQUIRED_FIELDS):
+                    skipped += 1
+                    continue
+                score = record.get('score')
+                try:
+                    score = float(score) if score not in (None, '') else default_score
+                except (TypeError, ValueError):
+                    skipped += 1
+                    continue
+                match = {
+                    "video_id": record['video_id'],
+                    "title": record.get('video_title') or '',
+                    "thumbnail": record.get('thumbnail') or '',
+                    "duration": record.get('video_duration') or '',
+                }
+                entries.append(self._upsert(conn, record['title'], record['artist'],
+                                            record.get('duration') or None, match, score, now))
+        self._index_entries(entries)
+        return len(entries), skipped
+
+
+def _json_record(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def _payload(video_id, video_title, thumbnail, video_duration):
+    return {
+        "video_id": video_id,
+        "title": video_title or '',
+        "url": f"https://www.youtube.com/watch?v={video_id}",
+        "thumbnail": thumbnail or '',
+        "duration": video_duration or '',
+    }
+
+
+def _duration_matches(seconds, stored_seconds):
+    return seconds is None or stored_seconds is None or abs(stored_seconds - seconds) <= MAPPING_DURATION_TOLERANCE
+
+
+def _numbers(text):
+    return frozenset(word for word in text.split() if word.isdigit())
+
+
+def _text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+def create_mapping_store():
+    """
+    Open the mapping store configured by YTUNE_MAPPING_STORE_PATH.
+
+    Returns:
+        MappingStore: The store, or None if it is disabled or cannot be opened
+    """
+    if not MAPPING_STORE_ENABLED:
+        return None
+    try:
+        return MappingStore(MAPPING_STORE_PATH)
+    except sqlite3.Error as e:
+        logger.error(f"Could not open mapping store {MAPPING_STORE_PATH}: {str(e)}")
+        return None
@@ -0,0 +1,253 @@
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+from app.services import normalize
+
+logger = logging.getLogger(__name__)
+
+# Score contributions; a full title and artist match is worth 10, the default YTUNE_MAPPING_MIN_SCORE
+DEFAULT_WEIGHTS = {
+    'title': 5,               # times the share of title words found in the video title
+    'artist': 3,              # times the share of artist words found in the video title
+    'title_and_artist': 2,    # both found
+    'official': 3,            # "official" in the video title or description
+    'audio': 2,               # "audio" in the video title
+    'live': -5,               # unless the requested title mentions it too
+    'remix': -3,
+    'cover': -3,
+    'duration_close': 5,      # within 10 seconds of the expected duration
+    'duration_near': 3,       # within 30 seconds
+    'duration_far': -5,       # more than 2 minutes off
+    'channel': 5,             # uploaded by a channel named like the artist
+}
+# Overrides as "name=value" pairs, e.g. "live=-8,channel=6"
+MATCH_WEIGHTS = os.environ.get('YTUNE_MATCH_WEIGHTS', '')
+# Words of at least this length also match words with a similarity ratio of FUZZY_RATIO, e.g. misspellings
+FUZZY_MIN_LENGTH = 4
+FUZZY_RATIO = 0.8
+# Share of words that must be found for the title or artist to count as matched
+MATCH_THRESHOLD = 0.8
+
+# Keywords looked up in candidate titles; the ones that are penalized are ignored when the query contains them
+_KEYWORD_RES = {name: re.compile(rf'\b{name}\b') for name in ('official', 'audio', 'live', 'remix', 'cover')}
+_PENALIZED = ('live', 'remix', 'cover')
+_TOPIC_SUFFIX = ' topic'
+
+
+def parse_weights(spec):
+    """
+    Parse weight overrides.
+
+    Args:
+        spec (str): Comma-separated "name=value" pairs
+
+    Returns:
+        dict: DEFAULT_WEIGHTS with the overrides applied; unknown or invalid pairs are ignored
+    """
+    weights = dict(DEFAULT_WEIGHTS)
+    for pair in (spec or '').split(','):
+        name, _, value = pair.partition('=')
+        name = name.strip()
+        if not name:
+            continue
+        if name not in weights:
+            logger.warning(f"Ignoring unknown match weight '{name}'")
+            continue
+        try:
+            weights[name] = float(value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid match weight '{pair.strip()}'")
+    return weights
+
+
+@lru_cache(maxsize=65536)
+def _similar(a, b):
+    return SequenceMatcher(None, a, b).ratio() >= FUZZY_RATIO
+
+
+def _coverage(words, candidate):
+    """Return the share of words found in a candidate's title, allowing small misspellings."""
+    if not words:
+        return 0.0
+    found = 0
+    for word in words:
+        if word in candidate.words or candidate.resembles(word):
+            found += 1
+    return found / len(words)
+
+
+def _text(value):
+    """Flatten a search result text field, which may be a string, a list of text runs or None."""
+    if isinstance(value, list):
+        return ' '.join(part.get('text', '') if isinstance(part, dict) else str(part) for part in value)
+    return value if isinstance(value, str) else ''
+
+
+class MatchQuery:
+    """A requested song, normalized once for scoring against any number of candidates."""
+
+    __slots__ = ('title_words', 'artist_words', 'artist', 'duration', 'allowed')
+
+    def __init__(self, title, artist, duration=None):
+        """
+        Args:
+            title (str): The song title
+            artist (str): The artist name
+            duration (int or str, optional): The expected duration in seconds or "MM:SS"
+        """
+        folded_title = normalize.fold(title)
+        self.title_words = tuple(normalize.normalize_title(title).split())
+        self.artist = normalize.normalize_artist(artist)
+        self.artist_words = tuple(self.artist.split())
+        self.duration = normalize.parse_duration(duration) or None
+        # "Song (Live)" asks for a live version, so it is not penalized
+        self.allowed = frozenset(name for name in _PENALIZED if _KEYWORD_RES[name].search(folded_title))
+
+
+class _Candidate:
+    """Features of a search result that do not depend on the query."""
+
+    __slots__ = ('words', 'by_length', 'keywords', 'duration', 'channel', '_fuzzy')
+
+    def __init__(self, video):
+        title = normalize.fold(_text(video.get('title')))
+        description = normalize.fold(_text(video.get('descriptionSnippet')))
+        self.words = frozenset(title.split())
+        self.by_length = {}
+        for word in self.words:
+            self.by_length.setdefault(len(word), []).append(word)
+        self._fuzzy = {}
+        self.keywords = frozenset(name for name, keyword_re in _KEYWORD_RES.items() if keyword_re.search(title))
+        if 'official' not in self.keywords and _KEYWORD_RES['official'].search(description):
+            self.keywords |= {'official'}
+        self.duration = normalize.parse_duration(video.get('duration'))
+        channel = normalize.normalize_artist(_text((video.get('channel') or {}).get('name')))
+        # Auto-generated "Artist - Topic" channels count as the artist's own
+        if channel.endswith(_TOPIC_SUFFIX):
+            channel = channel[:-len(_TOPIC_SUFFIX)]
+        self.channel = channel
+
+    def resembles(self, word):
+        """Return whether a title word is a near miss for word; numbers must match exactly."""
+        if len(word) < FUZZY_MIN_LENGTH or word.isdigit():
+            return False
+        result = self._fuzzy.get(word)
+        if result is None:
+            result = any(_similar(word, other)
+                         for length in range(len(word) - 2, len(word) + 3)
+                         for other in self.by_length.get(length, ()))
+            if len(self._fuzzy) < 256:
+                self._fuzzy[word] = result
+        return result
+
+
+class MatchScorer:
+    """
+    Score YouTube search results against requested songs.
+
+    Queries are normalized once and candidate features are cached by
+    video ID, so ranking the same candidates again, or many queries in one
+    call, costs little more than the arithmetic.
+    """
+
+    def __init__(self, weights=None, cache_size=4096):
+        """
+        Args:
+            weights (dict, optional): Score contributions; defaults to DEFAULT_WEIGHTS
+            cache_size (int): Candidates whose features are kept
+        """
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._candidates = OrderedDict()
+
+    def _features(self, video):
+        key = video.get('id')
+        if key is None:
+            return _Candidate(video)
+        with self._lock:
+            features = self._candidates.get(key)
+            if features is not None:
+                self._candidates.move_to_end(key)
+                return features
+        features = _Candidate(video)
+        with self._lock:
+            self._candidates[key] = features
+            while len(self._candidates) > self.cache_size:
+                self._candidates.popitem(last=False)
+        return features
+
+    def score(self, query, video):
+        """
+        Score one search result.
+
+        Args:
+            query (MatchQuery): The requested song
+            video (dict): Search result
+
+        Returns:
+            float: Score; higher is a better match
+        """
+        return self._score(query, self._features(video))
+
+    def _score(self, query, candidate):
+        weights = self.weights
+        title_match = _coverage(query.title_words, candidate)
+        artist_match = _coverage(query.artist_words, candidate)
+        score = weights['title'] * title_match + weights['artist'] * artist_match
+        if title_match >= MATCH_THRESHOLD and artist_match >= MATCH_THRESHOLD:
+            score += weights['title_and_artist']
+
+        for name in candidate.keywords:
+            if name not in query.allowed:
+                score += weights[name]
+
+        if query.duration and candidate.duration:
+            difference = abs(candidate.duration - query.duration)
+            if difference < 10:
+                score += weights['duration_close']
+            elif difference < 30:
+                score += weights['duration_near']
+            elif difference > 120:
+                score += weights['duration_far']
+
+        if candidate.channel and candidate.channel == query.artist:
+            score += weights['channel']
+        return score
+
+    def rank(self, query, videos):
+        """
+        Rank search results for one song.
+
+        Args:
+            query (MatchQuery): The requested song
+            videos (list): Search results
+
+        Returns:
+            list: (score, video) tuples, highest score first
+        """
+        scored = [(self._score(query, self._features(video)), video) for video in videos]
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return scored
+
+    def rank_many(self, pairs):
+        """
+        Rank search results for many songs in one call, e.g. a playlist.
+
+        Args:
+            pairs (list): (query, videos) tuples; query is a MatchQuery or a (title, artist, duration) tuple
+
+        Returns:
+            list: One ranked list of (score, video) tuples per pair
+        """
+        ranked = []
+        for query, videos in pairs:
+            if not isinstance(query, MatchQuery):
+                query = MatchQuery(*query)
+            ranked.append(self.rank(query, videos))
+        return ranked
@@ -0,0 +1,443 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Directory where each worker process publishes its metrics; empty to report only the serving process
+METRICS_DIR = os.environ.get('YTUNE_METRICS_DIR', os.path.join('instance', 'metrics'))
+# Seconds between publications; metrics of other workers lag by up to this much
+METRICS_FLUSH_INTERVAL = float(os.environ.get('YTUNE_METRICS_FLUSH_INTERVAL', 5))
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Exposed metrics: name -> (type, help)
+METRICS = {
+    'ytune_stage_duration_seconds': ('histogram', 'Time spent in each stage of resolving a request'),
+    'ytune_requests_in_flight': ('gauge', 'Requests currently being handled'),
+    'ytune_cache_lookups_total': ('counter', 'Cache lookups by cache and result'),
+    'ytune_cache_evictions_total': ('counter', 'Entries evicted to make room, by cache'),
+    'ytune_cache_expirations_total': ('counter', 'Entries dropped because they expired, by cache'),
+    'ytune_cache_entries': ('gauge', 'Entries currently cached, by cache'),
+    'ytune_extractions_running': ('gauge', 'yt-dlp extractions running, by priority class'),
+    'ytune_extractions_queued': ('gauge', 'yt-dlp extractions waiting for a slot, by priority class'),
+    'ytune_lookups_in_flight': ('gauge', 'Distinct upstream lookups in flight, by lookup type'),
+    'ytune_lookups_coalesced_total': ('counter', 'Lookups that joined an identical lookup in flight, by type'),
+    'ytune_prefetch_pending': ('gauge', 'Prefetch items queued or running'),
+    'ytune_extractions_hedged_total': ('counter', 'Stream extractions raced against a second player client, by outcome'),
+    'ytune_extraction_hedge_delay_seconds': ('gauge', 'Seconds after which a stream extraction is hedged'),
+    'ytune_mapping_lookups_total': ('counter', 'Song mapping lookups by result: exact, fuzzy or miss'),
+    'ytune_startup_phase_seconds': ('gauge', 'Seconds from worker boot until a startup phase finished, by phase'),
+    'ytune_first_request_seconds': ('gauge', 'Latency of the first API request served by a worker'),
+    'ytune_upstream_errors_total': ('counter', 'Failed upstream operations, by operation and error type'),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_collectors = []
+_flusher = None
+# Whether this process has published its metrics yet; a file under its pid before that belongs to an exited worker
+_published = False
+
+# File in METRICS_DIR holding the counters and histograms of exited workers
+_RETIRED_FILE = 'retired.json'
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(stage, seconds):
+    """
+    Record the duration of a stage.
+
+    Args:
+        stage (str): Stage name, e.g. "extract_info"
+        seconds (float): Time the stage took
+    """
+    key = _key('ytune_stage_duration_seconds', {'stage': stage})
+    index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(LATENCY_BUCKETS), 0.0, 0]
+        if index < len(LATENCY_BUCKETS):
+            histogram[0][index] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+
+@contextmanager
+def timed(stage):
+    """
+    Record the duration of the block as a stage, whether or not it raises.
+
+    Args:
+        stage (str): Stage name
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def count(name, amount=1, **labels):
+    """
+    Increase a counter.
+
+    Args:
+        name (str): Metric name from METRICS
+        amount (float): Increment
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def count_error(operation, error):
+    """
+    Count a failed upstream operation by the type of its underlying error.
+
+    yt-dlp wraps extractor and network errors in DownloadError, so the
+    wrapped exception is reported instead; HTTP errors include their status.
+
+    Args:
+        operation (str): What failed, e.g. "getting stream URL"
+        error (Exception): The exception raised
+    """
+    # DownloadError wraps an ExtractorError, which may wrap the network error in turn
+    for _ in range(3):
+        cause = getattr(error, 'cause', None)
+        if not isinstance(cause, BaseException):
+            exc_info = getattr(error, 'exc_info', None)
+            cause = exc_info[1] if isinstance(exc_info, tuple) else None
+        if cause is None or cause is error:
+            break
+        error = cause
+    error_type = type(error).__name__
+    status = getattr(error, 'status', None)
+    if isinstance(status, int):
+        error_type = f"{error_type} {status}"
+    count('ytune_upstream_errors_total', operation=operation, type=error_type)
+
+
+def request_started():
+    """Count a request as in flight."""
+    _ensure_flusher()
+    key = _key('ytune_requests_in_flight', {})
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + 1
+
+
+def request_finished():
+    """Count a request as no longer in flight."""
+    key = _key('ytune_requests_in_flight', {})
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) - 1
+
+
+def register_collector(collector):
+    """
+    Register a function providing values that are tracked elsewhere.
+
+    The collector is called whenever metrics are published and returns a
+    list of (name, labels, value) samples, or (name, labels, value, shared)
+    for gauges whose value is shared by all workers, such as the size of a
+    cache on disk; shared gauges are not summed across workers.
+
+    Args:
+        collector (callable): Returns a list of samples
+    """
+    _collectors.append(collector)
+
+
+def snapshot():
+    """
+    Get the metrics of this process.
+
+    Returns:
+        dict: Counters, gauges and histograms as lists of samples
+    """
+    collected_counters, collected_gauges = [], []
+    for collector in _collectors:
+        try:
+            samples = collector()
+        except Exception as e:
+            logger.error(f"Error collecting metrics: {str(e)}")
+            continue
+        for sample in samples:
+            name, labels, value = sample[:3]
+            if METRICS[name][0] == 'counter':
+                collected_counters.append([name, labels, value])
+            else:
+                collected_gauges.append([name, labels, value, len(sample) > 3 and bool(sample[3])])
+
+    with _lock:
+        return {
+            "pid": os.getpid(),
+            "time": time.time(),
+            "counters": [[name, dict(labels), value] for (name, labels), value in _counters.items()]
+            + collected_counters,
+            "gauges": [[name, dict(labels), value, False] for (name, labels), value in _gauges.items()]
+            + collected_gauges,
+            "histograms": [[name, dict(labels), list(buckets), total, observations]
+                           for (name, labels), (buckets, total, observations) in _histograms.items()],
+        }
+
+
+def flush(data=None):
+    """
+    Publish the metrics of this process to METRICS_DIR for the other workers.
+
+    Args:
+        data (dict, optional): Snapshot to publish; taken now by default
+    """
+    global _published
+    if not METRICS_DIR:
+        return
+    data = data or snapshot()
+    path = os.path.join(METRICS_DIR, f"{data['pid']}.json")
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        if not _published:
+            # An exited worker had the same pid; keep its totals before overwriting them
+            _retire([path])
+            _published = True
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error(f"Error publishing metrics: {str(e)}")
+
+
+def _ensure_flusher():
+    # Started on first use rather than at import, so that every forked worker gets its own thread
+    global _flusher
+    if _flusher is not None or not METRICS_DIR:
+        return
+    with _lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_flush_periodically, name='metrics-flush', daemon=True)
+    _flusher.start()
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        flush()
+
+
+def _reset_after_fork():
+    # A forked worker starts counting from zero and publishes under its own pid
+    global _flusher, _lock, _published
+    _lock = threading.Lock()
+    _counters.clear()
+    _gauges.clear()
+    _histograms.clear()
+    _flusher = None
+    _published = False
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _worker_snapshots():
+    """Read the published metrics of all workers, with this process's current values."""
+    own = snapshot()
+    if not METRICS_DIR:
+        return [own], {own["pid"]}
+    flush(own)
+
+    snapshots, live = [own], {own["pid"]}
+    # Workers that stopped publishing have exited; their counters still count, their gauges do not
+    stale_before = time.time() - max(3 * METRICS_FLUSH_INTERVAL, 15)
+    stale = []
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        names = []
+    for name in names:
+        if not name.endswith('.json') or name in (f"{own['pid']}.json", _RETIRED_FILE):
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        data = _read(path)
+        if data is None:
+            continue
+        if data.get("time", 0) >= stale_before:
+            snapshots.append(data)
+            live.add(data.get("pid"))
+        else:
+            stale.append(path)
+    if stale:
+        _retire(stale, stale_before)
+    retired = _read(os.path.join(METRICS_DIR, _RETIRED_FILE))
+    if retired is not None:
+        snapshots.append({"pid": None, "counters": retired["counters"], "gauges": [],
+                          "histograms": retired["histograms"]})
+    return snapshots, live
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def _directory_lock():
+    """Hold an exclusive lock on METRICS_DIR across worker processes."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(METRICS_DIR, '.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _retire(paths, stale_before=None):
+    """
+    Fold the counters and histograms of exited workers into the retired totals and delete their files.
+
+    Args:
+        paths (list): Metrics files of exited workers
+        stale_before (float, optional): Files published at or after this time are left alone,
+            in case their worker published again since it was found stale
+    """
+    retired_path = os.path.join(METRICS_DIR, _RETIRED_FILE)
+    try:
+        with _directory_lock():
+            retired = _read(retired_path) or {"counters": [], "histograms": [], "folded": []}
+            # Files folded last time but not deleted, because the process stopped in between
+            folded = {tuple(entry) for entry in retired["folded"]}
+            counters = {_key(name, labels): value for name, labels, value in retired["counters"]}
+            histograms = {_key(name, labels): [buckets, total, observations]
+                          for name, labels, buckets, total, observations in retired["histograms"]}
+            retiring, identities = [], set()
+            for path in paths:
+                data = _read(path)
+                if data is None or (stale_before is not None and data.get("time", 0) >= stale_before):
+                    continue
+                identity = (data.get("pid"), data.get("time"))
+                retiring.append(path)
+                identities.add(identity)
+                if identity in folded:
+                    continue
+                for name, labels, value in data["counters"]:
+                    key = _key(name, labels)
+                    counters[key] = counters.get(key, 0) + value
+                for name, labels, buckets, total, observations in data["histograms"]:
+                    merged = histograms.setdefault(_key(name, labels), [[0] * len(LATENCY_BUCKETS), 0.0, 0])
+                    merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+                    merged[1] += total
+                    merged[2] += observations
+            if not retiring:
+                return
+            retired = {
+                "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+                "histograms": [[name, dict(labels), buckets, total, observations]
+                               for (name, labels), (buckets, total, observations) in histograms.items()],
+                # Lets the next pass delete these files without counting them twice if removing them fails
+                "folded": [list(identity) for identity in identities],
+            }
+            tmp_path = f"{retired_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(retired, f)
+            os.replace(tmp_path, retired_path)
+            for path in retiring:
+                os.remove(path)
+    except OSError as e:
+        logger.error(f"Error retiring metrics of exited workers: {str(e)}")
+
+
+def render():
+    """
+    Render the metrics of all workers in the Prometheus text exposition format.
+
+    Counters and histograms are summed over all workers that ever published
+    metrics, with those of exited workers kept as retired totals; gauges
+    over the workers still running, except shared gauges, which report the
+    largest value seen.
+
+    Returns:
+        str: The exposition text
+    """
+    snapshots, live = _worker_snapshots()
+    counters, gauges, histograms = {}, {}, {}
+    for data in snapshots:
+        for name, labels, value in data["counters"]:
+            key = _key(name, labels)
+            counters[key] = counters.get(key, 0) + value
+        if data["pid"] in live:
+            for name, labels, value, shared in data["gauges"]:
+                key = _key(name, labels)
+                gauges[key] = max(gauges.get(key, value), value) if shared else gauges.get(key, 0) + value
+        for name, labels, buckets, total, observations in data["histograms"]:
+            key = _key(name, labels)
+            merged = histograms.setdefault(key, [[0] * len(LATENCY_BUCKETS), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += observations
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        values = counters if kind == 'counter' else gauges if kind == 'gauge' else histograms
+        samples = sorted((key, value) for key, value in values.items() if key[0] == name)
+        if not samples:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (_, labels), value in samples:
+            if kind != 'histogram':
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            buckets, total, observations = value
+            cumulative = 0
+            for bound, bucket in zip(LATENCY_BUCKETS, buckets):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {observations}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {observations}")
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider recording the time spent serializing responses."""
+
+    def dumps(self, obj, **kwargs):
+        with timed('json_serialization'):
+            return super().dumps(obj, **kwargs)
@@ -0,0 +1,116 @@
+import re
+import unicodedata
+
+# Width of the duration buckets used in search keys, in seconds
+DURATION_BUCKET_SECONDS = 15
+
+# "feat.", "ft.", "featuring", "with" clauses, optionally in brackets
+_FEATURE_CLAUSE_RE = re.compile(
+    r'[\(\[]\s*(?:feat\.?|ft\.?|featuring|with)\s[^\)\]]*[\)\]]'
+    r'|\s(?:feat\.?|ft\.?|featuring)\s.*$',
+    re.IGNORECASE,
+)
+_FEATURE_WORD_RE = re.compile(r'\b(?:feat\.?|ft\.?|featuring|and|x|with)(?=\s)', re.IGNORECASE)
+_PUNCTUATION_RE = re.compile(r'[^\w\s]+')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def fold(text):
+    """
+    Casefold text, strip accents and collapse punctuation and whitespace.
+
+    Args:
+        text (str): Text to normalize
+
+    Returns:
+        str: Normalized text, e.g. "Beyoncé - Halo!" -> "beyonce halo"
+    """
+    text = text or ''
+    # ASCII text has no accents to strip
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = _PUNCTUATION_RE.sub(' ', text.casefold())
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def normalize_title(title):
+    """
+    Normalize a song title, dropping featured-artist clauses.
+
+    Args:
+        title (str): Song title, e.g. "Song (feat. Someone)"
+
+    Returns:
+        str: Normalized title, e.g. "song"
+    """
+    stripped = _FEATURE_CLAUSE_RE.sub(' ', title or '')
+    return fold(stripped) or fold(title)
+
+
+def normalize_artist(artist):
+    """
+    Normalize an artist string, treating "feat.", "and", "x" and other
+    joining words as separators.
+
+    Args:
+        artist (str): Artist name(s), e.g. "A ft. B" or "A & B"
+
+    Returns:
+        str: Normalized artist, e.g. "a b"
+    """
+    return fold(_FEATURE_WORD_RE.sub(' ', artist or ''))
+
+
+def parse_duration(value):
+    """
+    Convert a duration to seconds.
+
+    Args:
+        value (int, float or str): Seconds, or "SS", "MM:SS" or "HH:MM:SS"
+
+    Returns:
+        int: Duration in seconds, or None if it cannot be parsed
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        seconds = 0
+        for part in str(value).strip().split(':'):
+            seconds = seconds * 60 + int(part)
+        return seconds
+    except ValueError:
+        return None
+
+
+def duration_bucket(duration):
+    """
+    Map a duration to a coarse bucket so nearby durations share a key.
+
+    Args:
+        duration (int or str, optional): Duration in seconds or "MM:SS"
+
+    Returns:
+        str: The bucket index, or "" if no duration is given
+    """
+    seconds = parse_duration(duration)
+    if seconds is None:
+        return ''
+    return str(seconds // DURATION_BUCKET_SECONDS)
+
+
+def search_key(title, artist, duration=None):
+    """
+    Build the cache key for a (title, artist, duration) search.
+
+    Args:
+        title (str): The song title
+        artist (str): The artist name
+        duration (int or str, optional): The expected duration
+
+    Returns:
+        str: Normalized key
+    """
+    return f"{normalize_title(title)}|{normalize_artist(artist)}|{duration_bucket(duration)}"
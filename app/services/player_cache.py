@@ -0,0 +1,109 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Directory for yt-dlp's on-disk cache, shared by all workers on a host
+PLAYER_CACHE_DIR = os.environ.get('YTUNE_YTDLP_CACHE_DIR', os.path.join('instance', 'yt-dlp-cache'))
+# Video extracted at startup to fill the cache with the current player; empty to disable
+WARM_UP_VIDEO_ID = os.environ.get('YTUNE_WARM_UP_VIDEO_ID', 'jNQXAC9IVRw')
+
+# Cache section holding downloaded player JavaScript, keyed by player ID
+PLAYER_SECTION = 'youtube-player'
+# Sections written by yt-dlp's YouTube extractor, plus our player code section
+SECTIONS = ('youtube-sigfuncs', 'youtube-nsig', PLAYER_SECTION)
+
+_lock = threading.Lock()
+_counters = {}
+
+
+def _count(section, counter):
+    with _lock:
+        section_counters = _counters.setdefault(section, {"hits": 0, "misses": 0, "stores": 0})
+        section_counters[counter] += 1
+
+
+def instrument(ydl):
+    """
+    Count cache usage of a YoutubeDL instance and persist player code on disk.
+
+    yt-dlp only keeps downloaded player JavaScript in memory per extractor
+    instance; this stores it in the shared cache directory so a fresh
+    instance in any worker can decipher signatures without downloading it.
+
+    Args:
+        ydl (yt_dlp.YoutubeDL): Instance to instrument
+    """
+    cache = ydl.cache
+    load, store = cache.load, cache.store
+
+    def counting_load(section, key, *args, **kwargs):
+        result = load(section, key, *args, **kwargs)
+        _count(section, "misses" if result is None else "hits")
+        return result
+
+    def counting_store(section, key, *args, **kwargs):
+        _count(section, "stores")
+        return store(section, key, *args, **kwargs)
+
+    cache.load = counting_load
+    cache.store = counting_store
+
+    try:
+        ie = ydl.get_info_extractor('Youtube')
+        load_player = ie._load_player
+    except Exception as e:
+        # Extractor internals differ between yt-dlp versions; the cache still works without this
+        logger.warning(f"Could not enable persistent player cache: {str(e)}")
+        return
+
+    def cached_load_player(video_id, player_url, fatal=True):
+        try:
+            player_id = ie._extract_player_info(player_url)
+        except Exception:
+            return load_player(video_id, player_url, fatal=fatal)
+
+        if player_id not in ie._code_cache:
+            code = cache.load(PLAYER_SECTION, player_id)
+            if code:
+                ie._code_cache[player_id] = code
+                return code
+            code = load_player(video_id, player_url, fatal=fatal)
+            if code:
+                cache.store(PLAYER_SECTION, player_id, code)
+            return code
+        return ie._code_cache[player_id]
+
+    ie._load_player = cached_load_player
+
+
+def stats():
+    """
+    Get usage counters and on-disk size of the yt-dlp cache.
+
+    Returns:
+        dict: Directory, per-section hit/miss/store counters, file counts and bytes
+    """
+    with _lock:
+        counters = {section: dict(values) for section, values in _counters.items()}
+
+    sections = {}
+    for section in SECTIONS:
+        path = os.path.join(PLAYER_CACHE_DIR, section)
+        files, size = 0, 0
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        files += 1
+                        size += entry.stat().st_size
+        except OSError:
+            pass
+        sections[section] = {
+            "files": files,
+            "bytes": size,
+            **counters.get(section, {"hits": 0, "misses": 0, "stores": 0}),
+        }
+
+    return {"directory": os.path.abspath(PLAYER_CACHE_DIR), "sections": sections}
@@ -0,0 +1,204 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services import audio_proxy, normalize
+from app.services.scheduler import extraction_priority
+from app.services.youtube_service import YouTubeService
+
+logger = logging.getLogger(__name__)
+
+# Background prefetching of upcoming tracks
+PREFETCH_WORKERS = int(os.environ.get('YTUNE_PREFETCH_WORKERS', 2))
+PREFETCH_MAX_PENDING = int(os.environ.get('YTUNE_PREFETCH_MAX_PENDING', 200))
+PREFETCH_MAX_PER_CLIENT = int(os.environ.get('YTUNE_PREFETCH_MAX_PER_CLIENT', 20))
+# Leading bytes of each track written to the audio cache when audio prefetching is requested
+PREFETCH_AUDIO_BYTES = int(os.environ.get('YTUNE_PREFETCH_AUDIO_BYTES', 1024 * 1024))
+
+
+class PrefetchQueue:
+    """
+    Bounded background queue of work that warms caches ahead of need.
+
+    Work is identified by a key; a key that is already queued or running is
+    not queued again. Each client may only have max_per_client items pending
+    at a time, and the whole queue at most max_pending, so one busy client
+    cannot fill it. Work runs on a small pool to stay out of the way of
+    interactive requests.
+    """
+
+    def __init__(self, handler, workers=2, max_pending=200, max_per_client=20):
+        """
+        Args:
+            handler (callable): Called with each queued item
+            workers (int): Items processed at once
+            max_pending (int): Maximum items queued or running
+            max_per_client (int): Maximum items queued or running per client
+        """
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_per_client = max_per_client
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._per_client = {}
+        self._executor = None
+
+        self.queued = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, client_id, items):
+        """
+        Queue items for a client.
+
+        Args:
+            client_id (str): Identifies the client for the per-client limit
+            items (list): (key, item) tuples; item is passed to the handler
+
+        Returns:
+            dict: Numbers of items queued, skipped as duplicates and dropped over the limits
+        """
+        result = {"queued": 0, "duplicates": 0, "dropped": 0}
+        accepted = []
+        with self._lock:
+            for key, item in items:
+                if key in self._pending:
+                    result["duplicates"] += 1
+                    continue
+                if len(self._pending) >= self.max_pending \
+                        or self._per_client.get(client_id, 0) >= self.max_per_client:
+                    result["dropped"] += 1
+                    continue
+                self._pending[key] = client_id
+                self._per_client[client_id] = self._per_client.get(client_id, 0) + 1
+                accepted.append((key, item))
+            result["queued"] = len(accepted)
+            self.queued += result["queued"]
+            self.duplicates += result["duplicates"]
+            self.dropped += result["dropped"]
+            if accepted and self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='prefetch')
+
+        for key, item in accepted:
+            self._executor.submit(self._run, key, item)
+        return result
+
+    def _run(self, key, item):
+        try:
+            result = self.handler(item)
+            failed = isinstance(result, dict) and "error" in result
+            if failed:
+                logger.info(f"Prefetch of {key} failed: {result['error']}")
+        except Exception as e:
+            failed = True
+            logger.error(f"Prefetch of {key} failed: {str(e)}")
+        with self._lock:
+            client_id = self._pending.pop(key, None)
+            remaining = self._per_client.get(client_id, 0) - 1
+            if remaining > 0:
+                self._per_client[client_id] = remaining
+            else:
+                self._per_client.pop(client_id, None)
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def stats(self):
+        """
+        Get queue counters.
+
+        Returns:
+            dict: Pending items, clients with pending items and submission counters
+        """
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "clients": len(self._per_client),
+                "queued": self.queued,
+                "duplicates": self.duplicates,
+                "dropped": self.dropped,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+
+def _prefetch_track(item):
+    """Warm the search, stream URL and optionally audio caches for one track."""
+    with extraction_priority('background'):
+        return _warm_track(item)
+
+
+def _warm_track(item):
+    video_id = item.get("video_id")
+    if not video_id:
+        match = YouTubeService.search_song(item["title"], item["artist"], item.get("duration"))
+        if "error" in match:
+            return match
+        video_id = match["video_id"]
+
+    result = YouTubeService.get_stream_url(video_id=video_id)
+    if "error" in result or not item.get("audio"):
+        return result
+
+    try:
+        stream = audio_proxy.open_stream(video_id, f"bytes=0-{PREFETCH_AUDIO_BYTES - 1}")
+    except audio_proxy.ProxyError as e:
+        return {"error": str(e)}
+    # Draining the stream stores the downloaded chunks
+    for _ in stream:
+        pass
+    return result
+
+
+_prefetch_queue = PrefetchQueue(
+    _prefetch_track,
+    workers=PREFETCH_WORKERS,
+    max_pending=PREFETCH_MAX_PENDING,
+    max_per_client=PREFETCH_MAX_PER_CLIENT,
+)
+
+
+def prefetch(client_id, items, audio=False):
+    """
+    Queue upcoming tracks for background prefetching.
+
+    Args:
+        client_id (str): Identifies the client for the per-client limit
+        items (list): Dicts with video_id or youtube_url, or with title, artist and optional duration
+        audio (bool): Also cache the first PREFETCH_AUDIO_BYTES of each track's audio
+
+    Returns:
+        dict: Numbers of items queued, skipped as duplicates, dropped over the limits and invalid
+    """
+    keyed = []
+    invalid = 0
+    for item in items:
+        video_id = YouTubeService.extract_video_id(item.get("video_id") or item.get("youtube_url"))
+        if video_id:
+            keyed.append((f"video:{video_id}", {"video_id": video_id, "audio": audio}))
+        elif item.get("title") and item.get("artist"):
+            key = normalize.search_key(item["title"], item["artist"], item.get("duration"))
+            keyed.append((f"song:{key}", {"title": item["title"], "artist": item["artist"],
+                                          "duration": item.get("duration"), "audio": audio}))
+        else:
+            invalid += 1
+
+    result = _prefetch_queue.submit(client_id, keyed)
+    result["invalid"] = invalid
+    return result
+
+
+def prefetch_stats():
+    """
+    Get prefetch queue statistics.
+
+    Returns:
+        dict: Queue counters
+    """
+    return _prefetch_queue.stats()
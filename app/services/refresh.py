@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshAheadScheduler:
+    """
+    Re-resolve frequently used cache entries shortly before they expire.
+
+    Every access to a cached entry is recorded. When an entry that has been
+    accessed at least min_hits times within the last hit_window seconds enters
+    the final refresh_fraction of its lifetime, refresh_fn is called for it on
+    a small background pool. Concurrency and rate are capped so refreshes
+    cannot crowd out interactive requests.
+    """
+
+    def __init__(self, refresh_fn, refresh_fraction=0.2, min_hits=3, hit_window=600,
+                 max_concurrent=2, max_per_minute=30, max_tracked=4096):
+        """
+        Args:
+            refresh_fn (callable): Called with the arguments passed to record_access
+            refresh_fraction (float): Final share of an entry's lifetime in which it is refreshed
+            min_hits (int): Accesses within hit_window needed for an entry to count as hot
+            hit_window (int): Seconds over which accesses are counted
+            max_concurrent (int): Maximum refreshes running at once
+            max_per_minute (int): Maximum refreshes started per minute
+            max_tracked (int): Maximum number of keys whose accesses are tracked
+        """
+        self.refresh_fn = refresh_fn
+        self.refresh_fraction = refresh_fraction
+        self.min_hits = min_hits
+        self.hit_window = hit_window
+        self.max_concurrent = max_concurrent
+        self.max_per_minute = max_per_minute
+        self.max_tracked = max_tracked
+
+        self._lock = threading.Lock()
+        self._accesses = OrderedDict()
+        self._pending = set()
+        self._tokens = float(max_per_minute)
+        self._last_refill = time.monotonic()
+        self._executor = None
+
+        self.scheduled = 0
+        self.completed = 0
+        self.failed = 0
+        self.rate_limited = 0
+
+    def record_access(self, key, created_at=None, expires_at=None, *args):
+        """
+        Record an access to key and schedule a refresh if it is due.
+
+        Args:
+            key (str): Cache key of the entry
+            created_at (float, optional): When the cached entry was stored; None on a miss
+            expires_at (float, optional): When the cached entry expires; None on a miss
+            *args: Extra arguments passed to refresh_fn
+
+        Returns:
+            bool: True if a refresh was scheduled
+        """
+        now = time.time()
+        with self._lock:
+            hits = self._accesses.get(key)
+            if hits is None:
+                hits = deque()
+                self._accesses[key] = hits
+            self._accesses.move_to_end(key)
+            hits.append(now)
+            while hits and hits[0] < now - self.hit_window:
+                hits.popleft()
+            while len(self._accesses) > self.max_tracked:
+                self._accesses.popitem(last=False)
+
+            if created_at is None or expires_at is None:
+                return False
+            lifetime = expires_at - created_at
+            if now < expires_at - lifetime * self.refresh_fraction:
+                return False
+            if len(hits) < self.min_hits or key in self._pending:
+                return False
+            if len(self._pending) >= self.max_concurrent:
+                return False
+            if not self._take_token():
+                self.rate_limited += 1
+                return False
+
+            self._pending.add(key)
+            self.scheduled += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent,
+                                                    thread_name_prefix='refresh-ahead')
+
+        self._executor.submit(self._run, key, args)
+        return True
+
+    def _take_token(self):
+        # Token bucket refilled continuously at max_per_minute
+        now = time.monotonic()
+        self._tokens = min(float(self.max_per_minute),
+                           self._tokens + (now - self._last_refill) * self.max_per_minute / 60.0)
+        self._last_refill = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _run(self, key, args):
+        try:
+            result = self.refresh_fn(*args)
+            failed = isinstance(result, dict) and "error" in result
+            if failed:
+                logger.warning(f"Refresh-ahead for {key} failed: {result['error']}")
+        except Exception as e:
+            failed = True
+            logger.error(f"Refresh-ahead for {key} failed: {str(e)}")
+        with self._lock:
+            self._pending.discard(key)
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def stats(self):
+        """
+        Get refresh counters.
+
+        Returns:
+            dict: Tracked keys, refreshes in progress and scheduling counters
+        """
+        with self._lock:
+            return {
+                "tracked": len(self._accesses),
+                "in_progress": len(self._pending),
+                "scheduled": self.scheduled,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rate_limited": self.rate_limited,
+            }
@@ -0,0 +1,220 @@
+import contextvars
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+PRIORITIES = ('interactive', 'batch', 'background')
+_BATCH_RANK = PRIORITIES.index('batch')
+
+# Priority of extractions started by the current thread or task; requests default to interactive
+_current_priority = contextvars.ContextVar('extraction_priority', default='interactive')
+
+
+@contextmanager
+def extraction_priority(priority):
+    """
+    Run the block with extractions scheduled at the given priority.
+
+    Args:
+        priority (str): One of PRIORITIES
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown extraction priority: {priority}")
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority():
+    """Return the extraction priority of the current thread or task."""
+    return _current_priority.get()
+
+
+def with_priority(priority, fn, *args, **kwargs):
+    """Call fn at the given extraction priority; convenient for executor.submit."""
+    with extraction_priority(priority):
+        return fn(*args, **kwargs)
+
+
+class _Ticket:
+    __slots__ = ('priority', 'rank', 'key', 'enqueued', 'seq')
+
+    def __init__(self, priority, key, seq):
+        self.priority = priority
+        self.rank = PRIORITIES.index(priority)
+        self.key = key
+        self.enqueued = time.monotonic()
+        self.seq = seq
+
+
+class ExtractionScheduler:
+    """
+    Admission control for yt-dlp extractions by priority class.
+
+    At most `slots` extractions run at once, and each class may use at most
+    its own limit of them; keeping the batch and background limits below
+    `slots` reserves capacity for interactive requests. Waiting extractions
+    are admitted most urgent class first. A waiting extraction moves up one
+    class for every `aging` seconds it has waited, so background work is not
+    starved under sustained load; it still counts against its own class
+    limit, and only interactive extractions rank as interactive.
+    """
+
+    def __init__(self, slots=6, limits=None, aging=15.0, timeout=30.0):
+        """
+        Args:
+            slots (int): Maximum extractions running at once
+            limits (dict, optional): Maximum running extractions per priority class
+            aging (float): Seconds of waiting after which an extraction moves up one class
+            timeout (float): Default maximum seconds to wait for a slot
+        """
+        self.slots = slots
+        self.limits = {priority: slots for priority in PRIORITIES}
+        self.limits.update(limits or {})
+        self.aging = aging
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._seq = itertools.count()
+        self._counters = {
+            priority: {"admitted": 0, "timed_out": 0, "promoted": 0,
+                       "queue_time_total": 0.0, "queue_time_max": 0.0}
+            for priority in PRIORITIES
+        }
+
+    @contextmanager
+    def slot(self, key=None, priority=None, timeout=None):
+        """
+        Hold an extraction slot for the duration of the block.
+
+        Args:
+            key (str, optional): Identifies the work so that it can be promoted while waiting
+            priority (str, optional): Priority class; defaults to the current extraction_priority
+            timeout (float, optional): Maximum seconds to wait; defaults to the scheduler timeout
+
+        Raises:
+            TimeoutError: If no slot became free in time
+        """
+        ticket = self._acquire(priority or _current_priority.get(), key,
+                               self.timeout if timeout is None else timeout)
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def _acquire(self, priority, key, timeout):
+        ticket = _Ticket(priority, key, next(self._seq))
+        deadline = ticket.enqueued + timeout if timeout is not None else None
+        with self._cond:
+            self._waiting.append(ticket)
+            while not self._admissible(ticket):
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    self._waiting.remove(ticket)
+                    self._counters[ticket.priority]["timed_out"] += 1
+                    # Our departure may unblock a lower-priority waiter
+                    self._cond.notify_all()
+                    raise TimeoutError(f"No extraction slot available for {ticket.priority} work")
+                # Wake up periodically so that aging is re-evaluated
+                self._cond.wait(min(remaining, self.aging) if remaining is not None else self.aging)
+
+            self._waiting.remove(ticket)
+            self._running[ticket.priority] += 1
+            waited = time.monotonic() - ticket.enqueued
+            counters = self._counters[ticket.priority]
+            counters["admitted"] += 1
+            counters["queue_time_total"] += waited
+            counters["queue_time_max"] = max(counters["queue_time_max"], waited)
+            if self._waiting:
+                self._cond.notify_all()
+        return ticket
+
+    def _admissible(self, ticket):
+        if sum(self._running.values()) >= self.slots:
+            return False
+        if self._running[ticket.priority] >= self.limits[ticket.priority]:
+            return False
+        return self._next() is ticket
+
+    def _next(self):
+        """Return the waiting ticket to admit next among classes below their limit."""
+        now = time.monotonic()
+        eligible = [ticket for ticket in self._waiting
+                    if self._running[ticket.priority] < self.limits[ticket.priority]]
+        if not eligible:
+            return None
+        return min(eligible, key=lambda ticket: (self._effective_rank(ticket, now), ticket.seq))
+
+    def _effective_rank(self, ticket, now):
+        if self.aging <= 0:
+            return ticket.rank
+        # Aging lifts background work to batch rank at most, so it never goes ahead of interactive requests
+        floor = min(ticket.rank, _BATCH_RANK)
+        return max(ticket.rank - int((now - ticket.enqueued) // self.aging), floor)
+
+    def _release(self, ticket):
+        with self._cond:
+            self._running[ticket.priority] -= 1
+            self._cond.notify_all()
+
+    def promote(self, key, priority=None):
+        """
+        Raise waiting work to a more urgent class, e.g. when an interactive
+        request joins an extraction queued by a prefetch.
+
+        Args:
+            key (str): Key the work was queued with
+            priority (str, optional): Class to promote to; defaults to the current extraction_priority
+
+        Returns:
+            bool: True if waiting work was promoted
+        """
+        priority = priority or _current_priority.get()
+        rank = PRIORITIES.index(priority)
+        promoted = False
+        with self._cond:
+            for ticket in self._waiting:
+                if ticket.key == key and ticket.rank > rank:
+                    self._counters[ticket.priority]["promoted"] += 1
+                    ticket.priority, ticket.rank = priority, rank
+                    promoted = True
+            if promoted:
+                self._cond.notify_all()
+        return promoted
+
+    def stats(self):
+        """
+        Get scheduler counters.
+
+        Returns:
+            dict: Slot usage and per-class running, waiting, limit and queue time counters
+        """
+        with self._cond:
+            classes = {}
+            for priority in PRIORITIES:
+                counters = dict(self._counters[priority])
+                admitted = counters["admitted"]
+                counters["queue_time_avg"] = round(counters["queue_time_total"] / admitted, 4) if admitted else 0.0
+                counters["queue_time_total"] = round(counters["queue_time_total"], 4)
+                counters["queue_time_max"] = round(counters["queue_time_max"], 4)
+                classes[priority] = {
+                    "running": self._running[priority],
+                    "waiting": sum(1 for ticket in self._waiting if ticket.priority == priority),
+                    "limit": self.limits[priority],
+                    **counters,
+                }
+            return {
+                "slots": self.slots,
+                "running": sum(self._running.values()),
+                "waiting": len(self._waiting),
+                "classes": classes,
+            }
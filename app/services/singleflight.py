@@ -0,0 +1,106 @@
+import threading
+
+
+class _Call:
+    """An in-flight call whose outcome is shared by all waiting callers."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    still running wait for it and receive the same result or exception.
+    Exceptions that only concern the caller who ran the function, such as
+    running out of its own time budget, can be excluded: waiting callers
+    then run the function again themselves, or join whoever does.
+    """
+
+    def __init__(self, wait_timeout=None, retry=None):
+        """
+        Args:
+            wait_timeout (callable, optional): Returns the seconds a waiting caller may
+                wait for the shared execution, or None to wait indefinitely
+            retry (callable, optional): Returns whether waiting callers should retry
+                rather than receive an exception raised by the shared execution
+        """
+        self.wait_timeout = wait_timeout
+        self.retry = retry
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.retried = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) unless a call for key is already in flight.
+
+        Args:
+            key (str): Key identifying equivalent calls
+            fn (callable): Function to run
+
+        Returns:
+            object: The result of the single shared execution
+
+        Raises:
+            TimeoutError: If a waiting caller's wait_timeout ran out
+            Exception: Whatever the shared execution raised
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = _Call()
+                    self._calls[key] = call
+                    self.executions += 1
+                    break
+                call.waiters += 1
+                self.coalesced += 1
+
+            timeout = self.wait_timeout() if self.wait_timeout else None
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"Timed out waiting for the in-flight call for {key}")
+            if call.error is None:
+                return call.result
+            if self.retry is None or not self.retry(call.error):
+                raise call.error
+            with self._lock:
+                self.retried += 1
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        """Return the number of keys currently being executed."""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        """
+        Get coalescing counters.
+
+        Returns:
+            dict: Executions, coalesced calls and keys in flight
+        """
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "retried": self.retried,
+                "in_flight": len(self._calls),
+            }
@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Start of this worker's boot; the app package imports this module before anything else
+BOOT_STARTED = time.monotonic()
+
+# URLs requested by every pooled yt-dlp instance during warm-up, so the DNS lookup and TLS
+# handshake for YouTube are done before the first extraction; empty to disable
+PREWARM_URLS = [url.strip() for url in os.environ.get('YTUNE_PREWARM_URLS', 'https://www.youtube.com/generate_204')
+                .split(',') if url.strip()]
+
+_lock = threading.Lock()
+# Phases that must finish before the worker reports ready
+_expected = {'app'}
+# Phase name -> {"ok", "seconds", "finished_at"}; finished_at is seconds since boot
+_phases = {}
+_first_request = None
+
+
+def since_boot():
+    """Return the seconds since this worker started booting."""
+    return time.monotonic() - BOOT_STARTED
+
+
+def expect(name):
+    """
+    Require a phase to finish before the worker reports ready.
+
+    Args:
+        name (str): Phase name
+    """
+    with _lock:
+        _expected.add(name)
+
+
+def mark(name, seconds=None, ok=True):
+    """
+    Record a finished startup phase.
+
+    Args:
+        name (str): Phase name
+        seconds (float, optional): Time the phase took; since boot by default
+        ok (bool): Whether the phase succeeded
+    """
+    finished_at = since_boot()
+    with _lock:
+        _phases[name] = {
+            "ok": ok,
+            "seconds": round(finished_at if seconds is None else seconds, 4),
+            "finished_at": round(finished_at, 4),
+        }
+        ready = _expected.issubset(_phases) and name in _expected
+    level = logging.INFO if ok else logging.WARNING
+    logger.log(level, f"Startup phase '{name}' {'finished' if ok else 'failed'} after {finished_at:.2f}s")
+    if ready:
+        logger.info(f"Worker ready {finished_at:.2f}s after boot")
+
+
+@contextmanager
+def phase(name):
+    """
+    Time a best-effort warm-up phase; errors are logged and the phase is marked failed, not raised.
+
+    Args:
+        name (str): Phase name
+    """
+    started = time.monotonic()
+    try:
+        yield
+    except Exception as e:
+        logger.error(f"Error in startup phase '{name}': {str(e)}")
+        mark(name, time.monotonic() - started, ok=False)
+    else:
+        mark(name, time.monotonic() - started)
+
+
+def is_ready():
+    """Return whether all expected phases have finished, successfully or not."""
+    with _lock:
+        return _expected.issubset(_phases)
+
+
+def record_request(seconds):
+    """
+    Record the latency of an API request; only the first one of the worker is kept.
+
+    Args:
+        seconds (float): Time the request took
+    """
+    global _first_request
+    if _first_request is not None:
+        return
+    with _lock:
+        if _first_request is not None:
+            return
+        _first_request = {"seconds": round(seconds, 4), "started_at": round(since_boot() - seconds, 4)}
+    logger.info(f"First request took {seconds:.3f}s, {_first_request['started_at']:.2f}s after boot")
+
+
+def status():
+    """
+    Get the startup progress of this worker.
+
+    Returns:
+        dict: Readiness, finished and pending phases, and the latency of the first request
+    """
+    with _lock:
+        phases = {name: dict(info) for name, info in _phases.items()}
+        pending = sorted(_expected.difference(_phases))
+        first_request = dict(_first_request) if _first_request else None
+    return {
+        "ready": not pending,
+        "uptime": round(since_boot(), 4),
+        "ready_after": None if pending else max(phases[name]["finished_at"] for name in _expected),
+        "phases": phases,
+        "pending": pending,
+        "first_request": first_request,
+    }
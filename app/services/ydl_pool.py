@@ -0,0 +1,299 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from app.services import deadline, metrics, player_cache
+
+logger = logging.getLogger(__name__)
+
+# YouTube player clients tried by hedged stream extractions, instead of yt-dlp's default ios, android, web
+HEDGE_PLAYER_CLIENTS = os.environ.get('YTUNE_EXTRACTION_HEDGE_CLIENTS', 'android').split(',')
+
+# yt-dlp option profiles; each profile gets its own set of pooled instances
+PROFILES = {
+    # Direct audio stream resolution
+    'audio': {
+        'format': 'bestaudio/best',
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+        'noplaylist': True,
+        'socket_timeout': deadline.SOCKET_TIMEOUT,
+        'cachedir': player_cache.PLAYER_CACHE_DIR,
+    },
+    # Direct audio stream resolution through other player clients, raced against 'audio' when it is slow
+    'audio_hedge': {
+        'format': 'bestaudio/best',
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+        'noplaylist': True,
+        'extractor_args': {'youtube': {'player_client': HEDGE_PLAYER_CLIENTS}},
+        'socket_timeout': deadline.SOCKET_TIMEOUT,
+        'cachedir': player_cache.PLAYER_CACHE_DIR,
+    },
+    # Video metadata only: the web client's embedded player response is used as is, without
+    # API calls, player JS or signature deciphering; missing formats are not an error
+    'metadata': {
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+        'noplaylist': True,
+        'ignore_no_formats_error': True,
+        'extractor_args': {'youtube': {'player_client': ['web'], 'player_skip': ['js', 'configs']}},
+        'socket_timeout': deadline.SOCKET_TIMEOUT,
+        'cachedir': player_cache.PLAYER_CACHE_DIR,
+    },
+    # Free-text search resolved to the first result's audio stream
+    'search': {
+        'quiet': True,
+        'format': 'bestaudio[ext=m4a]/bestaudio/best',
+        'default_search': 'ytsearch1',
+        'noplaylist': True,
+        'skip_download': True,
+        'socket_timeout': deadline.SOCKET_TIMEOUT,
+        'cachedir': player_cache.PLAYER_CACHE_DIR,
+    },
+}
+
+
+class _PooledExtractor:
+    """A YoutubeDL instance together with its usage bookkeeping."""
+
+    def __init__(self, profile, ydl):
+        self.profile = profile
+        self.ydl = ydl
+        self.created_at = time.monotonic()
+        self.uses = 0
+
+
+class YoutubeDLPool:
+    """
+    Thread-safe pool of long-lived YoutubeDL instances keyed by option profile.
+
+    A YoutubeDL instance is not safe for concurrent use, so each borrower gets
+    exclusive use of one instance. Keeping instances alive preserves yt-dlp's
+    initialized extractors, cookie jar, HTTP connections and per-instance
+    player caches between requests. Instances are recycled after max_uses
+    extractions or max_age seconds, and discarded after unexpected errors.
+    """
+
+    def __init__(self, profiles=None, max_size=4, max_uses=200, max_age=1800, borrow_timeout=30):
+        """
+        Args:
+            profiles (dict, optional): Profile name to yt-dlp options; defaults to PROFILES
+            max_size (int): Maximum instances per profile
+            max_uses (int): Extractions after which an instance is recycled
+            max_age (int): Seconds after which an instance is recycled
+            borrow_timeout (float): Seconds to wait for a free instance
+        """
+        self.profiles = profiles if profiles is not None else PROFILES
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.borrow_timeout = borrow_timeout
+
+        self._cond = threading.Condition()
+        self._idle = {name: [] for name in self.profiles}
+        self._total = {name: 0 for name in self.profiles}
+
+        self.created = 0
+        self.recycled = 0
+        self.discarded = 0
+        self.waits = 0
+
+    @contextmanager
+    def borrow(self, profile):
+        """
+        Borrow an instance for exclusive use for the duration of the block.
+
+        Args:
+            profile (str): Name of the option profile
+
+        Yields:
+            yt_dlp.YoutubeDL: A ready-to-use instance
+
+        Raises:
+            KeyError: If the profile is unknown
+            TimeoutError: If no instance became free within borrow_timeout
+        """
+        if profile not in self.profiles:
+            raise KeyError(f"Unknown yt-dlp profile: {profile}")
+        import yt_dlp
+
+        item = self._acquire(profile)
+        # Only retry failed extractor requests as often as the caller's deadline allows
+        item.ydl.params['extractor_retries'] = deadline.retries(self.profiles[profile].get('extractor_retries', 3))
+        healthy = True
+        try:
+            yield item.ydl
+        except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError, deadline.DeadlineExceeded):
+            # Unavailable videos, missing formats and abandoned requests do not say anything about the instance
+            raise
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            item.uses += 1
+            self._release(item, healthy)
+
+    def _acquire(self, profile):
+        wait_until = time.monotonic() + deadline.timeout(self.borrow_timeout)
+        with self._cond:
+            while True:
+                idle = self._idle[profile]
+                while idle:
+                    item = idle.pop()
+                    if self._is_healthy(item):
+                        return item
+                    self._total[profile] -= 1
+                    self.recycled += 1
+                    self._close(item)
+
+                if self._total[profile] < self.max_size:
+                    # Reserve the slot; the instance is built outside the lock
+                    self._total[profile] += 1
+                    break
+
+                self.waits += 1
+                remaining = wait_until - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle[profile] and self._total[profile] >= self.max_size:
+                        raise TimeoutError(f"No yt-dlp instance available for profile '{profile}'")
+
+        try:
+            return self._create(profile)
+        except Exception:
+            with self._cond:
+                self._total[profile] -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, item, healthy):
+        with self._cond:
+            if healthy and self._is_healthy(item):
+                self._idle[item.profile].append(item)
+            else:
+                self._total[item.profile] -= 1
+                if healthy:
+                    self.recycled += 1
+                else:
+                    self.discarded += 1
+                self._close(item)
+            self._cond.notify()
+
+    def _is_healthy(self, item):
+        if item.uses >= self.max_uses:
+            return False
+        return time.monotonic() - item.created_at < self.max_age
+
+    def _create(self, profile):
+        # Imported on first use rather than at startup; yt-dlp loads thousands of extractor classes
+        import yt_dlp
+
+        with metrics.timed('ydl_construct'):
+            ydl = yt_dlp.YoutubeDL(dict(self.profiles[profile]))
+            player_cache.instrument(ydl)
+            deadline.instrument(ydl)
+        with self._cond:
+            self.created += 1
+        return _PooledExtractor(profile, ydl)
+
+    @staticmethod
+    def _close(item):
+        try:
+            item.ydl.close()
+        except Exception as e:
+            logger.warning(f"Error closing yt-dlp instance: {str(e)}")
+
+    def warm(self, profiles=None, count=1):
+        """
+        Create instances ahead of the first request.
+
+        Args:
+            profiles (list, optional): Profiles to warm; defaults to all profiles
+            count (int): Idle instances to ensure per profile
+        """
+        for profile in profiles or list(self.profiles):
+            with self._cond:
+                missing = min(count, self.max_size) - len(self._idle[profile])
+                missing = min(missing, self.max_size - self._total[profile])
+                if missing <= 0:
+                    continue
+                self._total[profile] += missing
+            for _ in range(missing):
+                try:
+                    item = self._create(profile)
+                except Exception as e:
+                    logger.error(f"Error warming yt-dlp profile '{profile}': {str(e)}")
+                    with self._cond:
+                        self._total[profile] -= 1
+                    continue
+                with self._cond:
+                    self._idle[profile].append(item)
+                    self._cond.notify()
+
+    def connect(self, urls):
+        """
+        Open HTTP connections from every idle instance, so that the first
+        extraction of each reuses a connection instead of resolving the host
+        and doing a TLS handshake.
+
+        Args:
+            urls (list): URLs to request with HEAD; one per host is enough
+
+        Returns:
+            int: Number of successful requests
+        """
+        from yt_dlp.networking import HEADRequest
+
+        with self._cond:
+            items = [item for idle in self._idle.values() for item in idle]
+            for idle in self._idle.values():
+                idle.clear()
+        connected = 0
+        try:
+            for item in items:
+                for url in urls:
+                    try:
+                        # Reading the empty body hands the connection back to the instance's pool
+                        item.ydl.urlopen(HEADRequest(url)).read()
+                        connected += 1
+                    except Exception as e:
+                        logger.warning(f"Error connecting to {url}: {str(e)}")
+        finally:
+            with self._cond:
+                for item in items:
+                    self._idle[item.profile].append(item)
+                self._cond.notify_all()
+        return connected
+
+    def close(self):
+        """Close all idle instances."""
+        with self._cond:
+            for profile, idle in self._idle.items():
+                for item in idle:
+                    self._close(item)
+                self._total[profile] -= len(idle)
+                idle.clear()
+
+    def stats(self):
+        """
+        Get pool counters.
+
+        Returns:
+            dict: Instances per profile and lifecycle counters
+        """
+        with self._cond:
+            return {
+                "profiles": {
+                    name: {"idle": len(self._idle[name]), "total": self._total[name]}
+                    for name in self.profiles
+                },
+                "created": self.created,
+                "recycled": self.recycled,
+                "discarded": self.discarded,
+                "waits": self.waits,
+            }
@@ -1,17 +1,177 @@
-import yt_dlp
+import importlib
+import os
 import re
-from datetime import datetime, timedelta
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, TimeoutError as FuturesTimeoutError
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
 import logging
-from youtubesearchpython import VideosSearch
-import json
+
+from app.services import deadline, metrics, normalize, player_cache, startup
+from app.services.cache import create_cache
+from app.services.hedging import Hedger
+from app.services.mapping_store import create_mapping_store
+from app.services.matching import MATCH_WEIGHTS, MatchQuery, MatchScorer, parse_weights
+from app.services.refresh import RefreshAheadScheduler
+from app.services.scheduler import ExtractionScheduler, current_priority, extraction_priority, with_priority
+from app.services.singleflight import SingleFlight
+from app.services.ydl_pool import YoutubeDLPool
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Stream URL cache settings
+STREAM_CACHE_SIZE = int(os.environ.get('YTUNE_STREAM_CACHE_SIZE', 512))
+# Seconds before the googlevideo expiry at which a cached URL is considered stale
+STREAM_URL_SAFETY_MARGIN = int(os.environ.get('YTUNE_STREAM_URL_SAFETY_MARGIN', 600))
+# Used when the stream URL carries no expire parameter (YouTube URLs typically expire in 6 hours)
+DEFAULT_STREAM_URL_LIFETIME = 6 * 3600
+
+_VIDEO_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+_EXPIRE_RE = re.compile(r'[?&/]expire[=/](\d+)')
+
+# Search and song info cache settings
+SEARCH_CACHE_SIZE = int(os.environ.get('YTUNE_SEARCH_CACHE_SIZE', 2048))
+# Song-to-video matches are stable, so they are kept for a week
+SEARCH_CACHE_TTL = int(os.environ.get('YTUNE_SEARCH_CACHE_TTL', 7 * 24 * 3600))
+# "No videos found" results are cached for a shorter time
+SEARCH_NEGATIVE_CACHE_TTL = int(os.environ.get('YTUNE_SEARCH_NEGATIVE_CACHE_TTL', 15 * 60))
+SONG_INFO_CACHE_SIZE = int(os.environ.get('YTUNE_SONG_INFO_CACHE_SIZE', 1024))
+# Video metadata rarely changes, so it is kept for a week
+SONG_INFO_CACHE_TTL = int(os.environ.get('YTUNE_SONG_INFO_CACHE_TTL', 7 * 24 * 3600))
+# Fields returned by get_song_info
+SONG_INFO_FIELDS = ('title', 'duration', 'thumbnail', 'uploader', 'view_count', 'upload_date', 'description')
+
+_stream_cache = create_cache('stream', max_entries=STREAM_CACHE_SIZE)
+_search_cache = create_cache('search', max_entries=SEARCH_CACHE_SIZE)
+_song_info_cache = create_cache('song_info', max_entries=SONG_INFO_CACHE_SIZE)
+
+# How the fallback search is issued: "sequential" (only if the primary search
+# finds nothing), "parallel" (always, concurrently) or "hedged" (concurrently,
+# if the primary search has not returned after SEARCH_HEDGE_DELAY seconds)
+SEARCH_MODE = os.environ.get('YTUNE_SEARCH_MODE', 'sequential').lower()
+SEARCH_HEDGE_DELAY = float(os.environ.get('YTUNE_SEARCH_HEDGE_DELAY', 0.8))
+# Upper bound for a single youtube-search-python request; youtube-search-python has no timeout by default
+SEARCH_TIMEOUT = float(os.environ.get('YTUNE_SEARCH_TIMEOUT', 8))
+SEARCH_WORKERS = int(os.environ.get('YTUNE_SEARCH_WORKERS', 8))
+
+_search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix='search')
+
+# youtubesearchpython.VideosSearch, imported on first use; importing it also loads yt-dlp's YouTube extractor
+VideosSearch = None
+
+
+def _videos_search():
+    global VideosSearch
+    if VideosSearch is None:
+        from youtubesearchpython import VideosSearch as videos_search
+        VideosSearch = videos_search
+    return VideosSearch
+
+# Durable (title, artist) -> video mappings; matches scoring at least
+# MAPPING_MIN_SCORE are recorded and consulted before searching
+MAPPING_MIN_SCORE = int(os.environ.get('YTUNE_MAPPING_MIN_SCORE', 10))
+
+_mapping_store = create_mapping_store()
+
+_match_scorer = MatchScorer(weights=parse_weights(MATCH_WEIGHTS))
+
+# Concurrent misses for the same key share one upstream call; when the caller running it runs out of
+# time or is cancelled, the others carry on under their own deadlines instead of failing with it
+_stream_flight = SingleFlight(wait_timeout=deadline.remaining, retry=deadline.is_deadline_error)
+_search_flight = SingleFlight(wait_timeout=deadline.remaining, retry=deadline.is_deadline_error)
+_song_info_flight = SingleFlight(wait_timeout=deadline.remaining, retry=deadline.is_deadline_error)
+
+# Extraction scheduling; batch and background limits stay below the slot count to keep room for interactive requests
+EXTRACTION_SLOTS = int(os.environ.get('YTUNE_EXTRACTION_SLOTS', 6))
+EXTRACTION_BATCH_LIMIT = int(os.environ.get('YTUNE_EXTRACTION_BATCH_LIMIT', 3))
+EXTRACTION_BACKGROUND_LIMIT = int(os.environ.get('YTUNE_EXTRACTION_BACKGROUND_LIMIT', 1))
+EXTRACTION_AGING = float(os.environ.get('YTUNE_EXTRACTION_AGING', 15))
+EXTRACTION_QUEUE_TIMEOUT = float(os.environ.get('YTUNE_EXTRACTION_QUEUE_TIMEOUT', 30))
+
+_scheduler = ExtractionScheduler(
+    slots=EXTRACTION_SLOTS,
+    limits={'batch': EXTRACTION_BATCH_LIMIT, 'background': EXTRACTION_BACKGROUND_LIMIT},
+    aging=EXTRACTION_AGING,
+    timeout=EXTRACTION_QUEUE_TIMEOUT,
+)
+
+# Pooled yt-dlp instances; every extraction slot gets an instance of each profile, because borrowing
+# one does not respect priorities and an interactive extraction must not wait behind batch or background work
+YDL_POOL_SIZE = max(int(os.environ.get('YTUNE_YDL_POOL_SIZE', 6)), EXTRACTION_SLOTS)
+YDL_POOL_MAX_USES = int(os.environ.get('YTUNE_YDL_POOL_MAX_USES', 200))
+YDL_POOL_MAX_AGE = int(os.environ.get('YTUNE_YDL_POOL_MAX_AGE', 1800))
+
+_ydl_pool = YoutubeDLPool(max_size=YDL_POOL_SIZE, max_uses=YDL_POOL_MAX_USES, max_age=YDL_POOL_MAX_AGE)
+
+# Hedged stream extraction: a slow extraction is raced against one through other player clients
+EXTRACTION_HEDGE_ENABLED = os.environ.get('YTUNE_EXTRACTION_HEDGE', '0') == '1'
+# Seconds before the hedge is started; 0 uses the 90th percentile of recent extraction times
+EXTRACTION_HEDGE_DELAY = float(os.environ.get('YTUNE_EXTRACTION_HEDGE_DELAY', 0))
+# Maximum share of extra extractions caused by hedging
+EXTRACTION_HEDGE_BUDGET = float(os.environ.get('YTUNE_EXTRACTION_HEDGE_BUDGET', 0.1))
+
+# Threads mostly wait for extraction slots, so there are more of them than slots
+_extraction_hedger = Hedger(
+    workers=EXTRACTION_SLOTS * 4,
+    delay=EXTRACTION_HEDGE_DELAY,
+    budget=EXTRACTION_HEDGE_BUDGET,
+)
+
+# Highest bitrate in kbps chosen for clients that ask to save data
+DATA_SAVER_BITRATE = float(os.environ.get('YTUNE_DATA_SAVER_BITRATE', 70))
+# Codec names clients may use for the codec families yt-dlp reports
+CODEC_ALIASES = {'aac': 'mp4a', 'm4a': 'mp4a', 'webm': 'opus'}
+
+# Batch stream resolution settings
+BATCH_WORKERS = int(os.environ.get('YTUNE_BATCH_WORKERS', 4))
+BATCH_MAX_ITEMS = int(os.environ.get('YTUNE_BATCH_MAX_ITEMS', 50))
+BATCH_ITEM_TIMEOUT = float(os.environ.get('YTUNE_BATCH_ITEM_TIMEOUT', 20))
+
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='stream-batch')
+
+# Refresh-ahead settings for hot stream URLs
+REFRESH_AHEAD_ENABLED = os.environ.get('YTUNE_REFRESH_AHEAD', '1') == '1'
+REFRESH_AHEAD_FRACTION = float(os.environ.get('YTUNE_REFRESH_AHEAD_FRACTION', 0.2))
+REFRESH_AHEAD_MIN_HITS = int(os.environ.get('YTUNE_REFRESH_AHEAD_MIN_HITS', 3))
+REFRESH_AHEAD_WINDOW = int(os.environ.get('YTUNE_REFRESH_AHEAD_WINDOW', 600))
+REFRESH_AHEAD_MAX_CONCURRENT = int(os.environ.get('YTUNE_REFRESH_AHEAD_MAX_CONCURRENT', 2))
+REFRESH_AHEAD_MAX_PER_MINUTE = int(os.environ.get('YTUNE_REFRESH_AHEAD_MAX_PER_MINUTE', 30))
+
+_stream_refresher = RefreshAheadScheduler(
+    lambda url, cache_key: with_priority('background', YouTubeService._fetch_stream, cache_key, url),
+    refresh_fraction=REFRESH_AHEAD_FRACTION,
+    min_hits=REFRESH_AHEAD_MIN_HITS,
+    hit_window=REFRESH_AHEAD_WINDOW,
+    max_concurrent=REFRESH_AHEAD_MAX_CONCURRENT,
+    max_per_minute=REFRESH_AHEAD_MAX_PER_MINUTE,
+)
+
 class YouTubeService:
     """Service for handling YouTube search and streaming operations."""
     
+    @staticmethod
+    def _error_payload(action, error):
+        """
+        Log a failed operation and turn it into an error payload.
+        
+        Args:
+            action (str): What failed, e.g. "getting stream URL"
+            error (Exception): The exception raised
+            
+        Returns:
+            dict: Error payload; DEADLINE_ERROR if the work was abandoned for lack of time
+        """
+        metrics.count_error(action, error)
+        left = deadline.remaining()
+        if deadline.is_deadline_error(error) or \
+                (isinstance(error, TimeoutError) and left is not None and left <= 0):
+            logger.warning(f"Gave up {action}: {str(error)}")
+            return {"error": deadline.DEADLINE_ERROR}
+        logger.error(f"Error {action}: {str(error)}")
+        return {"error": f"Error {action}: {str(error)}"}
+    
     @staticmethod
     def search_song(title, artist, duration=None):
         """
@@ -26,44 +186,168 @@ class YouTubeService:
             dict: Information about the best matching video
         """
         try:
-            # Create search query by combining title and artist
-            query = f"{title} {artist} official audio"
+            cache_key = normalize.search_key(title, artist, duration)
+            cached = _search_cache.get(cache_key)
+            if cached:
+                return dict(cached)
             
-            # Use youtubesearchpython to search for videos
-            search = VideosSearch(query, limit=5)
-            results = search.result()['result']
+            result = _search_flight.do(cache_key, YouTubeService._search, title, artist, duration, cache_key)
+            return dict(result)
             
+        except Exception as e:
+            return YouTubeService._error_payload("searching for song", e)
+    
+    @staticmethod
+    def _search(title, artist, duration, cache_key):
+        """
+        Run the YouTube searches for a song and cache the best match.
+        
+        Args:
+            title (str): The song title
+            artist (str): The artist name
+            duration (int, optional): The expected duration in seconds
+            cache_key (str): Key under which the match is cached
+            
+        Returns:
+            dict: Information about the best matching video, or an error
+        """
+        # A previously recorded confident match saves both searches
+        if _mapping_store is not None:
+            try:
+                mapped = _mapping_store.lookup(title, artist, duration)
+            except Exception as e:
+                logger.error(f"Error reading song mappings: {str(e)}")
+                mapped = None
+            if mapped:
+                _search_cache.set(cache_key, mapped, SEARCH_CACHE_TTL)
+                return mapped
+        
+        # Create search queries by combining title and artist
+        primary_query = f"{title} {artist} official audio"
+        fallback_query = f"{title} {artist}"
+        
+        deadline.check("search")
+        if SEARCH_MODE == 'parallel':
+            results = YouTubeService._search_concurrently(primary_query, fallback_query, hedge_delay=0)
+        elif SEARCH_MODE == 'hedged':
+            results = YouTubeService._search_concurrently(primary_query, fallback_query, hedge_delay=SEARCH_HEDGE_DELAY)
+        else:
+            results = YouTubeService._run_search_query(primary_query, deadline.timeout(SEARCH_TIMEOUT))
             if not results:
-                # Try a more generic search if no results found
-                query = f"{title} {artist}"
-                search = VideosSearch(query, limit=5)
-                results = search.result()['result']
-                
-                if not results:
-                    return {"error": "No videos found for the given song"}
+                # Try a more generic search if no results found; raising instead of
+                # skipping it keeps a cut-short search out of the negative cache
+                deadline.check("fallback search")
+                results = YouTubeService._run_search_query(fallback_query, deadline.timeout(SEARCH_TIMEOUT),
+                                                           stage='fallback_query')
+        
+        if not results:
+            result = {"error": "No videos found for the given song"}
+            _search_cache.set(cache_key, result, SEARCH_NEGATIVE_CACHE_TTL)
+            return result
+        
+        # Filter and score results to find the best match
+        with metrics.timed('scoring'):
+            scored_results = YouTubeService._rank_matches(results, title, artist, duration)
+        
+        if not scored_results:
+            result = {"error": "No suitable match found"}
+            _search_cache.set(cache_key, result, SEARCH_NEGATIVE_CACHE_TTL)
+            return result
+        
+        score, best_match = scored_results[0]
+        result = {
+            "video_id": best_match["id"],
+            "title": best_match["title"],
+            "url": f"https://www.youtube.com/watch?v={best_match['id']}",
+            "thumbnail": best_match.get("thumbnails", [{}])[0].get("url", ""),
+            "duration": best_match.get("duration", {})
+        }
+        _search_cache.set(cache_key, result, SEARCH_CACHE_TTL)
+        
+        if _mapping_store is not None and score >= MAPPING_MIN_SCORE:
+            try:
+                _mapping_store.record(title, artist, duration, result, score)
+            except Exception as e:
+                logger.error(f"Error recording song mapping: {str(e)}")
+        
+        return result
+    
+    @staticmethod
+    def _run_search_query(query, timeout=SEARCH_TIMEOUT, stage='search_query'):
+        """
+        Run a single YouTube search.
+        
+        Args:
+            query (str): Search text
+            timeout (float): Seconds the search request may take
+            stage (str): Stage the search is timed as
             
-            # Filter and score results to find the best match
-            best_match = YouTubeService._find_best_match(results, title, artist, duration)
+        Returns:
+            list: Search results
+        """
+        # Use youtubesearchpython to search for videos
+        with metrics.timed(stage):
+            search = _videos_search()(query, limit=5, timeout=timeout)
+            return search.result()['result']
+    
+    @staticmethod
+    def _search_concurrently(primary_query, fallback_query, hedge_delay=0):
+        """
+        Run the primary and fallback searches concurrently and merge their results.
+        
+        With a hedge_delay the fallback search only starts if the primary
+        search has not returned results within that many seconds.
+        
+        Args:
+            primary_query (str): The preferred search text
+            fallback_query (str): The more generic search text
+            hedge_delay (float): Seconds to wait before starting the fallback search
             
-            if not best_match:
-                return {"error": "No suitable match found"}
-                
-            return {
-                "video_id": best_match["id"],
-                "title": best_match["title"],
-                "url": f"https://www.youtube.com/watch?v={best_match['id']}",
-                "thumbnail": best_match.get("thumbnails", [{}])[0].get("url", ""),
-                "duration": best_match.get("duration", {})
-            }
+        Returns:
+            list: Results of both searches, de-duplicated by video ID
             
-        except Exception as e:
-            logger.error(f"Error searching for song: {str(e)}")
-            return {"error": f"Error searching for song: {str(e)}"}
+        Raises:
+            Exception: The error of a failed search, like the sequential search
+        """
+        # The executor threads do not see the request deadline, so timeouts are passed explicitly
+        primary = _search_executor.submit(YouTubeService._run_search_query, primary_query,
+                                          deadline.timeout(SEARCH_TIMEOUT))
+        
+        if hedge_delay > 0:
+            done, _ = wait([primary], timeout=deadline.timeout(hedge_delay))
+            if done and primary.exception():
+                raise primary.exception()
+            if done and primary.result():
+                return primary.result()
+            deadline.check("fallback search")
+        
+        fallback = _search_executor.submit(YouTubeService._run_search_query, fallback_query,
+                                           deadline.timeout(SEARCH_TIMEOUT), 'fallback_query')
+        done, pending = wait([primary, fallback], timeout=deadline.remaining())
+        
+        # A failed search might have found the song, so the other one's results are not enough to
+        # answer, and an empty merge must not be cached as "no videos found"
+        for future in (primary, fallback):
+            if future in done and future.exception():
+                raise future.exception()
+        
+        results = [future.result() for future in (primary, fallback) if future in done]
+        if pending and not any(results):
+            # An unfinished search must not be mistaken for one that found nothing
+            raise deadline.DeadlineExceeded(f"{deadline.DEADLINE_ERROR} during search")
+        
+        merged, seen = [], set()
+        for videos in results:
+            for video in videos:
+                if video.get("id") not in seen:
+                    seen.add(video.get("id"))
+                    merged.append(video)
+        return merged
     
     @staticmethod
-    def _find_best_match(results, title, artist, target_duration=None):
+    def _rank_matches(results, title, artist, target_duration=None):
         """
-        Find the best matching video from search results.
+        Score search results against the requested song.
         
         Args:
             results (list): List of search results
@@ -72,186 +356,698 @@ class YouTubeService:
             target_duration (int, optional): The expected duration in seconds
             
         Returns:
-            dict: The best matching video information
+            list: (score, video) tuples, highest score first
+        """
+        return _match_scorer.rank(MatchQuery(title, artist, target_duration), results)
+    
+    @staticmethod
+    def rank_many(pairs):
         """
-        # Convert target duration to seconds if provided
-        if target_duration and isinstance(target_duration, str):
-            # If it's in MM:SS format
-            if ":" in target_duration:
-                parts = target_duration.split(":")
-                target_duration = int(parts[0]) * 60 + int(parts[1])
-            else:
-                target_duration = int(target_duration)
+        Score search results for many songs in one call, e.g. to match a playlist.
         
-        # Normalize strings for comparison
-        title_lower = title.lower()
-        artist_lower = artist.lower()
+        Args:
+            pairs (list): ((title, artist, duration), results) tuples
+            
+        Returns:
+            list: One list of (score, video) tuples per pair, highest score first
+        """
+        return _match_scorer.rank_many(pairs)
+    
+    @staticmethod
+    def resolve_song(title, artist, duration=None, fields=None, hints=None):
+        """
+        Find a song and resolve its stream URL and metadata in one call.
         
-        scored_results = []
+        A stream resolution caches the video's song info as a side effect,
+        so an uncached song costs one search and a single extraction.
         
-        for video in results:
-            score = 0
-            video_title = video.get("title", "").lower()
+        Args:
+            title (str): The song title
+            artist (str): The artist name
+            duration (int, optional): The expected duration in seconds
+            fields (list, optional): Subset of SONG_INFO_FIELDS to return in song_info
+            hints (dict, optional): Format selection hints, see select_format
             
-            # Check if both title and artist are in the video title
-            if title_lower in video_title and artist_lower in video_title:
-                score += 10
-            elif title_lower in video_title:
-                score += 5
-            elif artist_lower in video_title:
-                score += 3
-                
-            # Prefer official content
-            if "official" in video_title or "official" in video.get("descriptionSnippet", "").lower():
-                score += 3
-                
-            # Prefer audio content
-            if "audio" in video_title:
-                score += 2
-                
-            # Avoid live versions, remixes, covers unless specifically requested
-            if "live" in video_title and "live" not in title_lower:
-                score -= 5
-            if "remix" in video_title and "remix" not in title_lower:
-                score -= 3
-            if "cover" in video_title and "cover" not in title_lower:
-                score -= 3
-                
-            # Check duration if target_duration is provided
-            if target_duration and video.get("duration"):
-                # Convert video duration to seconds
-                duration_str = video.get("duration")
-                if duration_str:
-                    try:
-                        # Handle MM:SS format
-                        if ":" in duration_str:
-                            parts = duration_str.split(":")
-                            if len(parts) == 2:  # MM:SS
-                                video_duration = int(parts[0]) * 60 + int(parts[1])
-                            elif len(parts) == 3:  # HH:MM:SS
-                                video_duration = int(parts[0]) * 3600 + int(parts[1]) * 60 + int(parts[2])
-                            else:
-                                video_duration = 0
-                                
-                            # Calculate duration difference and adjust score
-                            duration_diff = abs(video_duration - target_duration)
-                            if duration_diff < 10:  # Within 10 seconds
-                                score += 5
-                            elif duration_diff < 30:  # Within 30 seconds
-                                score += 3
-                            elif duration_diff > 120:  # More than 2 minutes difference
-                                score -= 5
-                    except (ValueError, IndexError):
-                        pass
-            
-            # Check the channel/uploader
-            if video.get("channel", {}).get("name", "").lower() == artist_lower:
-                score += 5
-                
-            scored_results.append((score, video))
+        Returns:
+            dict: The search match, stream payload and song info, or an error
+        """
+        match = YouTubeService.search_song(title, artist, duration)
+        if "error" in match:
+            return match
+        
+        stream = YouTubeService.get_stream_url(video_id=match["video_id"], hints=hints)
+        if "error" in stream:
+            return {"error": stream["error"], "match": match}
+        
+        song_info = YouTubeService.get_song_info(match["video_id"], fields)
+        if "error" in song_info:
+            # The stream is usable without metadata
+            logger.warning(f"Song info for {match['video_id']} unavailable: {song_info['error']}")
+            song_info = None
+        
+        return {"match": match, "stream": stream, "song_info": song_info}
+    
+    @staticmethod
+    def extract_video_id(youtube_url):
+        """
+        Extract the video ID from a YouTube URL.
+        
+        Args:
+            youtube_url (str): Full YouTube URL (watch, youtu.be, shorts, embed or music links)
+            
+        Returns:
+            str: The video ID, or None if it cannot be determined
+        """
+        if not youtube_url:
+            return None
+        if _VIDEO_ID_RE.match(youtube_url):
+            return youtube_url
+        
+        parsed = urlparse(youtube_url if '//' in youtube_url else f"https://{youtube_url}")
+        host = (parsed.hostname or '').lower()
+        
+        if host.endswith('youtu.be'):
+            candidate = parsed.path.lstrip('/').split('/')[0]
+        elif host.endswith('youtube.com') or host.endswith('youtube-nocookie.com'):
+            candidate = parse_qs(parsed.query).get('v', [''])[0]
+            if not candidate:
+                parts = [p for p in parsed.path.split('/') if p]
+                if len(parts) >= 2 and parts[0] in ('shorts', 'embed', 'live', 'v', 'e'):
+                    candidate = parts[1]
+        else:
+            return None
         
-        # Sort by score (highest first)
-        scored_results.sort(key=lambda x: x[0], reverse=True)
+        return candidate if _VIDEO_ID_RE.match(candidate or '') else None
+    
+    @staticmethod
+    def _stream_url_expiry(stream_url):
+        """
+        Get the expiry of a googlevideo URL from its expire parameter.
         
-        # Return the highest scored result, or None if no results
-        return scored_results[0][1] if scored_results else None
+        Args:
+            stream_url (str): Direct stream URL
+            
+        Returns:
+            float: Expiry as a UNIX timestamp
+        """
+        match = _EXPIRE_RE.search(stream_url or '')
+        if match:
+            return float(match.group(1))
+        return time.time() + DEFAULT_STREAM_URL_LIFETIME
     
     @staticmethod
-    def get_stream_url(video_id=None, youtube_url=None):
+    def get_stream_url(video_id=None, youtube_url=None, hints=None):
         """
         Extract direct audio stream URL from YouTube video.
         
+        Resolved URLs are cached per video ID until shortly before they expire.
+        All audio formats are kept, so any selection is served from the cache.
+        
         Args:
             video_id (str, optional): YouTube video ID
             youtube_url (str, optional): Full YouTube URL
+            hints (dict, optional): Format selection hints, see select_format
+            
+        Returns:
+            dict: Stream URL of the selected format, the ranked formats and expiration information
+        """
+        if not video_id and not youtube_url:
+            return {"error": "Either video_id or youtube_url must be provided"}
+        
+        cache_key, url = YouTubeService._stream_target(video_id, youtube_url)
+        cached = YouTubeService._cached_stream(cache_key, url)
+        if cached:
+            return YouTubeService.select_format(cached, hints)
+        
+        return YouTubeService.select_format(YouTubeService._fetch_stream(cache_key, url), hints)
+    
+    @staticmethod
+    def refresh_stream_url(video_id):
+        """
+        Drop the cached stream URL of a video and resolve it again.
+        
+        Used when a cached URL stopped working before its expected expiry.
+        
+        Args:
+            video_id (str): YouTube video ID
             
         Returns:
             dict: Stream URL and expiration information
         """
+        cache_key, url = YouTubeService._stream_target(video_id)
         try:
+            _stream_cache.delete(cache_key)
+        except Exception as e:
+            logger.error(f"Error invalidating stream URL cache: {str(e)}")
+        return YouTubeService._fetch_stream(cache_key, url)
+    
+    @staticmethod
+    def get_cached_stream_url(video_id=None, youtube_url=None, hints=None):
+        """
+        Get a stream URL only if it is already cached.
+        
+        Args:
+            video_id (str, optional): YouTube video ID
+            youtube_url (str, optional): Full YouTube URL
+            hints (dict, optional): Format selection hints, see select_format
+            
+        Returns:
+            dict: Cached stream URL and expiration information, or None
+        """
+        if not video_id and not youtube_url:
+            return None
+        cached = YouTubeService._cached_stream(*YouTubeService._stream_target(video_id, youtube_url))
+        return YouTubeService.select_format(cached, hints) if cached else None
+    
+    @staticmethod
+    def select_format(payload, hints=None):
+        """
+        Pick the format a client should play from a stream payload.
+        
+        Formats in other codecs than the accepted ones are left out. Of the
+        rest, the best one within the bitrate limit is selected, or the
+        smallest one if none is within it. Without hints the best format is
+        selected.
+        
+        Args:
+            payload (dict): Stream payload with ranked formats, or an error
+            hints (dict, optional): "codecs" (accepted codec names, e.g. ["opus", "aac"]),
+                "max_bitrate" (kbps) and "data_saver" (caps the bitrate at DATA_SAVER_BITRATE)
+            
+        Returns:
+            dict: Payload describing the selected format, with the remaining formats ranked
+        """
+        if "error" in payload:
+            return payload
+        hints = hints or {}
+        # Entries cached before formats were kept only describe the best format
+        formats = payload.get("formats") or [{
+            "format_id": payload.get("format_id"), "format": payload.get("format"), "codec": None,
+            "container": None, "abr": payload.get("bitrate"), "filesize": None, "url": payload["stream_url"],
+        }]
+        
+        if hints.get("codecs"):
+            accepted = {CODEC_ALIASES.get(codec, codec) for codec in hints["codecs"]}
+            formats = [f for f in formats if (f["codec"] or '').split('.')[0] in accepted]
+            if not formats:
+                return {"error": "No audio format matches the accepted codecs"}
+        
+        max_bitrate = hints.get("max_bitrate")
+        if hints.get("data_saver"):
+            max_bitrate = min(max_bitrate or DATA_SAVER_BITRATE, DATA_SAVER_BITRATE)
+        
+        selected = formats[0]
+        if max_bitrate:
+            within = [f for f in formats if (f["abr"] or 0) <= max_bitrate]
+            # Formats are ranked best first, so the last one is the smallest
+            selected = within[0] if within else formats[-1]
+        
+        return {
+            **payload,
+            "stream_url": selected["url"],
+            "format": selected["format"],
+            "bitrate": selected["abr"] or 0,
+            "format_id": selected["format_id"],
+            "formats": formats,
+        }
+    
+    @staticmethod
+    def get_stream_urls(items, item_timeout=None, hints=None):
+        """
+        Resolve stream URLs for many videos in parallel.
+        
+        Cached URLs are yielded immediately; the rest are resolved on a bounded
+        thread pool and yielded as they complete. Items that do not finish
+        within item_timeout seconds of the call are reported as timed out.
+        
+        Args:
+            items (list): Dicts with a video_id or youtube_url key
+            item_timeout (float, optional): Per-item deadline in seconds, capped at BATCH_ITEM_TIMEOUT
+            hints (dict, optional): Format selection hints applied to every item, see select_format
+            
+        Yields:
+            tuple: (index, result) where result is a stream payload or an error
+        """
+        batch_deadline = time.monotonic() + min(item_timeout or BATCH_ITEM_TIMEOUT, BATCH_ITEM_TIMEOUT)
+        if deadline.current() is not None:
+            batch_deadline = min(batch_deadline, deadline.current())
+        pending = {}
+        
+        for index, item in enumerate(items):
+            video_id, youtube_url = item.get('video_id'), item.get('youtube_url')
             if not video_id and not youtube_url:
-                return {"error": "Either video_id or youtube_url must be provided"}
-                
-            url = youtube_url if youtube_url else f"https://www.youtube.com/watch?v={video_id}"
-            
-            # Configure yt-dlp options
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'quiet': True,
-                'no_warnings': True,
-                'skip_download': True,
-                'noplaylist': True,
-            }
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                
-                if not info:
-                    return {"error": "Could not extract video information"}
-                
-                # Get the best audio format
-                formats = info.get('formats', [])
-                audio_formats = [f for f in formats if f.get('acodec') != 'none' and (f.get('vcodec') == 'none' or f.get('vcodec') is None)]
-                
-                if not audio_formats:
-                    return {"error": "No audio format found"}
-                
-                # Sort by quality (bitrate)
-                audio_formats.sort(key=lambda x: x.get('abr', 0) if x.get('abr') else 0, reverse=True)
-                best_audio = audio_formats[0]
-                
-                # Estimate expiration time (YouTube URLs typically expire in 6 hours)
-                expires_at = (datetime.now() + timedelta(hours=6)).isoformat()
+                yield index, {"error": "Either video_id or youtube_url must be provided"}
+                continue
+            
+            cache_key, url = YouTubeService._stream_target(video_id, youtube_url)
+            cached = YouTubeService._cached_stream(cache_key, url)
+            if cached:
+                yield index, YouTubeService.select_format(cached, hints)
+                continue
+            
+            future = _batch_executor.submit(with_priority, 'batch', deadline.call_before, batch_deadline,
+                                            YouTubeService._fetch_stream, cache_key, url)
+            pending[future] = index
+        
+        try:
+            for future in as_completed(pending, timeout=max(batch_deadline - time.monotonic(), 0)):
+                yield pending.pop(future), YouTubeService.select_format(future.result(), hints)
+        except FuturesTimeoutError:
+            for future, index in pending.items():
+                # Items still queued are dropped; running ones finish and populate the cache
+                future.cancel()
+                yield index, {"error": "Timed out resolving stream URL"}
+    
+    @staticmethod
+    def _stream_target(video_id=None, youtube_url=None):
+        """
+        Get the cache key and extraction URL for a stream lookup.
+        
+        Args:
+            video_id (str, optional): YouTube video ID
+            youtube_url (str, optional): Full YouTube URL
+            
+        Returns:
+            tuple: (cache_key, url)
+        """
+        if not video_id:
+            video_id = YouTubeService.extract_video_id(youtube_url)
+        
+        # Fall back to the raw URL as the cache key if no video ID could be parsed
+        cache_key = video_id or youtube_url
+        url = f"https://www.youtube.com/watch?v={video_id}" if video_id else youtube_url
+        return cache_key, url
+    
+    @staticmethod
+    def _cached_stream(cache_key, url):
+        """
+        Look up a cached stream payload and record the access for refresh-ahead.
+        
+        Args:
+            cache_key (str): Key under which the stream payload is cached
+            url (str): YouTube video URL, used if the entry is refreshed
+            
+        Returns:
+            dict: The cached stream payload, or None
+        """
+        try:
+            entry = _stream_cache.get_entry(cache_key)
+        except Exception as e:
+            logger.error(f"Error reading stream URL cache: {str(e)}")
+            return None
+        
+        if REFRESH_AHEAD_ENABLED:
+            created_at, expires_at = (entry[1], entry[2]) if entry else (None, None)
+            _stream_refresher.record_access(cache_key, created_at, expires_at, url, cache_key)
+        
+        return dict(entry[0]) if entry else None
+    
+    @staticmethod
+    def _fetch_stream(cache_key, url):
+        """
+        Resolve a stream URL that is not cached, coalescing concurrent calls.
+        
+        Args:
+            cache_key (str): Key under which the stream payload is cached
+            url (str): YouTube video URL
+            
+        Returns:
+            dict: Stream payload or an error
+        """
+        try:
+            # Work queued at a lower priority is raised to ours before we wait for it
+            _scheduler.promote(url)
+            result = _stream_flight.do(cache_key, YouTubeService._load_stream, url, cache_key)
+            return dict(result)
                 
-                return {
-                    "stream_url": best_audio['url'],
-                    "expires_at": expires_at,
-                    "format": best_audio.get('format_note', 'unknown'),
-                    "bitrate": best_audio.get('abr', 0)
+        except Exception as e:
+            return YouTubeService._error_payload("getting stream URL", e)
+    
+    @staticmethod
+    def _load_stream(url, cache_key):
+        """
+        Resolve a stream URL and cache it until shortly before it expires.
+        
+        Args:
+            url (str): YouTube video URL
+            cache_key (str): Key under which the stream payload is cached
+            
+        Returns:
+            dict: Stream payload or an error
+        """
+        result = YouTubeService._resolve_stream(url)
+        
+        if "error" not in result:
+            ttl = result.pop("_expires") - time.time() - STREAM_URL_SAFETY_MARGIN
+            _stream_cache.set(cache_key, result, ttl)
+        
+        return result
+    
+    @staticmethod
+    def _extraction_slot(key):
+        """
+        Wait for an extraction slot, for no longer than the request deadline allows.
+        
+        Args:
+            key (str): URL or query being extracted
+            
+        Returns:
+            contextmanager: Holds the slot for the duration of the block
+        """
+        deadline.check("extraction")
+        return _scheduler.slot(key, timeout=deadline.timeout(EXTRACTION_QUEUE_TIMEOUT))
+    
+    @staticmethod
+    def _resolve_stream(url):
+        """
+        Run yt-dlp against a video URL and pick the best audio format.
+        
+        Args:
+            url (str): YouTube video URL
+            
+        Returns:
+            dict: Stream payload with an internal "_expires" timestamp, or an error
+        """
+        # Background work is not urgent enough to spend extra extractions on
+        if EXTRACTION_HEDGE_ENABLED and current_priority() != 'background':
+            info = _extraction_hedger.run(
+                lambda: YouTubeService._extract_audio(url, 'audio'),
+                lambda: YouTubeService._extract_audio(url, 'audio_hedge'),
+                YouTubeService._has_audio_format,
+            )
+        else:
+            info = YouTubeService._extract_audio(url, 'audio')
+        
+        if not info:
+            return {"error": "Could not extract video information"}
+        
+        # The full info dict also holds everything song info needs; cache it to save a second extraction
+        if info.get('id'):
+            try:
+                _song_info_cache.set(info['id'], YouTubeService._song_info_payload(info), SONG_INFO_CACHE_TTL)
+            except Exception as e:
+                logger.error(f"Error caching song info: {str(e)}")
+        
+        # Get the best audio format
+        audio_formats = YouTubeService._audio_formats(info)
+        
+        if not audio_formats:
+            return {"error": "No audio format found"}
+        
+        best_audio = audio_formats[0]
+        
+        # Every listed URL has to stay valid for as long as the payload is cached
+        expires = min(YouTubeService._stream_url_expiry(f['url']) for f in audio_formats)
+        
+        return {
+            "stream_url": best_audio['url'],
+            "expires_at": datetime.fromtimestamp(expires).isoformat(),
+            "format": best_audio.get('format_note', 'unknown'),
+            "bitrate": best_audio.get('abr', 0),
+            "format_id": best_audio.get('format_id'),
+            "formats": [
+                {
+                    "format_id": f.get('format_id'),
+                    "format": f.get('format_note', 'unknown'),
+                    "codec": f.get('acodec'),
+                    "container": f.get('ext'),
+                    "abr": f.get('abr'),
+                    "filesize": f.get('filesize') or f.get('filesize_approx'),
+                    "url": f['url'],
                 }
-                
+                for f in audio_formats
+            ],
+            "_expires": expires,
+        }
+    
+    @staticmethod
+    def _extract_audio(url, profile):
+        """
+        Extract a video with yt-dlp, including format processing.
+        
+        Args:
+            url (str): YouTube video URL
+            profile (str): yt-dlp option profile, 'audio' or 'audio_hedge'
+            
+        Returns:
+            dict: yt-dlp info dict, or None
+        """
+        with YouTubeService._extraction_slot(url), _ydl_pool.borrow(profile) as ydl:
+            # Extraction and yt-dlp's format processing are run separately so that each is timed
+            with metrics.timed('extract_info'):
+                info = ydl.extract_info(url, download=False, process=False)
+            if info:
+                with metrics.timed('format_selection'):
+                    info = ydl.process_ie_result(info, download=False)
+        return info
+    
+    @staticmethod
+    def _audio_formats(info):
+        """Return the audio-only formats of an info dict, highest bitrate first."""
+        formats = info.get('formats', [])
+        audio_formats = [f for f in formats if f.get('url') and f.get('acodec') != 'none'
+                         and (f.get('vcodec') == 'none' or f.get('vcodec') is None)]
+        
+        # Sort by quality (bitrate)
+        audio_formats.sort(key=lambda x: x.get('abr', 0) if x.get('abr') else 0, reverse=True)
+        return audio_formats
+    
+    @staticmethod
+    def _has_audio_format(info):
+        """Return whether an extraction produced a usable audio format."""
+        return bool(info) and bool(YouTubeService._audio_formats(info))
+    
+    @staticmethod
+    def search_stream_url(query):
+        """
+        Resolve a free-text query to the audio stream of the first search result.
+        
+        Args:
+            query (str): Search text, e.g. "song name artist"
+            
+        Returns:
+            dict: Stream URL and video ID of the first result
+        """
+        try:
+            with YouTubeService._extraction_slot(query), _ydl_pool.borrow('search') as ydl, \
+                    metrics.timed('extract_info'):
+                info = ydl.extract_info(query, download=False)
+            
+            # if it's a search result list
+            if info and 'entries' in info:
+                info = info['entries'][0] if info['entries'] else None
+            
+            if not info or not info.get('url'):
+                return {"error": "No stream URL found"}
+            
+            return {"stream_url": info['url'], "video_id": info.get('id')}
+            
         except Exception as e:
-            logger.error(f"Error getting stream URL: {str(e)}")
-            return {"error": f"Error getting stream URL: {str(e)}"}
+            return YouTubeService._error_payload("getting stream URL", e)
+    
+    @staticmethod
+    def warm_up():
+        """
+        Do the work deferred at startup ahead of the first request: import
+        yt-dlp and youtube-search-python, create pooled yt-dlp instances and
+        load the fuzzy mapping index, then report the worker ready. Opening
+        connections to YouTube and filling the player cache need the network,
+        so they only start once the worker is ready. Each phase is timed and
+        reported by /ready.
+        """
+        with startup.phase('imports'):
+            importlib.import_module('yt_dlp')
+            _videos_search()
+        
+        with startup.phase('extractors'):
+            _ydl_pool.warm([profile for profile in _ydl_pool.profiles
+                            if profile != 'audio_hedge' or EXTRACTION_HEDGE_ENABLED])
+        
+        if _mapping_store is not None:
+            with startup.phase('mappings'):
+                _mapping_store.warm()
+        
+        startup.mark('warm_up')
+        
+        # Best effort: a slow or unreachable YouTube must not keep the worker out of rotation
+        if startup.PREWARM_URLS:
+            with startup.phase('connections'):
+                if not _ydl_pool.connect(startup.PREWARM_URLS):
+                    raise ConnectionError("No connection could be opened")
+        
+        if player_cache.WARM_UP_VIDEO_ID:
+            with startup.phase('player_cache'):
+                with extraction_priority('background'):
+                    result = YouTubeService.get_stream_url(player_cache.WARM_UP_VIDEO_ID)
+                if "error" in result:
+                    raise RuntimeError(result["error"])
+    
+    @staticmethod
+    def pool_stats():
+        """
+        Get pooled yt-dlp instance counters.
+        
+        Returns:
+            dict: Instances per profile and lifecycle counters
+        """
+        return _ydl_pool.stats()
+    
+    @staticmethod
+    def player_cache_stats():
+        """
+        Get usage counters and disk size of the yt-dlp player/signature cache.
+        
+        Returns:
+            dict: Per-section hit/miss/store counters, file counts and bytes
+        """
+        return player_cache.stats()
+    
+    @staticmethod
+    def cache_stats():
+        """
+        Get counters for the stream URL, search and song info caches.
+        
+        Returns:
+            dict: Cache size and hit/miss/eviction counters per cache
+        """
+        return {
+            "stream": _stream_cache.stats(),
+            "search": _search_cache.stats(),
+            "song_info": _song_info_cache.stats(),
+        }
+    
+    @staticmethod
+    def mapping_stats():
+        """
+        Get song mapping lookup counters.
+        
+        Returns:
+            dict: Exact and fuzzy hits, misses and indexed mappings, or only "enabled": False
+        """
+        if _mapping_store is None:
+            return {"enabled": False}
+        return {"enabled": True, **_mapping_store.stats()}
     
     @staticmethod
-    def get_song_info(video_id):
+    def coalescing_stats():
+        """
+        Get single-flight counters for stream URL, search and song info lookups.
+        
+        Returns:
+            dict: Executions, coalesced calls and keys in flight per lookup type
+        """
+        return {
+            "stream": _stream_flight.stats(),
+            "search": _search_flight.stats(),
+            "song_info": _song_info_flight.stats(),
+        }
+    
+    @staticmethod
+    def scheduler_stats():
+        """
+        Get extraction scheduler statistics.
+        
+        Returns:
+            dict: Slot usage and per-priority queue counters
+        """
+        return _scheduler.stats()
+    
+    @staticmethod
+    def hedging_stats():
+        """
+        Get hedged extraction counters.
+        
+        Returns:
+            dict: Extractions, hedges by outcome, budget denials and the current hedge delay
+        """
+        return _extraction_hedger.stats()
+    
+    @staticmethod
+    def refresh_stats():
+        """
+        Get refresh-ahead counters for cached stream URLs.
+        
+        Returns:
+            dict: Tracked keys, refreshes in progress and scheduling counters
+        """
+        return _stream_refresher.stats()
+    
+    @staticmethod
+    def get_song_info(video_id, fields=None):
         """
         Get detailed information about a YouTube video.
         
+        Only metadata is extracted: formats are neither resolved nor
+        deciphered, which makes this much cheaper than a stream lookup.
+        
         Args:
             video_id (str): YouTube video ID
+            fields (list, optional): Subset of SONG_INFO_FIELDS to return; all by default
             
         Returns:
             dict: Video metadata
         """
         try:
-            url = f"https://www.youtube.com/watch?v={video_id}"
-            
-            # Configure yt-dlp options
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'skip_download': True,
-                'noplaylist': True,
-            }
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                
-                if not info:
-                    return {"error": "Could not extract video information"}
-                
-                return {
-                    "title": info.get('title', ''),
-                    "duration": info.get('duration', 0),
-                    "thumbnail": info.get('thumbnail', ''),
-                    "uploader": info.get('uploader', ''),
-                    "view_count": info.get('view_count', 0),
-                    "upload_date": info.get('upload_date', ''),
-                    "description": info.get('description', '')[:500] if info.get('description') else '',  # Truncate long descriptions
-                }
+            cached = _song_info_cache.get(video_id)
+            if cached is None:
+                _scheduler.promote(f"https://www.youtube.com/watch?v={video_id}")
+                cached = _song_info_flight.do(video_id, YouTubeService._load_song_info, video_id)
+            
+            if "error" in cached or not fields:
+                return dict(cached)
+            return {field: cached[field] for field in fields if field in cached}
                 
         except Exception as e:
-            logger.error(f"Error getting song info: {str(e)}")
-            return {"error": f"Error getting song info: {str(e)}"}
\ No newline at end of file
+            return YouTubeService._error_payload("getting song info", e)
+    
+    @staticmethod
+    def _load_song_info(video_id):
+        """
+        Extract video metadata with yt-dlp and cache it.
+        
+        Args:
+            video_id (str): YouTube video ID
+            
+        Returns:
+            dict: Video metadata or an error
+        """
+        url = f"https://www.youtube.com/watch?v={video_id}"
+        
+        # process=False returns the extractor's result without format selection
+        with YouTubeService._extraction_slot(url), _ydl_pool.borrow('metadata') as ydl, \
+                metrics.timed('extract_info'):
+            info = ydl.extract_info(url, download=False, process=False)
+        
+        if not info:
+            return {"error": "Could not extract video information"}
+        
+        result = YouTubeService._song_info_payload(info)
+        _song_info_cache.set(video_id, result, SONG_INFO_CACHE_TTL)
+        return result
+    
+    @staticmethod
+    def _song_info_payload(info):
+        """
+        Build the song info payload from a yt-dlp info dict.
+        
+        Args:
+            info (dict): Processed or unprocessed yt-dlp info dict
+            
+        Returns:
+            dict: Video metadata with the keys of SONG_INFO_FIELDS
+        """
+        thumbnail = info.get('thumbnail')
+        if not thumbnail and info.get('thumbnails'):
+            # Unprocessed results only list thumbnails; pick the one yt-dlp would prefer
+            best = max(info['thumbnails'], key=lambda t: (t.get('preference') or 0, (t.get('width') or 0) * (t.get('height') or 0)))
+            thumbnail = best.get('url')
+        
+        return {
+            "title": info.get('title', ''),
+            "duration": info.get('duration', 0),
+            "thumbnail": thumbnail or '',
+            "uploader": info.get('uploader', ''),
+            "view_count": info.get('view_count', 0),
+            "upload_date": info.get('upload_date', ''),
+            "description": info.get('description', '')[:500] if info.get('description') else '',  # Truncate long descriptions
+        }
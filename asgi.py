@@ -0,0 +1,15 @@
+import logging
+from app.asgi import create_asgi_app
+
+# Configure logging for production
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Create the ASGI application
+app = create_asgi_app()
+
+# Log application startup
+logger.info("YTune backend ASGI application initialized")
@@ -0,0 +1,25 @@
+"""
+WSGI and ASGI entry points for benchmarking under gunicorn with offline stand-ins.
+
+    gunicorn benchmarks.bench_app:app --workers 2 --threads 2
+    gunicorn benchmarks.bench_app:asgi_app -k uvicorn.workers.UvicornWorker --workers 2
+"""
+import os
+
+# Keep runs isolated from real caches, mappings and metrics unless the runner overrides this
+os.environ.setdefault('YTUNE_CACHE_BACKEND', 'memory')
+os.environ.setdefault('YTUNE_MAPPING_STORE', '0')
+os.environ.setdefault('YTUNE_AUDIO_CACHE', '0')
+os.environ.setdefault('YTUNE_METRICS_DIR', '')
+os.environ.setdefault('YTUNE_WARM_UP', '0')
+
+from benchmarks import standins  # noqa: E402
+
+simulator = standins.simulator_from_env()
+standins.install(simulator)
+
+from app import create_app  # noqa: E402
+from app.asgi import YTuneASGI  # noqa: E402
+
+app = create_app()
+asgi_app = YTuneASGI(app)
@@ -0,0 +1,426 @@
+"""
+Offline benchmark runner for the YTune backend.
+
+Drives the Flask app through its WSGI interface in-process, through a real
+gunicorn server with sync workers and/or through the ASGI app on gunicorn
+with uvicorn workers, as deployed, with yt-dlp and youtube-search-python
+replaced by stand-ins, and reports throughput, latency percentiles and
+memory per scenario and endpoint.
+
+    python -m benchmarks.run --mode all --output bench.json
+    python -m benchmarks.run --scenario herd --compare bench.json
+    python -m benchmarks.run --cold-start 5
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SCENARIOS = ('cold_cache', 'hot_cache', 'herd', 'playlist_batch', 'search_cold')
+
+_id_counter = itertools.count()
+_id_prefix = f"{os.getpid() % 0xffff:04x}"
+
+
+def unique_video_id():
+    """Return an 11-character video ID that has not been used in this run."""
+    return f"b{_id_prefix}{next(_id_counter):06d}"
+
+
+class WSGIDriver:
+    """Sends requests to the app in-process through its WSGI interface."""
+
+    mode = 'wsgi'
+
+    def __init__(self):
+        from benchmarks import bench_app
+        self.app = bench_app.app
+        self.simulator = bench_app.simulator
+
+    def request(self, method, path, body=None):
+        client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        data = response.get_data()
+        return response.status_code, data
+
+    def memory(self):
+        return {'rss_kb': _rss_kb(os.getpid()),
+                'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+    def upstream_calls(self):
+        return self.simulator.stats()
+
+    def close(self):
+        pass
+
+
+class GunicornDriver:
+    """
+    Starts gunicorn on a free port and sends real HTTP requests to it.
+
+    With asgi, gunicorn serves the ASGI app with uvicorn workers, which run
+    one event loop each and ignore threads.
+    """
+
+    def __init__(self, workers=2, threads=2, env=None, asgi=False):
+        import requests
+        self.mode = 'uvicorn' if asgi else 'gunicorn'
+        self._requests = requests
+        self._local = threading.local()
+        self.port = _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.started_at = time.perf_counter()
+        if asgi:
+            server = ['benchmarks.bench_app:asgi_app', '-k', 'uvicorn.workers.UvicornWorker']
+        else:
+            server = ['benchmarks.bench_app:app', '--threads', str(threads)]
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', *server,
+             '--bind', f"127.0.0.1:{self.port}", '--workers', str(workers),
+             '--timeout', '60', '--log-level', 'warning'],
+            env=dict(os.environ, **(env or {})),
+        )
+        try:
+            self.wait_for('/ping')
+        except Exception:
+            self.close()
+            raise
+
+    def wait_for(self, path, timeout=60, interval=0.02):
+        """Poll path until it answers 200; returns the seconds since gunicorn was started."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('gunicorn exited during startup')
+            try:
+                if self._requests.get(f"{self.base_url}{path}", timeout=5).status_code == 200:
+                    return time.perf_counter() - self.started_at
+            except self._requests.RequestException:
+                pass
+            time.sleep(interval)
+        raise RuntimeError(f"gunicorn did not answer {path} in time")
+
+    def request(self, method, path, body=None):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._requests.Session()
+            self._local.session = session
+        response = session.request(method, f"{self.base_url}{path}", json=body, timeout=120)
+        return response.status_code, response.content
+
+    def memory(self):
+        pids = [self.process.pid] + _child_pids(self.process.pid)
+        return {'rss_kb': sum(_rss_kb(pid) or 0 for pid in pids), 'processes': len(pids)}
+
+    def upstream_calls(self):
+        # Calls happen in the worker processes and are not visible here
+        return None
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as fp:
+            for line in fp:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _child_pids(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as fp:
+            return [int(child) for child in fp.read().split()]
+    except OSError:
+        return []
+
+
+def _stream_request(video_id):
+    return 'POST', '/api/get-stream-url', {'video_id': video_id}
+
+
+def build_scenario(name, requests_count, batch_size):
+    """
+    Build the warm-up and measured requests of a scenario.
+
+    Args:
+        name (str): Scenario name from SCENARIOS
+        requests_count (int): Number of measured requests
+        batch_size (int): Items per playlist batch request
+
+    Returns:
+        tuple: (warm-up requests, measured requests, concurrency override or None)
+    """
+    if name == 'cold_cache':
+        # Every request resolves a video nobody asked for before
+        return [], [_stream_request(unique_video_id()) for _ in range(requests_count)], None
+
+    if name == 'hot_cache':
+        # A small set of popular videos, resolved once before measuring
+        popular = [unique_video_id() for _ in range(20)]
+        warm = [_stream_request(video_id) for video_id in popular]
+        measured = [_stream_request(popular[i % len(popular)]) for i in range(requests_count)]
+        return warm, measured, None
+
+    if name == 'herd':
+        # Many clients asking for the same uncached video at the same moment
+        video_id = unique_video_id()
+        count = min(requests_count, 100)
+        return [], [_stream_request(video_id) for _ in range(count)], count
+
+    if name == 'playlist_batch':
+        # Clients opening playlists, resolving a whole queue per request
+        batches = max(requests_count // batch_size, 1)
+        measured = [('POST', '/api/get-stream-urls', {'items': [unique_video_id() for _ in range(batch_size)]})
+                    for _ in range(batches)]
+        return [], measured, None
+
+    if name == 'search_cold':
+        measured = [('POST', '/api/search-song', {'title': f"Song {unique_video_id()}", 'artist': 'Bench Artist'})
+                    for _ in range(requests_count)]
+        return [], measured, None
+
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def measure_cold_start(runs, workers, threads, asgi=False):
+    """
+    Start gunicorn repeatedly and time how long it takes to serve requests.
+
+    The warm-up is enabled for these starts, without connection prewarming,
+    which would need network access.
+
+    Returns:
+        dict: Per-run and median seconds until /ping and /ready answer, and first request latency
+    """
+    samples = []
+    for _ in range(runs):
+        driver = GunicornDriver(workers, threads, env={'YTUNE_WARM_UP': '1', 'YTUNE_PREWARM_URLS': ''}, asgi=asgi)
+        try:
+            healthy = driver.wait_for('/ping')
+            ready = driver.wait_for('/ready')
+            started = time.perf_counter()
+            status, _ = driver.request(*_stream_request(unique_video_id()))
+            first_request = time.perf_counter() - started
+        finally:
+            driver.close()
+        samples.append({'healthy_s': round(healthy, 3), 'ready_s': round(ready, 3),
+                        'first_request_ms': round(first_request * 1000, 2), 'status': status})
+
+    summary = {key: round(sorted(sample[key] for sample in samples)[len(samples) // 2], 3)
+               for key in ('healthy_s', 'ready_s', 'first_request_ms')}
+    return {'runs': samples, 'median': summary}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_scenario(driver, name, requests_count, concurrency, batch_size):
+    """
+    Run one scenario and summarize it per endpoint.
+
+    Returns:
+        list: One result dict per endpoint exercised by the scenario
+    """
+    warm, measured, concurrency_override = build_scenario(name, requests_count, batch_size)
+    concurrency = concurrency_override or concurrency
+
+    for method, path, body in warm:
+        driver.request(method, path, body)
+
+    calls_before = driver.upstream_calls()
+    memory_before = driver.memory()
+    samples = {}
+    lock = threading.Lock()
+
+    def send(spec):
+        method, path, body = spec
+        started = time.perf_counter()
+        try:
+            status, _ = driver.request(method, path, body)
+        except Exception:
+            status = None
+        elapsed = time.perf_counter() - started
+        with lock:
+            samples.setdefault(path, []).append((elapsed, status))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, measured))
+    wall = time.perf_counter() - started
+
+    memory_after = driver.memory()
+    calls_after = driver.upstream_calls()
+    upstream = None
+    if calls_before is not None and calls_after is not None:
+        upstream = {key: calls_after[key] - calls_before[key] for key in calls_after}
+
+    results = []
+    for endpoint, endpoint_samples in sorted(samples.items()):
+        latencies = sorted(elapsed * 1000 for elapsed, _ in endpoint_samples)
+        errors = sum(1 for _, status in endpoint_samples if status is None or status >= 500)
+        results.append({
+            'scenario': name,
+            'mode': driver.mode,
+            'endpoint': endpoint,
+            'requests': len(endpoint_samples),
+            'errors': errors,
+            'concurrency': concurrency,
+            'duration_s': round(wall, 3),
+            'throughput_rps': round(len(endpoint_samples) / wall, 2) if wall else None,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 0.50), 2),
+                'p95': round(percentile(latencies, 0.95), 2),
+                'p99': round(percentile(latencies, 0.99), 2),
+                'mean': round(sum(latencies) / len(latencies), 2),
+                'max': round(latencies[-1], 2),
+            },
+            'memory': {'before': memory_before, 'after': memory_after},
+            'upstream_calls': upstream,
+        })
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    """
+    Compare p95 latency and throughput with a previous run.
+
+    Returns:
+        list: Human-readable regression descriptions
+    """
+    with open(baseline_path, encoding='utf-8') as fp:
+        baseline = json.load(fp)
+    previous = {(r['scenario'], r['mode'], r['endpoint']): r for r in baseline['results']}
+
+    regressions = []
+    for result in results:
+        before = previous.get((result['scenario'], result['mode'], result['endpoint']))
+        if not before:
+            continue
+        label = f"{result['scenario']}/{result['mode']} {result['endpoint']}"
+        old_p95, new_p95 = before['latency_ms']['p95'], result['latency_ms']['p95']
+        if old_p95 and new_p95 > old_p95 * (1 + threshold):
+            regressions.append(f"{label}: p95 {old_p95:.1f}ms -> {new_p95:.1f}ms")
+        old_rps, new_rps = before['throughput_rps'], result['throughput_rps']
+        if old_rps and new_rps < old_rps * (1 - threshold):
+            regressions.append(f"{label}: throughput {old_rps:.1f} -> {new_rps:.1f} req/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['wsgi', 'gunicorn', 'uvicorn', 'both', 'all'], default='wsgi',
+                        help='gunicorn serves the WSGI app with sync workers, uvicorn the ASGI app with uvicorn '
+                             'workers; both runs wsgi and gunicorn, all every mode')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='Scenario to run; repeat for several (default: all)')
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--batch-size', type=int, default=30, help='Items per playlist batch request')
+    parser.add_argument('--extract-latency', type=float, default=1.5, help='Mean stand-in extract_info seconds')
+    parser.add_argument('--search-latency', type=float, default=0.6, help='Mean stand-in VideosSearch seconds')
+    parser.add_argument('--jitter', type=float, default=0.25, help='Relative latency variation')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of failing upstream calls')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=2, help='gunicorn threads per sync worker')
+    parser.add_argument('--cold-start', type=int, default=0, metavar='RUNS',
+                        help='Time RUNS gunicorn starts until /ping and /ready answer, and the first request, '
+                             'with uvicorn workers in uvicorn mode; scenarios are only run as well when given '
+                             'with --scenario')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', help='Previous JSON results to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Relative change counted as a regression')
+    args = parser.parse_args(argv)
+
+    # Settings are read at import time by the app, so set them before any driver starts
+    os.environ.update({
+        'BENCH_EXTRACT_LATENCY': str(args.extract_latency),
+        'BENCH_SEARCH_LATENCY': str(args.search_latency),
+        'BENCH_JITTER': str(args.jitter),
+        'BENCH_ERROR_RATE': str(args.error_rate),
+    })
+    os.environ.setdefault('YTUNE_CACHE_BACKEND', 'memory')
+    os.environ.setdefault('YTUNE_MAPPING_STORE', '0')
+    os.environ.setdefault('YTUNE_AUDIO_CACHE', '0')
+    os.environ.setdefault('YTUNE_METRICS_DIR', '')
+    os.environ.setdefault('YTUNE_WARM_UP', '0')
+
+    modes = {'both': ['wsgi', 'gunicorn'], 'all': ['wsgi', 'gunicorn', 'uvicorn']}.get(args.mode, [args.mode])
+    if args.cold_start and not args.scenario:
+        modes = []
+    results = []
+    for mode in modes:
+        if mode == 'wsgi':
+            driver = WSGIDriver()
+        else:
+            driver = GunicornDriver(args.workers, args.threads, asgi=mode == 'uvicorn')
+        try:
+            for name in args.scenario or SCENARIOS:
+                for result in run_scenario(driver, name, args.requests, args.concurrency, args.batch_size):
+                    results.append(result)
+                    latency = result['latency_ms']
+                    print(f"{result['scenario']:<15} {result['mode']:<9} {result['endpoint']:<22} "
+                          f"{result['throughput_rps']:>8} req/s  p50 {latency['p50']:>8}ms  "
+                          f"p95 {latency['p95']:>8}ms  p99 {latency['p99']:>8}ms  errors {result['errors']}")
+        finally:
+            driver.close()
+
+    cold_start = None
+    if args.cold_start:
+        asgi = args.mode == 'uvicorn'
+        cold_start = measure_cold_start(args.cold_start, args.workers, args.threads, asgi=asgi)
+        cold_start['mode'] = 'uvicorn' if asgi else 'gunicorn'
+        median = cold_start['median']
+        print(f"cold_start      {cold_start['mode']:<9} healthy {median['healthy_s']:>6}s  ready {median['ready_s']:>6}s  "
+              f"first request {median['first_request_ms']:>8}ms  (median of {args.cold_start})")
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'args': vars(args),
+        },
+        'results': results,
+        'cold_start': cold_start,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fp:
+            json.dump(report, fp, indent=2)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
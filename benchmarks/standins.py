@@ -0,0 +1,166 @@
+"""
+Offline stand-ins for yt-dlp extraction and youtube-search-python.
+
+The stand-ins answer from recorded fixtures (benchmarks/fixtures/recorded.json)
+and synthesize deterministic data for unknown videos and queries, so any
+number of distinct IDs can be requested. Latency and error rates are
+configurable to mimic a slow or flaky upstream.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'recorded.json')
+
+# Audio/video formats YouTube typically offers, used for every stand-in video
+FORMAT_TEMPLATES = (
+    {'format_id': '139', 'ext': 'm4a', 'acodec': 'mp4a.40.5', 'vcodec': 'none', 'abr': 48.8, 'format_note': 'low'},
+    {'format_id': '249', 'ext': 'webm', 'acodec': 'opus', 'vcodec': 'none', 'abr': 50.4, 'format_note': 'low'},
+    {'format_id': '250', 'ext': 'webm', 'acodec': 'opus', 'vcodec': 'none', 'abr': 68.9, 'format_note': 'low'},
+    {'format_id': '140', 'ext': 'm4a', 'acodec': 'mp4a.40.2', 'vcodec': 'none', 'abr': 129.5, 'format_note': 'medium'},
+    {'format_id': '251', 'ext': 'webm', 'acodec': 'opus', 'vcodec': 'none', 'abr': 135.6, 'format_note': 'medium'},
+    {'format_id': '18', 'ext': 'mp4', 'acodec': 'mp4a.40.2', 'vcodec': 'avc1.42001E', 'abr': 96.0, 'format_note': '360p'},
+)
+
+# Lifetime of stand-in stream URLs, matching googlevideo's usual six hours
+STREAM_URL_LIFETIME = 6 * 3600
+
+
+class UpstreamSimulator:
+    """Configurable latency and failure behaviour shared by the stand-ins."""
+
+    def __init__(self, extract_latency=1.5, search_latency=0.6, jitter=0.25, error_rate=0.0, seed=1):
+        """
+        Args:
+            extract_latency (float): Mean seconds per extract_info call
+            search_latency (float): Mean seconds per VideosSearch call
+            jitter (float): Relative random variation of the latencies
+            error_rate (float): Share of calls that fail
+            seed (int): Random seed for reproducible runs
+        """
+        self.extract_latency = extract_latency
+        self.search_latency = search_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.extract_calls = 0
+        self.search_calls = 0
+
+        with open(FIXTURES_PATH, encoding='utf-8') as fp:
+            fixtures = json.load(fp)
+        self.videos = fixtures['videos']
+        self.searches = fixtures['searches']
+
+    def _wait(self, mean):
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+            fail = self._random.random() < self.error_rate
+        time.sleep(max(mean * factor, 0))
+        return fail
+
+    def video(self, video_id):
+        """Return fixture metadata for a video, synthesizing it if it is not recorded."""
+        if video_id in self.videos:
+            return dict(self.videos[video_id])
+        digest = int(hashlib.sha1(video_id.encode()).hexdigest(), 16)
+        return {
+            'id': video_id,
+            'title': f"Track {video_id} (Official Audio)",
+            'uploader': f"Artist {digest % 97}",
+            'channel': f"Artist {digest % 97}",
+            'duration': 150 + digest % 150,
+            'view_count': digest % 10 ** 7,
+            'upload_date': '20200101',
+            'thumbnail': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            'description': f"Stand-in description for {video_id}",
+        }
+
+    def extract_info(self, url, download=False, **kwargs):
+        """Stand-in for yt_dlp.YoutubeDL.extract_info."""
+        with self._lock:
+            self.extract_calls += 1
+        if self._wait(self.extract_latency):
+            import yt_dlp
+            raise yt_dlp.utils.DownloadError('ERROR: [youtube] Simulated upstream failure')
+
+        video_id = url.rsplit('v=', 1)[-1][:11] if 'v=' in url else url[-11:]
+        info = self.video(video_id)
+        expire = int(time.time()) + STREAM_URL_LIFETIME
+        info['formats'] = [
+            dict(template, url=(f"https://rr1---sn-stand-in.googlevideo.com/videoplayback"
+                                f"?expire={expire}&id={video_id}&itag={template['format_id']}"),
+                 filesize=int(template['abr'] * 125 * info['duration']))
+            for template in FORMAT_TEMPLATES
+        ]
+        info['url'] = info['formats'][-2]['url']
+        return info
+
+    def search(self, query, limit=5):
+        """Stand-in for VideosSearch(query, limit).result()['result']."""
+        with self._lock:
+            self.search_calls += 1
+        if self._wait(self.search_latency):
+            raise ConnectionError('Simulated search failure')
+
+        if query in self.searches:
+            ids = self.searches[query]
+        else:
+            digest = hashlib.sha1(query.encode()).hexdigest()
+            ids = [(digest[i * 4:i * 4 + 11] + 'xxxxxxxxxxx')[:11] for i in range(limit)]
+
+        results = []
+        for video_id in ids[:limit]:
+            video = self.video(video_id)
+            results.append({
+                'id': video_id,
+                'title': video['title'] if video_id in self.videos else f"{query} - {video['title']}",
+                'duration': f"{video['duration'] // 60}:{video['duration'] % 60:02d}",
+                'channel': {'name': video['channel']},
+                'thumbnails': [{'url': video['thumbnail']}],
+                'descriptionSnippet': None,
+            })
+        return results
+
+    def stats(self):
+        """Return the number of upstream calls made so far."""
+        with self._lock:
+            return {'extract_calls': self.extract_calls, 'search_calls': self.search_calls}
+
+
+def install(simulator):
+    """
+    Replace the upstream calls used by the service with the simulator.
+
+    Args:
+        simulator (UpstreamSimulator): Simulator answering the calls
+    """
+    import yt_dlp
+    from app.services import youtube_service
+
+    class StandInVideosSearch:
+        def __init__(self, query, limit=5, **kwargs):
+            self._results = simulator.search(query, limit)
+
+        def result(self):
+            return {'result': self._results}
+
+    def extract_info(self, url, download=False, **kwargs):
+        return simulator.extract_info(url, download=download, **kwargs)
+
+    yt_dlp.YoutubeDL.extract_info = extract_info
+    youtube_service.VideosSearch = StandInVideosSearch
+
+
+def simulator_from_env():
+    """Build a simulator from the BENCH_* environment variables set by the runner."""
+    return UpstreamSimulator(
+        extract_latency=float(os.environ.get('BENCH_EXTRACT_LATENCY', 1.5)),
+        search_latency=float(os.environ.get('BENCH_SEARCH_LATENCY', 0.6)),
+        jitter=float(os.environ.get('BENCH_JITTER', 0.25)),
+        error_rate=float(os.environ.get('BENCH_ERROR_RATE', 0.0)),
+        seed=int(os.environ.get('BENCH_SEED', 1)),
+    )
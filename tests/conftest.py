@@ -0,0 +1,87 @@
+import os
+import time
+
+import pytest
+
+# Settings are read at import time; keep tests away from the instance directory and the network
+os.environ.setdefault('YTUNE_CACHE_BACKEND', 'memory')
+os.environ.setdefault('YTUNE_MAPPING_STORE', '0')
+os.environ.setdefault('YTUNE_AUDIO_CACHE', '0')
+os.environ.setdefault('YTUNE_METRICS_DIR', '')
+
+
+class FakeClock:
+    """Stand-in for time.time/time.monotonic that only moves when told to."""
+
+    def __init__(self, now=1000.0, step=0.0):
+        self.now = now
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeUpstream:
+    """Answers yt-dlp extractions and YouTube searches without network access."""
+
+    def __init__(self):
+        # Seconds until the googlevideo URLs of extracted videos expire
+        self.expire_in = 6 * 3600
+        # Query -> search results, or an exception to raise
+        self.searches = {}
+        self.extractions = []
+        self.queries = []
+
+    def extract_info(self, url, download=False, **kwargs):
+        self.extractions.append(url)
+        video_id = url[-11:]
+        expire = int(time.time() + self.expire_in)
+        formats = [
+            {'format_id': format_id, 'ext': ext, 'acodec': acodec, 'vcodec': 'none', 'abr': abr,
+             'format_note': note, 'filesize': abr * 25000,
+             'url': f"https://rr1---sn-test.googlevideo.com/videoplayback?expire={expire}&id={video_id}&itag={format_id}"}
+            for format_id, ext, acodec, abr, note in (
+                ('249', 'webm', 'opus', 50.4, 'low'),
+                ('140', 'm4a', 'mp4a.40.2', 129.5, 'medium'),
+                ('251', 'webm', 'opus', 135.6, 'medium'),
+            )
+        ]
+        return {'id': video_id, 'title': f"Track {video_id}", 'uploader': 'Artist', 'channel': 'Artist',
+                'duration': 200, 'formats': formats, 'url': formats[-1]['url']}
+
+    def search(self, query):
+        self.queries.append(query)
+        outcome = self.searches.get(query, [])
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    import yt_dlp
+    from app.services import youtube_service
+
+    fake = FakeUpstream()
+
+    class VideosSearch:
+        def __init__(self, query, limit=5, **kwargs):
+            self._results = fake.search(query)
+
+        def result(self):
+            return {'result': self._results}
+
+    monkeypatch.setattr(yt_dlp.YoutubeDL, 'extract_info',
+                        lambda self, url, download=False, **kwargs: fake.extract_info(url, download, **kwargs))
+    monkeypatch.setattr(youtube_service, 'VideosSearch', VideosSearch)
+    return fake
+
+
+def search_result(video_id, title, channel='', duration='3:20'):
+    """Build a youtube-search-python result entry."""
+    return {'id': video_id, 'title': title, 'duration': duration, 'channel': {'name': channel},
+            'thumbnails': [{'url': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"}]}
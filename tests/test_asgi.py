@@ -0,0 +1,131 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from app.asgi import MAX_BODY_SIZE, create_asgi_app
+from app.services.youtube_service import YouTubeService
+from tests.conftest import search_result
+
+
+@pytest.fixture(scope='module')
+def asgi_app():
+    return create_asgi_app({'TESTING': True})
+
+
+async def _request(app, method, path, body=b'', headers=()):
+    """Send one HTTP request through the ASGI app and return (status, decoded JSON body)."""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'content-type', b'application/json'), *headers], 'server': ('testserver', 80),
+        'client': ('127.0.0.1', 1234),
+    }
+    request_sent = False
+    messages = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    status = messages[0]['status']
+    return status, json.loads(b''.join(message.get('body', b'') for message in messages[1:]))
+
+
+def call(app, method, path, payload=None, headers=()):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    return asyncio.run(_request(app, method, path, body, headers))
+
+
+def test_search_song_requires_title_and_artist(asgi_app):
+    status, payload = call(asgi_app, 'POST', '/api/search-song', {'title': 'Only Title'})
+    assert status == 400
+    assert payload == {"error": "Both title and artist are required"}
+
+
+def test_search_song(asgi_app, upstream):
+    upstream.searches['Asgi Song Asgi Artist official audio'] = [
+        search_result('asgiSong001', 'Asgi Artist - Asgi Song (Official Audio)', 'Asgi Artist')]
+    status, payload = call(asgi_app, 'POST', '/api/search-song', {'title': 'Asgi Song', 'artist': 'Asgi Artist'})
+    assert status == 200
+    assert payload['video_id'] == 'asgiSong001'
+
+
+def test_get_stream_url(asgi_app, upstream):
+    status, payload = call(asgi_app, 'POST', '/api/get-stream-url', {'video_id': 'asgiStream1'})
+    assert status == 200
+    assert payload['format_id'] == '251'
+    assert 'id=asgiStream1' in payload['stream_url']
+
+
+def test_get_stream_url_requires_a_video(asgi_app):
+    status, payload = call(asgi_app, 'POST', '/api/get-stream-url', {})
+    assert status == 400
+    assert payload == {"error": "Either video_id or youtube_url must be provided"}
+
+
+def test_song_info(asgi_app, upstream):
+    status, payload = call(asgi_app, 'GET', '/api/song-info/asgiInfo001')
+    assert status == 200
+    assert payload['title'] == 'Track asgiInfo001'
+
+
+def test_other_routes_fall_through_to_flask(asgi_app):
+    status, payload = call(asgi_app, 'GET', '/ping')
+    assert status == 200
+    assert payload == {'status': 'ok'}
+
+
+def test_oversized_bodies_are_rejected(asgi_app):
+    body = b'{"title": "' + b'x' * MAX_BODY_SIZE + b'"}'
+    status, payload = asyncio.run(_request(asgi_app, 'POST', '/api/search-song', body))
+    assert status == 413
+    assert payload == {"error": f"Request body exceeds {MAX_BODY_SIZE} bytes"}
+
+
+def test_slow_calls_are_answered_at_the_request_deadline(asgi_app, monkeypatch):
+    monkeypatch.setattr(YouTubeService, 'search_song', lambda *args: time.sleep(1.5) or {"video_id": 'tooLate0001'})
+    started = time.monotonic()
+    status, payload = call(asgi_app, 'POST', '/api/search-song', {'title': 'Slow', 'artist': 'Song'},
+                           headers=[(b'x-request-timeout', b'0.2')])
+    assert status == 504
+    assert payload == {"error": "Request deadline exceeded"}
+    assert time.monotonic() - started < 1
+
+
+def test_flask_routes_answer_while_another_flask_request_is_running():
+    app = create_asgi_app({'TESTING': True})
+    started, release = threading.Event(), threading.Event()
+
+    @app.flask_app.route('/slow')
+    def slow():
+        started.set()
+        release.wait(5)
+        return {'status': 'done'}
+
+    async def requests():
+        slow_request = asyncio.create_task(_request(app, 'GET', '/slow'))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        try:
+            return await asyncio.wait_for(_request(app, 'GET', '/ping'), timeout=2)
+        finally:
+            release.set()
+            await slow_request
+
+    assert asyncio.run(requests()) == (200, {'status': 'ok'})
+
+
+def test_get_stream_url_rejects_non_string_video_references(asgi_app):
+    status, payload = call(asgi_app, 'POST', '/api/get-stream-url', {'youtube_url': 123})
+    assert status == 400
+    assert payload == {"error": "youtube_url must be a string"}
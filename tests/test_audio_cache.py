@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import audio_cache
+from app.services.audio_cache import AudioChunkCache
+from tests.conftest import FakeClock
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Every reading of the clock is a second later, so access times never tie
+    clock = FakeClock(step=1.0)
+    monkeypatch.setattr(audio_cache, 'time', SimpleNamespace(time=clock))
+    return clock
+
+
+def _cache(tmp_path, eviction, chunks=3):
+    cache = AudioChunkCache(str(tmp_path), max_bytes=chunks * 10, chunk_size=10, eviction=eviction)
+    cache.TOUCH_INTERVAL = 0
+    return cache
+
+
+def _write(cache, index, video_id='v'):
+    writer = cache.writer(video_id, '251', index)
+    writer.write(bytes([index]) * 10)
+    writer.commit()
+
+
+def _read(cache, index, video_id='v'):
+    return b''.join(cache.read(video_id, '251', index))
+
+
+def test_chunks_are_read_back(tmp_path):
+    cache = _cache(tmp_path, 'lru')
+    _write(cache, 0)
+    assert _read(cache, 0) == bytes([0]) * 10
+    assert b''.join(cache.read('v', '251', 0, 2, 4)) == bytes([0]) * 3
+    assert cache.read('v', '251', 1) is None
+    assert cache.cached_chunks('v', '251') == {0}
+
+
+def test_aborted_chunk_is_not_cached(tmp_path):
+    cache = _cache(tmp_path, 'lru')
+    writer = cache.writer('v', '251', 0)
+    writer.write(b'partial')
+    writer.abort()
+    assert cache.cached_chunks('v', '251') == set()
+
+
+def test_lru_evicts_the_least_recently_read_chunk(tmp_path):
+    cache = _cache(tmp_path, 'lru')
+    for index in range(3):
+        _write(cache, index)
+    _read(cache, 0)
+    _write(cache, 3)
+    assert cache.cached_chunks('v', '251') == {0, 2, 3}
+    assert cache.stats()['evictions'] == 1
+
+
+def test_lfu_evicts_the_least_often_read_chunk(tmp_path):
+    cache = _cache(tmp_path, 'lfu')
+    for index in range(3):
+        _write(cache, index)
+    for _ in range(2):
+        _read(cache, 0)
+    _read(cache, 2)
+    _write(cache, 3)
+    assert cache.cached_chunks('v', '251') == {0, 2, 3}
+
+
+def test_lfu_keeps_new_chunks_over_unread_older_ones(tmp_path):
+    cache = _cache(tmp_path, 'lfu')
+    _write(cache, 0, video_id='old')
+    _write(cache, 1, video_id='old')
+    _write(cache, 0)
+    # The chunks of a track still being written count as used once, like the oldest chunks
+    _write(cache, 1)
+    assert cache.cached_chunks('v', '251') == {0, 1}
+    assert cache.cached_chunks('old', '251') == {1}
+
+
+def test_register_drops_chunks_of_another_format(tmp_path):
+    cache = _cache(tmp_path, 'lru')
+    cache.register('v', '251', 25, 'audio/webm')
+    _write(cache, 0)
+    cache.register('v', '140', 30, 'audio/mp4')
+    assert cache.lookup('v') == {'format_id': '140', 'total': 30, 'content_type': 'audio/mp4'}
+    assert cache.cached_chunks('v', '251') == set()
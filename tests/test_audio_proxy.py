@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import audio_proxy
+from app.services.audio_cache import AudioChunkCache
+from app.services.audio_proxy import FormatGone, ProxyError, _resolve, _satisfy_range, parse_range
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-', (0, None, None)),
+    ('bytes=100-199', (100, 199, None)),
+    ('bytes=-500', (None, None, 500)),
+    (' bytes=5-5 ', (5, 5, None)),
+])
+def test_parse_single_ranges(header, expected):
+    assert parse_range(header) == expected
+
+
+@pytest.mark.parametrize('header', [None, '', 'bytes=-', 'bytes=9-3', 'items=0-1', 'bytes=0-1,5-6'])
+def test_unsupported_ranges_are_ignored(header):
+    assert parse_range(header) is None
+
+
+def test_no_range_is_the_whole_file():
+    assert _satisfy_range(None, 1000) == (0, 999)
+
+
+def test_open_and_oversized_ranges_end_at_the_last_byte():
+    assert _satisfy_range((100, None, None), 1000) == (100, 999)
+    assert _satisfy_range((100, 5000, None), 1000) == (100, 999)
+
+
+def test_suffix_range_is_the_end_of_the_file():
+    assert _satisfy_range((None, None, 300), 1000) == (700, 999)
+    assert _satisfy_range((None, None, 5000), 1000) == (0, 999)
+
+
+def test_range_past_the_end_is_not_satisfiable():
+    with pytest.raises(ProxyError) as raised:
+        _satisfy_range((1000, None, None), 1000)
+    assert raised.value.status == 416
+    assert raised.value.headers == {'Content-Range': 'bytes */1000'}
+
+
+def test_resume_stays_on_the_original_format(upstream):
+    payload = _resolve('pinnedForm1', format_id='140')
+    assert payload['format_id'] == '140'
+    assert payload['stream_url'].endswith('itag=140')
+    assert _resolve('pinnedForm1')['format_id'] == '251'
+
+
+def test_resume_fails_once_the_format_is_gone(upstream):
+    with pytest.raises(FormatGone):
+        _resolve('pinnedForm2', format_id='171')
+
+
+class _FakeGooglevideo:
+    """Serves byte ranges of one audio file and records the ranges requested."""
+
+    def __init__(self, data):
+        self.data = data
+        self.requests = []
+
+    def open(self, video_id, payload, start, end):
+        self.requests.append((start, end))
+        end = len(self.data) - 1 if end is None else min(end, len(self.data) - 1)
+        body = self.data[start:end + 1]
+        headers = {'Content-Type': 'audio/webm', 'Content-Range': f"bytes {start}-{end}/{len(self.data)}"}
+        return SimpleNamespace(status_code=206, headers=headers, close=lambda: None,
+                               iter_content=lambda size: (body[i:i + size] for i in range(0, len(body), size)))
+
+
+@pytest.fixture
+def googlevideo(tmp_path, monkeypatch):
+    upstream = _FakeGooglevideo(bytes(range(256)) * 4)
+    monkeypatch.setattr(audio_proxy, '_audio_cache', AudioChunkCache(str(tmp_path), max_bytes=4096, chunk_size=100))
+    monkeypatch.setattr(audio_proxy, '_resolve', lambda video_id, format_id=None: {"format_id": '251'})
+    monkeypatch.setattr(audio_proxy, '_open_upstream', upstream.open)
+    return upstream
+
+
+def test_suffix_range_is_served_as_an_absolute_range(googlevideo):
+    stream = audio_proxy.open_stream('suffixTest1', 'bytes=-150')
+    assert stream.headers['Content-Range'] == 'bytes 874-1023/1024'
+    assert b''.join(stream) == googlevideo.data[-150:]
+    # A one-byte probe for the size, then the chunks holding the tail
+    assert googlevideo.requests == [(0, 0), (800, 1023)]
+
+    googlevideo.requests.clear()
+    assert b''.join(audio_proxy.open_stream('suffixTest1', 'bytes=-150')) == googlevideo.data[-150:]
+    assert googlevideo.requests == []
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import cache
+from app.services.cache import MemoryCache
+from tests.conftest import FakeClock
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, 'time', SimpleNamespace(time=clock))
+    return clock
+
+
+def test_entry_expires_after_ttl(clock):
+    store = MemoryCache()
+    store.set('a', 1, ttl=10)
+    clock.advance(9.9)
+    assert store.get('a') == 1
+    clock.advance(0.2)
+    assert store.get('a') is None
+    assert store.stats()['expirations'] == 1
+    assert len(store) == 0
+
+
+def test_entry_reports_lifetime(clock):
+    store = MemoryCache()
+    store.set('a', 'value', ttl=60)
+    assert store.get_entry('a') == ('value', 1000.0, 1060.0)
+
+
+def test_non_positive_ttl_is_not_stored(clock):
+    store = MemoryCache()
+    store.set('a', 1, ttl=0)
+    store.set('b', 1, ttl=-5)
+    assert len(store) == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    store = MemoryCache(max_entries=2)
+    store.set('a', 1, ttl=60)
+    store.set('b', 2, ttl=60)
+    assert store.get('a') == 1
+    store.set('c', 3, ttl=60)
+    assert store.get('b') is None
+    assert store.get('a') == 1
+    assert store.get('c') == 3
+    assert store.stats()['evictions'] == 1
+
+
+def test_expired_entries_go_before_live_ones(clock):
+    store = MemoryCache(max_entries=2)
+    store.set('a', 1, ttl=60)
+    store.set('short', 2, ttl=1)
+    clock.advance(5)
+    store.set('c', 3, ttl=60)
+    assert store.get('a') == 1
+    assert store.get('c') == 3
+    stats = store.stats()
+    assert stats['evictions'] == 0
+    assert stats['expirations'] == 1
+
+
+def test_hit_and_miss_counters(clock):
+    store = MemoryCache()
+    store.set('a', 1, ttl=60)
+    store.get('a')
+    store.get('missing')
+    stats = store.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
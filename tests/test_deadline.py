@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+from yt_dlp.utils import DownloadError, ExtractorError
+
+from app.services import deadline
+
+
+def test_parse_budget_caps_and_defaults():
+    assert deadline.parse_budget('5') == 5.0
+    assert deadline.parse_budget('1e9') == deadline.MAX_REQUEST_DEADLINE
+    for value in (None, '', 'soon', '0', '-3'):
+        assert deadline.parse_budget(value) == deadline.REQUEST_DEADLINE
+
+
+def test_remaining_is_none_without_a_deadline():
+    assert deadline.current() is None
+    assert deadline.remaining() is None
+    assert deadline.timeout(8) == 8
+    assert deadline.retries(3) == 3
+
+
+def test_nested_deadline_keeps_the_earlier_one():
+    with deadline.deadline(2):
+        outer = deadline.current()
+        with deadline.deadline(60):
+            assert deadline.current() == outer
+        with deadline.deadline(1):
+            assert deadline.current() < outer
+        assert 1.5 < deadline.remaining() <= 2
+    assert deadline.current() is None
+
+
+def test_timeouts_and_retries_shrink_with_the_time_left():
+    with deadline.deadline(3):
+        assert 2.5 < deadline.timeout(8) <= 3
+        assert deadline.timeout(1) == 1
+        assert deadline.retries(3) == 0
+    with deadline.deadline(16):
+        assert deadline.retries(3) == 2
+
+
+def test_deadline_errors_are_recognized_inside_yt_dlp_errors():
+    exceeded = deadline.DeadlineExceeded('Deadline exceeded before extraction')
+    extractor_error = ExtractorError('Unable to download webpage', cause=exceeded)
+    assert deadline.is_deadline_error(exceeded)
+    assert deadline.is_deadline_error(extractor_error)
+    assert deadline.is_deadline_error(DownloadError('ERROR: failed', (ExtractorError, extractor_error, None)))
+    assert not deadline.is_deadline_error(ExtractorError('Video unavailable'))
+    assert not deadline.is_deadline_error(ValueError('bad'))
+
+
+def test_check_raises_once_too_little_time_is_left():
+    with deadline.deadline(5):
+        deadline.check('search')
+    with deadline.deadline(0.1):
+        with pytest.raises(deadline.DeadlineExceeded, match='before search'):
+            deadline.check('search')
+
+
+def test_cancelled_work_is_abandoned():
+    event = threading.Event()
+    deadline.cancellable(event, deadline.check, 'search')
+    event.set()
+    with pytest.raises(deadline.Cancelled):
+        deadline.cancellable(event, deadline.check, 'search')
+
+
+def test_call_before_applies_the_deadline_in_another_thread():
+    seen = []
+    at = time.monotonic() + 5
+    thread = threading.Thread(target=deadline.call_before, args=(at, lambda: seen.append(deadline.current())))
+    thread.start()
+    thread.join()
+    assert seen == [pytest.approx(at, abs=0.01)]
+
+
+class _FakeYDL:
+    def __init__(self):
+        self.requests = []
+
+    def urlopen(self, req):
+        self.requests.append(req)
+        return 'response'
+
+
+def test_instrument_bounds_extractor_requests_by_the_deadline():
+    ydl = _FakeYDL()
+    deadline.instrument(ydl)
+
+    assert ydl.urlopen('https://www.youtube.com/watch?v=x') == 'response'
+    assert ydl.requests[-1] == 'https://www.youtube.com/watch?v=x'
+
+    with deadline.deadline(3):
+        ydl.urlopen('https://www.youtube.com/watch?v=x')
+    assert 2.5 < ydl.requests[-1].extensions['timeout'] <= 3
+
+    with deadline.deadline(0.1):
+        with pytest.raises(deadline.DeadlineExceeded):
+            ydl.urlopen('https://www.youtube.com/watch?v=x')
+    assert len(ydl.requests) == 2
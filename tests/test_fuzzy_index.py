@@ -0,0 +1,63 @@
+import random
+
+from app.services.fuzzy_index import TrigramIndex, similarity, trigrams
+
+
+def test_trigrams_pad_each_word():
+    assert trigrams('ab') == {'  a', ' ab', 'ab '}
+    assert trigrams('') == frozenset()
+
+
+def test_similarity_bounds():
+    grams = trigrams('tum hi ho')
+    assert similarity(grams, grams) == 1.0
+    assert similarity(grams, trigrams('zzz')) == 0.0
+    assert similarity(grams, frozenset()) == 0.0
+
+
+def test_search_finds_misspelled_entries():
+    index = TrigramIndex()
+    index.add(1, 'tum hi ho arijit singh', 'tum hi ho')
+    index.add(2, 'kesariya arijit singh', 'kesariya')
+    index.add(3, 'blinding lights the weeknd', 'blinding lights')
+    matches = index.search('tum hi ho arijit sing', threshold=0.8)
+    assert [(key, value) for _, key, value in matches] == [(1, 'tum hi ho')]
+    assert index.search('bohemian rhapsody queen', threshold=0.5) == []
+
+
+def test_search_orders_and_limits_matches():
+    index = TrigramIndex()
+    for key, text in enumerate(['shape of you', 'shape of you ed', 'shape of you ed sheeran']):
+        index.add(key, text, text)
+    matches = index.search('shape of you ed sheeran', threshold=0.3, limit=2)
+    assert [key for _, key, _ in matches] == [2, 1]
+    assert matches[0][0] == 1.0
+
+
+def test_add_replaces_and_discard_removes():
+    index = TrigramIndex()
+    index.add('k', 'first song', 1)
+    index.add('k', 'second song', 2)
+    assert len(index) == 1
+    assert index.search('first song', threshold=0.9) == []
+    assert index.search('second song', threshold=0.9)[0][2] == 2
+    index.discard('k')
+    index.discard('k')
+    assert len(index) == 0
+    assert index.search('second song', threshold=0.1) == []
+
+
+def test_search_agrees_with_a_full_scan():
+    rng = random.Random(7)
+    words = ['love', 'night', 'dance', 'heart', 'fire', 'rain', 'tum', 'dil', 'yeh', 'baby', 'moon', 'gold']
+    texts = {key: ' '.join(rng.sample(words, rng.randint(2, 5))) for key in range(400)}
+    index = TrigramIndex()
+    for key, text in texts.items():
+        index.add(key, text, None)
+    for _ in range(50):
+        query = ' '.join(rng.sample(words, rng.randint(2, 5)))
+        for threshold in (0.5, 0.8):
+            expected = {key for key, text in texts.items()
+                        if similarity(trigrams(query), trigrams(text)) >= threshold}
+            found = {key for _, key, _ in index.search(query, threshold, limit=len(texts))}
+            assert found == expected
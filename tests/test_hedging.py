@@ -0,0 +1,59 @@
+import time
+
+from app.services.hedging import Hedger
+
+
+def _slow():
+    time.sleep(0.3)
+    return 'primary'
+
+
+def _fast():
+    return 'hedge'
+
+
+def test_slow_primary_is_hedged():
+    hedger = Hedger(workers=4, delay=0.02, budget=0.1, burst=1)
+    assert hedger.run(_slow, _fast) == 'hedge'
+    stats = hedger.stats()
+    assert (stats['hedged'], stats['hedge_won']) == (1, 1)
+
+
+def test_hedges_are_limited_by_the_budget():
+    hedger = Hedger(workers=4, delay=0.02, budget=0.5, burst=1)
+    # The burst pays for the first hedge, then every second call earns another
+    results = [hedger.run(_slow, _fast) for _ in range(3)]
+    assert results == ['hedge', 'primary', 'hedge']
+    stats = hedger.stats()
+    assert (stats['calls'], stats['hedged'], stats['denied']) == (3, 2, 1)
+
+
+def test_fast_primary_is_not_hedged():
+    hedger = Hedger(workers=4, delay=1.0)
+    assert hedger.run(lambda: 'primary', _fast) == 'primary'
+    assert hedger.stats()['hedged'] == 0
+
+
+def test_unusable_primary_result_loses_to_the_hedge():
+    hedger = Hedger(workers=4, delay=0.02)
+    result = hedger.run(lambda: time.sleep(0.1) or {'error': 'blocked'}, lambda: {'ok': True},
+                        usable=lambda result: 'error' not in result)
+    assert result == {'ok': True}
+
+
+def test_delay_follows_recent_primary_durations():
+    hedger = Hedger(workers=2, percentile=0.5, default_delay=4.0, min_samples=3)
+    assert hedger.delay() == 4.0
+    for seconds in (0.01, 0.02, 0.03):
+        hedger.run(lambda: time.sleep(seconds), _fast)
+    assert 0.02 <= hedger.delay() < 0.5
+
+
+def test_primary_that_lost_to_the_hedge_is_sampled_once():
+    hedger = Hedger(workers=4, delay=0.02, budget=1, burst=1)
+    assert hedger.run(_slow, _fast) == 'hedge'
+    # Sampled when the hedge won, not again when the primary finishes
+    assert len(hedger._durations) == 1
+    assert hedger._durations[0] < 0.3
+    time.sleep(0.4)
+    assert len(hedger._durations) == 1
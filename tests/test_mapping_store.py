@@ -0,0 +1,96 @@
+import io
+
+import pytest
+
+from app import create_app
+from app.services import youtube_service
+from app.services.mapping_store import MappingStore
+from app.services.youtube_service import YouTubeService
+from tests.conftest import search_result
+
+
+def _match(video_id, duration='3:20'):
+    return {"video_id": video_id, "title": f"Video {video_id}", "thumbnail": f"https://i.ytimg.com/vi/{video_id}",
+            "duration": duration}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MappingStore(str(tmp_path / 'mappings.sqlite3'))
+
+
+def test_lookup_matches_normalized_variants(store):
+    store.record('Halo', 'Beyoncé', 200, _match('haloVideo01'), 14)
+    found = store.lookup('HALO (feat. Nobody)', 'beyonce', '3:25')
+    assert found == {"video_id": 'haloVideo01', "title": 'Video haloVideo01',
+                     "url": 'https://www.youtube.com/watch?v=haloVideo01',
+                     "thumbnail": 'https://i.ytimg.com/vi/haloVideo01', "duration": '3:20'}
+
+
+def test_lookup_rejects_a_different_duration(store):
+    store.record('Halo', 'Beyoncé', 200, _match('haloVideo01'), 14)
+    assert store.lookup('Halo', 'Beyoncé', 400) is None
+    assert store.lookup('Other Song', 'Beyoncé') is None
+
+
+def test_similar_songs_reuse_a_mapping(store):
+    store.record('Tum Hi Ho', 'Arijit', 262, _match('tumHiHo0001', '4:22'), 12)
+    assert store.lookup('tum hi ho', 'arijit singh', 262)['video_id'] == 'tumHiHo0001'
+    assert store.lookup('tum hi ho', 'arijit singh', 400) is None
+    assert store.lookup('Tum Hi Ho 2', 'Arijit', 262) is None
+
+
+def test_recording_a_song_again_replaces_its_mapping(store):
+    store.record('Halo', 'Beyoncé', 200, _match('haloVideo01'), 11)
+    store.record('halo', 'BEYONCE', 200, _match('haloVideo02'), 15)
+    assert len(store) == 1
+    assert store.lookup('Halo', 'Beyoncé', 200)['video_id'] == 'haloVideo02'
+    assert [mapping['score'] for mapping in store.iter_mappings()] == [15]
+
+
+@pytest.mark.parametrize('filename', ['mappings.jsonl', 'mappings.csv'])
+def test_cli_export_and_import_round_trip(tmp_path, store, filename):
+    store.record('Halo', 'Beyoncé', 200, _match('haloVideo01'), 14)
+    store.record('Tum Hi Ho', 'Arijit Singh', None, _match('tumHiHo0001', '4:22'), 12)
+    path, copy_db = str(tmp_path / filename), str(tmp_path / 'copy.sqlite3')
+    runner = create_app({'TESTING': True}).test_cli_runner()
+
+    result = runner.invoke(args=['mappings', 'export', path, '--db', store.path])
+    assert result.exit_code == 0 and 'Exported 2 mappings' in result.output
+    result = runner.invoke(args=['mappings', 'import', path, '--db', copy_db])
+    assert result.exit_code == 0 and 'Imported 2 mappings' in result.output
+
+    copy = MappingStore(copy_db)
+    fields = ('title', 'artist', 'duration', 'video_id', 'video_title', 'thumbnail', 'video_duration', 'score')
+    assert [{field: mapping[field] for field in fields} for mapping in copy.iter_mappings()] == \
+        [{field: mapping[field] for field in fields} for mapping in store.iter_mappings()]
+    assert copy.lookup('Tum Hi Ho', 'Arijit Singh')['video_id'] == 'tumHiHo0001'
+
+
+def test_import_skips_records_without_required_fields(store):
+    records = io.StringIO('{"title": "Halo", "artist": "Beyonce", "video_id": "haloVideo01"}\n'
+                          '{"title": "No Video", "artist": "Nobody"}\n')
+    assert store.import_mappings(records) == (1, 1)
+
+
+def test_confident_search_matches_are_recorded_and_reused(monkeypatch, store, upstream):
+    monkeypatch.setattr(youtube_service, '_mapping_store', store)
+    upstream.searches['Mapped Song Mapped Artist official audio'] = [
+        search_result('mappedSong1', 'Mapped Artist - Mapped Song (Official Audio)', 'Mapped Artist')]
+    assert YouTubeService.search_song('Mapped Song', 'Mapped Artist')['video_id'] == 'mappedSong1'
+    assert store.lookup('Mapped Song', 'Mapped Artist')['video_id'] == 'mappedSong1'
+
+    youtube_service._search_cache.clear()
+    assert YouTubeService.search_song('Mapped Song', 'Mapped Artist')['video_id'] == 'mappedSong1'
+    assert len(upstream.queries) == 1
+
+
+def test_import_skips_malformed_records_in_one_transaction(store):
+    records = io.StringIO('{"title": "Halo", "artist": "Beyonce", "video_id": "haloVideo01"}\n'
+                          '[1, 2]\n'
+                          'not json\n'
+                          '{"title": "Bad Score", "artist": "Nobody", "video_id": "badScore001", "score": "high"}\n'
+                          '{"title": 5, "artist": "Nobody", "video_id": "badTitle001"}\n'
+                          '{"title": "Song", "artist": "Artist", "video_id": "goodScore01", "score": "55"}\n')
+    assert store.import_mappings(records) == (2, 4)
+    assert store.lookup('Song', 'Artist')['video_id'] == 'goodScore01'
@@ -0,0 +1,71 @@
+from app.services.matching import DEFAULT_WEIGHTS, MatchQuery, MatchScorer, parse_weights
+
+
+def _video(video_id, title, channel='', duration='3:20', description=''):
+    return {
+        'id': video_id,
+        'title': title,
+        'channel': {'name': channel},
+        'duration': duration,
+        'descriptionSnippet': [{'text': description}],
+    }
+
+
+def test_official_upload_ranks_above_covers_and_live_versions():
+    scorer = MatchScorer()
+    videos = [
+        _video('live', 'Arijit Singh - Tum Hi Ho (Live in Concert)', duration='6:10'),
+        _video('cover', 'Tum Hi Ho cover by a fan', duration='3:15'),
+        _video('official', 'Tum Hi Ho - Full Audio | Arijit Singh', channel='Arijit Singh - Topic'),
+    ]
+    ranked = scorer.rank(MatchQuery('Tum Hi Ho', 'Arijit Singh', 200), videos)
+    assert [video['id'] for _, video in ranked] == ['official', 'cover', 'live']
+
+
+def test_requested_live_version_is_not_penalized():
+    scorer = MatchScorer()
+    video = _video('live', 'Tum Hi Ho (Live) Arijit Singh')
+    assert scorer.score(MatchQuery('Tum Hi Ho (Live)', 'Arijit Singh'), video) > \
+        scorer.score(MatchQuery('Tum Hi Ho', 'Arijit Singh'), video)
+
+
+def test_misspelled_words_still_count():
+    scorer = MatchScorer()
+    query = MatchQuery('Kesariya', 'Arijit Singh')
+    exact = scorer.score(query, _video('a', 'Kesariya Arijit Singh'))
+    misspelled = scorer.score(query, _video('b', 'Kesariyaa Arijit Sing'))
+    unrelated = scorer.score(query, _video('c', 'Something Else Entirely'))
+    assert exact == misspelled
+    assert misspelled > unrelated
+
+
+def test_numbers_must_match_exactly():
+    scorer = MatchScorer()
+    query = MatchQuery('Song 2', 'Blur')
+    assert scorer.score(query, _video('a', 'Song 2 Blur')) > scorer.score(query, _video('b', 'Song 3 Blur'))
+
+
+def test_duration_closeness_is_scored():
+    scorer = MatchScorer()
+    query = MatchQuery('Tum Hi Ho', 'Arijit Singh', '4:22')
+    close = scorer.score(query, _video('a', 'Tum Hi Ho Arijit Singh', duration='4:20'))
+    near = scorer.score(query, _video('b', 'Tum Hi Ho Arijit Singh', duration='4:00'))
+    far = scorer.score(query, _video('c', 'Tum Hi Ho Arijit Singh', duration='10:00'))
+    assert close - near == DEFAULT_WEIGHTS['duration_close'] - DEFAULT_WEIGHTS['duration_near']
+    assert near - far == DEFAULT_WEIGHTS['duration_near'] - DEFAULT_WEIGHTS['duration_far']
+
+
+def test_rank_many_accepts_plain_tuples():
+    scorer = MatchScorer()
+    videos = [_video('a', 'Blinding Lights The Weeknd'), _video('b', 'Levitating Dua Lipa')]
+    ranked = scorer.rank_many([(('Levitating', 'Dua Lipa', None), videos),
+                               (('Blinding Lights', 'The Weeknd', None), videos)])
+    assert [pairs[0][1]['id'] for pairs in ranked] == ['b', 'a']
+
+
+def test_parse_weights_ignores_unknown_and_invalid_pairs():
+    weights = parse_weights('live=-8, channel=6,unknown=1,cover=abc,')
+    assert weights['live'] == -8.0
+    assert weights['channel'] == 6.0
+    assert weights['cover'] == DEFAULT_WEIGHTS['cover']
+    assert 'unknown' not in weights
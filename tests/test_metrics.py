@@ -0,0 +1,102 @@
+import json
+import os
+import time
+
+import pytest
+
+from app.services import metrics
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    # Start from empty metrics published to a directory of our own
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    monkeypatch.setattr(metrics, '_counters', {})
+    monkeypatch.setattr(metrics, '_gauges', {})
+    monkeypatch.setattr(metrics, '_histograms', {})
+    monkeypatch.setattr(metrics, '_collectors', [])
+    monkeypatch.setattr(metrics, '_published', False)
+    return tmp_path
+
+
+def _publish(directory, pid, age=0, counters=(), gauges=()):
+    data = {"pid": pid, "time": time.time() - age, "histograms": [],
+            "counters": [list(counter) for counter in counters],
+            "gauges": [list(gauge) for gauge in gauges]}
+    with open(os.path.join(directory, f"{pid}.json"), 'w') as f:
+        json.dump(data, f)
+
+
+def _samples(text, name):
+    return {line.split(' ')[0]: float(line.split(' ')[1]) for line in text.splitlines()
+            if line.startswith(name) and not line.startswith('#')}
+
+
+def test_histogram_buckets_are_cumulative(metrics_dir):
+    metrics.observe('search_query', 0.003)
+    metrics.observe('search_query', 0.2)
+    metrics.observe('search_query', 60)
+    samples = _samples(metrics.render(), 'ytune_stage_duration_seconds')
+    prefix = 'ytune_stage_duration_seconds'
+    assert samples[f'{prefix}_bucket{{stage="search_query",le="0.001"}}'] == 0
+    assert samples[f'{prefix}_bucket{{stage="search_query",le="0.005"}}'] == 1
+    assert samples[f'{prefix}_bucket{{stage="search_query",le="0.25"}}'] == 2
+    assert samples[f'{prefix}_bucket{{stage="search_query",le="30.0"}}'] == 2
+    assert samples[f'{prefix}_bucket{{stage="search_query",le="+Inf"}}'] == 3
+    assert samples[f'{prefix}_count{{stage="search_query"}}'] == 3
+    assert samples[f'{prefix}_sum{{stage="search_query"}}'] == pytest.approx(60.203)
+
+
+def test_counters_and_gauges_of_all_workers_are_added_up(metrics_dir):
+    metrics.count('ytune_cache_evictions_total', cache='stream')
+    metrics.request_started()
+    _publish(metrics_dir, 999991, counters=[('ytune_cache_evictions_total', {'cache': 'stream'}, 4)],
+             gauges=[('ytune_requests_in_flight', {}, 2, False),
+                     ('ytune_cache_entries', {'cache': 'audio'}, 35, True)])
+    _publish(metrics_dir, 999992, gauges=[('ytune_cache_entries', {'cache': 'audio'}, 15, True)])
+    text = metrics.render()
+    metrics.request_finished()
+
+    assert _samples(text, 'ytune_cache_evictions_total') == {'ytune_cache_evictions_total{cache="stream"}': 5}
+    assert _samples(text, 'ytune_requests_in_flight') == {'ytune_requests_in_flight': 3}
+    # Shared gauges report the largest value instead of a sum
+    assert _samples(text, 'ytune_cache_entries{cache="audio"}') == {'ytune_cache_entries{cache="audio"}': 35}
+
+
+def test_exited_workers_keep_their_counters_but_not_their_gauges(metrics_dir):
+    _publish(metrics_dir, 999993, age=3600, counters=[('ytune_cache_evictions_total', {'cache': 'stream'}, 7)],
+             gauges=[('ytune_requests_in_flight', {}, 2, False)])
+    text = metrics.render()
+    assert _samples(text, 'ytune_cache_evictions_total') == {'ytune_cache_evictions_total{cache="stream"}': 7}
+    assert 'ytune_requests_in_flight 2' not in text
+
+
+def test_label_values_are_escaped(metrics_dir):
+    metrics.count('ytune_upstream_errors_total', operation='search', error='Bad "quote"\\\n')
+    assert 'error="Bad \\"quote\\"\\\\\\n"' in metrics.render()
+
+
+def test_collectors_report_current_values(metrics_dir):
+    metrics.register_collector(lambda: [('ytune_cache_entries', {'cache': 'search'}, 12)])
+    assert _samples(metrics.render(), 'ytune_cache_entries') == {'ytune_cache_entries{cache="search"}': 12}
+
+
+def test_exited_workers_are_folded_into_the_retired_totals(metrics_dir):
+    _publish(metrics_dir, 999994, age=3600, counters=[('ytune_cache_evictions_total', {'cache': 'stream'}, 7)])
+    metrics.render()
+    assert not os.path.exists(metrics_dir / '999994.json')
+    assert os.path.exists(metrics_dir / 'retired.json')
+
+    _publish(metrics_dir, 999995, age=3600, counters=[('ytune_cache_evictions_total', {'cache': 'stream'}, 3)])
+    text = metrics.render()
+    assert _samples(text, 'ytune_cache_evictions_total') == {'ytune_cache_evictions_total{cache="stream"}': 10}
+    # Rendering again does not count them twice
+    assert _samples(metrics.render(), 'ytune_cache_evictions_total') == \
+        {'ytune_cache_evictions_total{cache="stream"}': 10}
+
+
+def test_reused_pid_does_not_make_counters_go_backwards(metrics_dir):
+    _publish(metrics_dir, os.getpid(), counters=[('ytune_cache_evictions_total', {'cache': 'stream'}, 7)])
+    metrics.count('ytune_cache_evictions_total', cache='stream')
+    assert _samples(metrics.render(), 'ytune_cache_evictions_total') == \
+        {'ytune_cache_evictions_total{cache="stream"}': 8}
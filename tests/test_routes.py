@@ -0,0 +1,56 @@
+import pytest
+
+from app import create_app
+from app.routes.youtube_routes import parse_format_hints
+from app.services import prefetch
+
+
+@pytest.fixture
+def client():
+    return create_app({'TESTING': True}).test_client()
+
+
+def test_format_hints_from_body_and_save_data_header():
+    hints, error = parse_format_hints({"codecs": "Opus, AAC", "max_bitrate": 96})
+    assert error is None
+    assert hints == {"codecs": ["opus", "aac"], "max_bitrate": 96, "data_saver": False}
+    assert parse_format_hints({}, save_data='on')[0]["data_saver"] is True
+    assert parse_format_hints({"data_saver": True})[0]["data_saver"] is True
+
+
+@pytest.mark.parametrize('data', [{"max_bitrate": 0}, {"max_bitrate": True}, {"max_bitrate": "96"},
+                                  {"codecs": [1, 2]}, {"codecs": {"opus": 1}}])
+def test_invalid_format_hints_are_rejected(data):
+    hints, error = parse_format_hints(data)
+    assert hints is None and error
+
+
+def test_get_stream_url_applies_save_data(client, upstream):
+    response = client.post('/api/get-stream-url', json={"video_id": 'saveData001'}, headers={'Save-Data': 'on'})
+    assert response.status_code == 200
+    assert response.get_json()['format_id'] == '249'
+
+
+def test_get_stream_url_rejects_invalid_hints(client):
+    response = client.post('/api/get-stream-url', json={"video_id": 'saveData001', "max_bitrate": -1})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('data', [{"youtube_url": 123}, {"video_id": ['dQw4w9WgXcQ']}])
+def test_non_string_video_references_are_rejected(client, data):
+    response = client.post('/api/get-stream-url', json=data)
+    assert response.status_code == 400
+    assert response.get_json()["error"].endswith('must be a string')
+
+
+def test_batch_rejects_non_string_video_references(client):
+    response = client.post('/api/get-stream-urls', json={"items": ['dQw4w9WgXcQ', {"video_id": 123}]})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "items[1]: video_id must be a string"}
+
+
+def test_prefetch_counts_non_string_video_references_as_invalid(client, monkeypatch):
+    monkeypatch.setattr(prefetch, 'prefetch', lambda client_id, items, audio: {"queued": len(items), "invalid": 0})
+    response = client.post('/api/prefetch', json={"items": [{"youtube_url": 5}, 'dQw4w9WgXcQ']})
+    assert response.status_code == 202
+    assert response.get_json() == {"queued": 1, "invalid": 1}
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from app.services.scheduler import ExtractionScheduler, _Ticket, extraction_priority
+
+
+def _ticket(priority, waited):
+    ticket = _Ticket(priority, None, 0)
+    ticket.enqueued -= waited
+    return ticket
+
+
+def test_waiting_work_moves_up_one_class_per_aging_period():
+    scheduler = ExtractionScheduler(aging=10)
+    fresh, aged = _ticket('background', 0), _ticket('background', 11)
+    now = time.monotonic()
+    assert scheduler._effective_rank(fresh, now) == 2
+    assert scheduler._effective_rank(aged, now) == 1
+
+
+def test_aging_stops_at_batch():
+    scheduler = ExtractionScheduler(aging=10)
+    now = time.monotonic()
+    assert scheduler._effective_rank(_ticket('background', 1000), now) == 1
+    assert scheduler._effective_rank(_ticket('batch', 1000), now) == 1
+    assert scheduler._effective_rank(_ticket('interactive', 1000), now) == 0
+
+
+def test_aging_can_be_disabled():
+    scheduler = ExtractionScheduler(aging=0)
+    assert scheduler._effective_rank(_ticket('background', 1000), time.monotonic()) == 2
+
+
+def test_class_limit_reserves_slots_for_interactive_work():
+    scheduler = ExtractionScheduler(slots=2, limits={'background': 1})
+    with scheduler.slot(priority='background'):
+        with pytest.raises(TimeoutError):
+            with scheduler.slot(priority='background', timeout=0.05):
+                pass
+        with scheduler.slot(priority='interactive', timeout=0.05):
+            stats = scheduler.stats()
+    assert stats['running'] == 2
+    assert stats['classes']['background']['timed_out'] == 1
+
+
+def test_total_slots_are_never_exceeded():
+    scheduler = ExtractionScheduler(slots=1)
+    with scheduler.slot(priority='interactive'):
+        with pytest.raises(TimeoutError):
+            with scheduler.slot(priority='interactive', timeout=0.05):
+                pass
+
+
+def test_interactive_work_is_admitted_before_earlier_background_work():
+    scheduler = ExtractionScheduler(slots=1, aging=60)
+    order = []
+    hold = threading.Event()
+
+    def run(priority):
+        with scheduler.slot(priority=priority, timeout=5):
+            order.append(priority)
+
+    def holder():
+        with scheduler.slot(priority='batch'):
+            hold.wait(5)
+
+    threads = [threading.Thread(target=holder)]
+    threads[0].start()
+    for priority in ('background', 'batch', 'interactive'):
+        thread = threading.Thread(target=run, args=(priority,))
+        thread.start()
+        threads.append(thread)
+        while scheduler.stats()['waiting'] < len(threads) - 1:
+            time.sleep(0.002)
+    hold.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ['interactive', 'batch', 'background']
+
+
+def test_slot_defaults_to_the_current_priority():
+    scheduler = ExtractionScheduler()
+    with extraction_priority('batch'):
+        with scheduler.slot():
+            assert scheduler.stats()['classes']['batch']['running'] == 1
+
+
+def test_promote_raises_waiting_work():
+    scheduler = ExtractionScheduler(slots=1)
+
+    def prefetch():
+        with scheduler.slot(key='v', priority='background', timeout=5):
+            pass
+
+    with scheduler.slot(priority='interactive'):
+        thread = threading.Thread(target=prefetch)
+        thread.start()
+        while scheduler.stats()['waiting'] < 1:
+            time.sleep(0.002)
+        assert scheduler.promote('v', 'interactive')
+        assert scheduler.stats()['classes']['interactive']['waiting'] == 1
+        assert not scheduler.promote('v', 'interactive')
+    thread.join(5)
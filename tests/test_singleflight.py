@@ -0,0 +1,128 @@
+import threading
+import time
+
+import pytest
+
+from app.services import deadline
+from app.services.singleflight import SingleFlight
+
+
+def _start(target, count):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def _wait_for_waiters(flight, key, count):
+    for _ in range(500):
+        with flight._lock:
+            call = flight._calls.get(key)
+            if call is not None and call.waiters >= count:
+                return
+        time.sleep(0.002)
+    raise AssertionError("Callers did not join the call in flight")
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls, results = [], []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return 'value'
+
+    leader = _start(lambda: results.append(flight.do('k', fn)), 1)
+    _wait_for_waiters(flight, 'k', 0)
+    followers = _start(lambda: results.append(flight.do('k', fn)), 4)
+    _wait_for_waiters(flight, 'k', 4)
+    release.set()
+    for thread in leader + followers:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ['value'] * 5
+    stats = flight.stats()
+    assert (stats['executions'], stats['coalesced'], stats['in_flight']) == (1, 4, 0)
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == 1
+    assert flight.do('b', lambda: 2) == 2
+    assert flight.stats()['executions'] == 2
+
+
+def test_followers_receive_the_shared_error():
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def fn():
+        release.wait(5)
+        raise ValueError('upstream failed')
+
+    def call():
+        try:
+            flight.do('k', fn)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = _start(call, 1)
+    _wait_for_waiters(flight, 'k', 0)
+    threads += _start(call, 2)
+    _wait_for_waiters(flight, 'k', 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 3
+    assert errors[0] is errors[1] is errors[2]
+
+
+def test_followers_retry_when_the_leader_ran_out_of_time():
+    flight = SingleFlight(retry=deadline.is_deadline_error)
+    release = threading.Event()
+    attempts = []
+    results, errors = [], []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) == 1:
+            release.wait(5)
+            raise deadline.DeadlineExceeded(deadline.DEADLINE_ERROR)
+        return 'value'
+
+    def leader():
+        try:
+            flight.do('k', fn)
+        except deadline.DeadlineExceeded as e:
+            errors.append(e)
+
+    threads = _start(leader, 1)
+    _wait_for_waiters(flight, 'k', 0)
+    threads += _start(lambda: results.append(flight.do('k', fn)), 1)
+    _wait_for_waiters(flight, 'k', 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 1
+    assert results == ['value']
+    assert len(attempts) == 2
+    assert flight.stats()['retried'] == 1
+
+
+def test_waiting_caller_times_out():
+    flight = SingleFlight(wait_timeout=lambda: 0.05)
+    release = threading.Event()
+    threads = _start(lambda: flight.do('k', release.wait, 5), 1)
+    _wait_for_waiters(flight, 'k', 0)
+    try:
+        with pytest.raises(TimeoutError):
+            flight.do('k', lambda: None)
+    finally:
+        release.set()
+        threads[0].join(5)
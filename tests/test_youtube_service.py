@@ -0,0 +1,139 @@
+from datetime import datetime
+
+from app.services import normalize, youtube_service
+from app.services.youtube_service import STREAM_URL_SAFETY_MARGIN, YouTubeService
+from tests.conftest import search_result
+
+
+def test_extract_video_id_from_urls():
+    for url in ('dQw4w9WgXcQ', 'https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=10',
+                'youtu.be/dQw4w9WgXcQ', 'https://music.youtube.com/watch?v=dQw4w9WgXcQ',
+                'https://www.youtube.com/shorts/dQw4w9WgXcQ', 'https://www.youtube.com/embed/dQw4w9WgXcQ'):
+        assert YouTubeService.extract_video_id(url) == 'dQw4w9WgXcQ'
+    assert YouTubeService.extract_video_id('https://example.com/watch?v=dQw4w9WgXcQ') is None
+    assert YouTubeService.extract_video_id('https://www.youtube.com/watch?v=short') is None
+
+
+def test_stream_url_expiry_comes_from_the_expire_parameter():
+    assert YouTubeService._stream_url_expiry('https://x.googlevideo.com/videoplayback?expire=1700000000&id=1') \
+        == 1700000000.0
+    assert YouTubeService._stream_url_expiry('https://x.googlevideo.com/videoplayback/expire/1700000000/id/1') \
+        == 1700000000.0
+
+
+def test_stream_url_without_expiry_gets_the_default_lifetime():
+    expiry = YouTubeService._stream_url_expiry('https://x.googlevideo.com/videoplayback?id=1')
+    assert abs(expiry - datetime.now().timestamp() - youtube_service.DEFAULT_STREAM_URL_LIFETIME) < 5
+
+
+def test_stream_url_is_cached_until_shortly_before_it_expires(upstream):
+    first = YouTubeService.get_stream_url(video_id='cacheTest01')
+    second = YouTubeService.get_stream_url(youtube_url='https://youtu.be/cacheTest01')
+    assert len(upstream.extractions) == 1
+    assert second['stream_url'] == first['stream_url']
+
+    expires = YouTubeService._stream_url_expiry(first['stream_url'])
+    assert first['expires_at'] == datetime.fromtimestamp(expires).isoformat()
+    _, _, cached_until = youtube_service._stream_cache.get_entry('cacheTest01')
+    assert abs(cached_until - (expires - STREAM_URL_SAFETY_MARGIN)) < 5
+
+
+def test_stream_url_expiring_within_the_safety_margin_is_not_cached(upstream):
+    upstream.expire_in = STREAM_URL_SAFETY_MARGIN - 60
+    YouTubeService.get_stream_url(video_id='cacheTest02')
+    YouTubeService.get_stream_url(video_id='cacheTest02')
+    assert len(upstream.extractions) == 2
+
+
+def test_search_key_normalizes_case_accents_and_featured_artists():
+    key = normalize.search_key('Halo', 'Beyoncé', '3:20')
+    assert normalize.search_key('HALO!', 'beyonce', 201) == key
+    assert normalize.search_key('Halo (feat. Someone)', 'Beyoncé', 205) == key
+    assert normalize.search_key('Halo', 'Beyoncé', 260) != key
+    assert normalize.search_key('Señorita', 'Shawn Mendes & Camila Cabello') == \
+        normalize.search_key('senorita', 'Shawn Mendes and Camila Cabello')
+
+
+def test_search_matches_are_cached_under_the_normalized_key(upstream):
+    upstream.searches['Cached Song Cached Artist official audio'] = [
+        search_result('cachedSong1', 'Cached Artist - Cached Song (Official Audio)', 'Cached Artist')]
+    first = YouTubeService.search_song('Cached Song', 'Cached Artist')
+    second = YouTubeService.search_song('cached song!', 'CACHED ARTIST')
+    assert first['video_id'] == second['video_id'] == 'cachedSong1'
+    assert len(upstream.queries) == 1
+
+
+def test_searches_without_results_are_cached_as_misses(upstream):
+    first = YouTubeService.search_song('Unknown Song', 'Nobody')
+    second = YouTubeService.search_song('Unknown Song', 'Nobody')
+    assert first == second == {"error": "No videos found for the given song"}
+    assert upstream.queries == ['Unknown Song Nobody official audio', 'Unknown Song Nobody']
+
+
+def test_parallel_search_merges_both_queries(monkeypatch, upstream):
+    monkeypatch.setattr(youtube_service, 'SEARCH_MODE', 'parallel')
+    upstream.searches['Twin Song Twin Artist official audio'] = [
+        search_result('twinSong001', 'Twin Artist - Twin Song (Official Audio)', 'Twin Artist')]
+    upstream.searches['Twin Song Twin Artist'] = [
+        search_result('twinSong002', 'Twin Song (Live)', 'Someone'),
+        search_result('twinSong001', 'Twin Artist - Twin Song (Official Audio)', 'Twin Artist')]
+    results = YouTubeService._search_concurrently('Twin Song Twin Artist official audio', 'Twin Song Twin Artist')
+    assert [video['id'] for video in results] == ['twinSong001', 'twinSong002']
+    assert YouTubeService.search_song('Twin Song', 'Twin Artist')['video_id'] == 'twinSong001'
+
+
+def _payload():
+    formats = [
+        {"format_id": format_id, "format": note, "codec": codec, "container": container, "abr": abr,
+         "filesize": None, "url": f"https://x.googlevideo.com/videoplayback?itag={format_id}"}
+        for format_id, note, codec, container, abr in (
+            ('251', 'medium', 'opus', 'webm', 135.6),
+            ('140', 'medium', 'mp4a.40.2', 'm4a', 129.5),
+            ('250', 'low', 'opus', 'webm', 68.9),
+            ('139', 'low', 'mp4a.40.5', 'm4a', 48.8),
+        )
+    ]
+    return {"stream_url": formats[0]["url"], "format": "medium", "bitrate": 135.6, "format_id": '251',
+            "formats": formats, "expires_at": '2030-01-01T00:00:00'}
+
+
+def test_select_format_defaults_to_the_best_format():
+    assert YouTubeService.select_format(_payload())['format_id'] == '251'
+    assert YouTubeService.select_format(_payload(), {})['format_id'] == '251'
+
+
+def test_select_format_stays_within_the_bitrate_limit():
+    selected = YouTubeService.select_format(_payload(), {"max_bitrate": 130})
+    assert (selected['format_id'], selected['bitrate']) == ('140', 129.5)
+    assert selected['stream_url'].endswith('itag=140')
+    # Nothing within the limit: the smallest format is the closest
+    assert YouTubeService.select_format(_payload(), {"max_bitrate": 10})['format_id'] == '139'
+
+
+def test_select_format_filters_codecs_by_name_or_alias():
+    assert YouTubeService.select_format(_payload(), {"codecs": ["aac"]})['format_id'] == '140'
+    selected = YouTubeService.select_format(_payload(), {"codecs": ["opus"], "max_bitrate": 100})
+    assert selected['format_id'] == '250'
+    assert [f['format_id'] for f in selected['formats']] == ['251', '250']
+    assert YouTubeService.select_format(_payload(), {"codecs": ["flac"]}) == \
+        {"error": "No audio format matches the accepted codecs"}
+
+
+def test_save_data_caps_the_bitrate():
+    assert YouTubeService.select_format(_payload(), {"data_saver": True})['format_id'] == '250'
+    selected = YouTubeService.select_format(_payload(), {"data_saver": True, "max_bitrate": 50})
+    assert selected['format_id'] == '139'
+
+
+def test_select_format_passes_errors_through():
+    assert YouTubeService.select_format({"error": "No audio format found"}, {"max_bitrate": 64}) == \
+        {"error": "No audio format found"}
+
+
+def test_failed_parallel_search_is_not_cached_as_a_miss(monkeypatch, upstream):
+    monkeypatch.setattr(youtube_service, 'SEARCH_MODE', 'parallel')
+    upstream.searches['Flaky Song Flaky Artist official audio'] = RuntimeError('HTTP Error 429')
+    assert 'error' in YouTubeService.search_song('Flaky Song', 'Flaky Artist')
+    assert YouTubeService.search_song('Flaky Song', 'Flaky Artist') != \
+        {"error": "No videos found for the given song"}
+    assert upstream.queries.count('Flaky Song Flaky Artist official audio') == 2